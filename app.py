@@ -47,6 +47,11 @@ if __name__ == "__main__":
     parser.add_argument(
         "--env-file", type=str, help="Path to .env file with configuration"
     )
+    parser.add_argument(
+        "--checkpoint-db",
+        type=str,
+        help="SQLite file to persist agent runs in, enabling resume (Agent UI only)",
+    )
 
     args = parser.parse_args()
 
@@ -56,7 +61,12 @@ if __name__ == "__main__":
     logger.info(f"Starting ImbizoPM UI on http://{args.host}:{args.port}")
     if args.agent:
         logger.info("Launching Agent-based Planner UI...")
-        demo = main_agent(share=args.share, server_name=args.host, server_port=args.port)
+        demo = main_agent(
+            share=args.share,
+            server_name=args.host,
+            server_port=args.port,
+            checkpoint_db=args.checkpoint_db,
+        )
     else:
         logger.info("Launching Base UI...")
         # Pass necessary arguments to the base UI launcher
@@ -5,6 +5,7 @@ Command-line interface for ImbizoPM.
 import argparse
 import json
 import sys
+import uuid
 from typing import Any, Dict, List
 
 from .config import config
@@ -84,11 +85,133 @@ def parse_args():
         help="Generate tasks without creating GitHub project",
     )
 
+    # Multi-agent planning command
+    plan_parser = subparsers.add_parser(
+        "plan", help="Plan a project with the multi-agent planning graph"
+    )
+    plan_parser.add_argument("--prompt", help="Project idea prompt")
+    plan_parser.add_argument(
+        "--model",
+        default="ollama:cogito:32b",
+        help="Chat model to use (e.g. ollama:cogito:32b, openai:gpt-4o)",
+    )
+    plan_parser.add_argument(
+        "--checkpoint-db",
+        help="SQLite file storing the run checkpoints, needed to resume a run",
+    )
+    plan_parser.add_argument(
+        "--thread-id", help="Identifier of the run (generated if not provided)"
+    )
+    plan_parser.add_argument(
+        "--resume",
+        metavar="THREAD_ID",
+        help="Resume a failed run from its last successful node",
+    )
+    plan_parser.add_argument(
+        "--recursion-limit",
+        type=int,
+        default=30,
+        help="Maximum number of agent steps for the run",
+    )
+    plan_parser.add_argument("--output", help="Save the final plan to a JSON file")
+    plan_parser.add_argument(
+        "--cache",
+        metavar="PATH",
+        help="SQLite file caching agent outputs, reused when an agent input repeats",
+    )
+    plan_parser.add_argument(
+        "--max-messages",
+        type=int,
+        help="Keep only the most recent messages in the run state",
+    )
+    plan_parser.add_argument(
+        "--final-messages-only",
+        action="store_true",
+        help="Keep only the final answer of each agent in the run state",
+    )
+    plan_parser.add_argument(
+        "--spill-dir",
+        help="Directory the messages beyond --max-messages are moved to instead of"
+        " being dropped (requires --max-messages)",
+    )
+    plan_parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="Time budget of the run; late agents are degraded to keep within it",
+    )
+    plan_parser.add_argument(
+        "--fallback-model",
+        help="Faster chat model of the agents of a run falling behind its deadline",
+    )
+    plan_parser.add_argument(
+        "--capabilities",
+        metavar="PATH",
+        help="JSON file caching the probed structured output modes of each model;"
+        " agents then use the cheapest mode of their model",
+    )
+    plan_parser.add_argument(
+        "--draft",
+        action="store_true",
+        help="Save a fast draft plan first, then overwrite it with the refined plan",
+    )
+
+    # Batch multi-agent planning command
+    batch_parser = subparsers.add_parser(
+        "plan-batch", help="Plan every project idea of a JSONL file"
+    )
+    batch_parser.add_argument("ideas", help="JSONL file with one project idea per line")
+    batch_parser.add_argument(
+        "--out", required=True, help="JSONL file receiving one final state per idea"
+    )
+    batch_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of ideas planned at the same time",
+    )
+    batch_parser.add_argument(
+        "--model",
+        default="ollama:cogito:32b",
+        help="Chat model to use (e.g. ollama:cogito:32b, openai:gpt-4o)",
+    )
+    batch_parser.add_argument(
+        "--recursion-limit",
+        type=int,
+        default=30,
+        help="Maximum number of agent steps per run",
+    )
+    batch_parser.add_argument(
+        "--cache",
+        metavar="PATH",
+        help="SQLite file caching agent outputs, reused when an agent input repeats",
+    )
+
+    # Agent worker processes
+    worker_parser = subparsers.add_parser(
+        "plan-worker", help="Run planning agents for a UI using a worker queue"
+    )
+    worker_parser.add_argument(
+        "--queue", required=True, help="SQLite worker queue shared with the UI"
+    )
+    worker_parser.add_argument(
+        "--processes", type=int, default=2, help="Number of worker processes"
+    )
+    worker_parser.add_argument(
+        "--model",
+        default="ollama:cogito:32b",
+        help="Chat model of the tasks that do not name one",
+    )
+
     # Token option for all commands
     parser.add_argument("--token", help="GitHub personal access token")
     parser.add_argument("--api-key", help="API key for LLM provider")
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    # Only messages beyond --max-messages are ever spilled
+    if args.command == "plan" and args.spill_dir and args.max_messages is None:
+        plan_parser.error("--spill-dir requires --max-messages")
+    return args
 
 
 def load_issues_from_file(file_path: str) -> List[Dict[str, Any]]:
@@ -101,6 +224,213 @@ def load_issues_from_file(file_path: str) -> List[Dict[str, Any]]:
         sys.exit(1)
 
 
+def run_agent_plan(args) -> Dict[str, Any]:
+    """Run (or resume) the multi-agent planning graph and return the final state."""
+    # Imported lazily: the agent graph pulls in the LangChain/LangGraph stack
+    from langchain.chat_models import init_chat_model
+
+    from imbizopm_agents import (
+        ResultCache,
+        create_project_planning_graph,
+        resume_project_planning_graph,
+        run_project_planning_graph,
+    )
+    from imbizopm_agents.capabilities import CapabilityProbe
+    from imbizopm_agents.deadline import DEGRADED_FIELD, DeadlinePolicy
+    from imbizopm_agents.draft import (
+        DRAFT_EVENT,
+        draft_graph_config,
+        run_draft_planning_graph,
+    )
+    from imbizopm_agents.events import UPDATES_EVENT, apply_delta
+    from imbizopm_agents.repair import json_repairer
+    from imbizopm_agents.retention import MessageRetention
+    from imbizopm_agents.serialization import state_to_dict
+
+    if args.resume and not args.checkpoint_db:
+        print("Resuming a run requires --checkpoint-db")
+        sys.exit(1)
+
+    model_kwargs = {"api_key": args.api_key} if args.api_key else {}
+    llm = init_chat_model(args.model, **model_kwargs)
+    cache = ResultCache(args.cache) if args.cache else None
+    message_retention = None
+    if args.max_messages is not None or args.final_messages_only:
+        message_retention = MessageRetention(
+            max_messages=args.max_messages,
+            final_only=args.final_messages_only,
+            spill_dir=args.spill_dir,
+        )
+    deadline_policy = None
+    if args.deadline is not None:
+        deadline_policy = DeadlinePolicy(fallback_model=args.fallback_model)
+    graph_kwargs = {
+        "use_structured_output": False,
+        "capability_probe": (
+            CapabilityProbe(args.capabilities) if args.capabilities else None
+        ),
+        "checkpoint_db": args.checkpoint_db,
+        "cache": cache,
+        "message_retention": message_retention,
+        "model_kwargs": model_kwargs,
+        "deadline_policy": deadline_policy,
+    }
+    graph = create_project_planning_graph(llm, **graph_kwargs)
+
+    if args.resume:
+        thread_id = args.resume
+        print(f"Resuming run: {thread_id}")
+        config = {"configurable": {"thread_id": thread_id}}
+        final_state = dict(graph.get_state(config).values)
+        events = resume_project_planning_graph(
+            graph,
+            thread_id,
+            recursion_limit=args.recursion_limit,
+            stream_updates=True,
+        )
+    else:
+        prompt = args.prompt or input("Enter your project idea: ")
+        thread_id = args.thread_id or f"run-{uuid.uuid4().hex}"
+        print(f"Started run: {thread_id}")
+        final_state = {"input": prompt}
+        if args.draft:
+            draft_graph = create_project_planning_graph(
+                llm, graph_config=draft_graph_config(), **graph_kwargs
+            )
+            events = run_draft_planning_graph(
+                graph,
+                draft_graph,
+                prompt,
+                thread_id=thread_id,
+                recursion_limit=args.recursion_limit,
+                stream_updates=True,
+            )
+        else:
+            events = run_project_planning_graph(
+                graph,
+                prompt,
+                thread_id=thread_id,
+                recursion_limit=args.recursion_limit,
+                stream_updates=True,
+                deadline=args.deadline,
+            )
+
+    # Only the changed fields are streamed; rebuild the final state from them
+    for kind, data in events:
+        if kind == DRAFT_EVENT:
+            # The refinement starts again from the draft state
+            final_state = dict(data)
+            if args.output:
+                with open(args.output, "w") as f:
+                    json.dump(state_to_dict(final_state), f, indent=2)
+                print(f"Draft plan saved to {args.output}, refining it...")
+        elif kind == UPDATES_EVENT:
+            apply_delta(final_state, data[1])
+
+    if cache is not None:
+        for agent_name, counts in cache.stats().items():
+            print(
+                f"Cache {agent_name}: {counts['hits']} hits, {counts['misses']} misses"
+            )
+    repair_stats = json_repairer.stats()
+    if repair_stats:
+        print(
+            "JSON repairs: "
+            + ", ".join(f"{name} {count}" for name, count in repair_stats.items())
+        )
+    for agent_name, reason in (final_state.get(DEGRADED_FIELD) or {}).items():
+        print(f"Degraded {agent_name}: {reason}")
+
+    plan = state_to_dict(final_state)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(plan, f, indent=2)
+        print(f"Plan saved to {args.output}")
+    return plan
+
+
+def run_agent_plan_batch(args) -> Dict[str, Any]:
+    """Plan every idea of a JSONL file and return the batch summary."""
+    # Imported lazily: the agent graph pulls in the LangChain/LangGraph stack
+    import asyncio
+    import time
+
+    from langchain.chat_models import init_chat_model
+
+    from imbizopm_agents import ResultCache, create_project_planning_graph
+    from imbizopm_agents.batch import arun_planning_batch, load_ideas, summarize_batch
+
+    ideas = load_ideas(args.ideas)
+    model_kwargs = {"api_key": args.api_key} if args.api_key else {}
+    llm = init_chat_model(args.model, **model_kwargs)
+    cache = ResultCache(args.cache) if args.cache else None
+    # No checkpointer: runs are not resumed, and in-memory checkpoints of
+    # hundreds of runs would only grow
+    graph = create_project_planning_graph(
+        llm,
+        use_checkpointing=False,
+        use_structured_output=False,
+        use_async=True,
+        cache=cache,
+        model_kwargs=model_kwargs,
+    )
+
+    async def plan_all():
+        results = []
+        with open(args.out, "w") as f:
+            async for result in arun_planning_batch(
+                graph,
+                ideas,
+                concurrency=args.concurrency,
+                recursion_limit=args.recursion_limit,
+            ):
+                f.write(json.dumps(result.to_record()) + "\n")
+                f.flush()
+                results.append(result)
+                status = "failed" if result.error else "done"
+                print(
+                    f"[{len(results)}/{len(ideas)}] {result.idea_id} {status} "
+                    f"in {result.latency:.1f}s"
+                )
+        return results
+
+    print(f"Planning {len(ideas)} ideas with concurrency {args.concurrency}")
+    start = time.perf_counter()
+    results = asyncio.run(plan_all())
+    summary = summarize_batch(results, time.perf_counter() - start)
+
+    print(
+        f"Planned {summary['runs']} ideas ({summary['failed']} failed) in "
+        f"{summary['wall_time']:.1f}s: {summary['runs_per_minute']} runs/min"
+    )
+    if results:
+        print(
+            f"Latency p50 {summary['latency_p50']:.1f}s, "
+            f"p95 {summary['latency_p95']:.1f}s, max {summary['latency_max']:.1f}s"
+        )
+    print(f"Plans saved to {args.out}")
+    return summary
+
+
+def run_agent_workers(args):
+    """Serve a worker queue with agent worker processes until interrupted."""
+    # Imported lazily: the agent graph pulls in the LangChain/LangGraph stack
+    from imbizopm_agents.workers import WorkerPool
+
+    model_kwargs = {"api_key": args.api_key} if args.api_key else {}
+    print(f"Starting {args.processes} workers on {args.queue}")
+    with WorkerPool(
+        args.processes,
+        queue_path=args.queue,
+        default_model=args.model,
+        model_kwargs=model_kwargs,
+    ) as pool:
+        try:
+            pool.join()
+        except KeyboardInterrupt:
+            print("Stopping workers")
+
+
 def main():
     """Main entry point for the CLI."""
     args = parse_args()
@@ -110,6 +440,32 @@ def main():
         sys.exit(1)
 
     try:
+        # Handle multi-agent planning
+        if args.command == "plan":
+            try:
+                run_agent_plan(args)
+            except Exception as e:
+                print(f"Error during agent planning: {str(e)}")
+                if args.checkpoint_db:
+                    print(
+                        "Rerun with --resume <thread-id> to continue from the last "
+                        "successful node."
+                    )
+                sys.exit(1)
+            sys.exit(0)
+
+        if args.command == "plan-batch":
+            try:
+                summary = run_agent_plan_batch(args)
+            except Exception as e:
+                print(f"Error during batch planning: {str(e)}")
+                sys.exit(1)
+            sys.exit(1 if summary["failed"] else 0)
+
+        if args.command == "plan-worker":
+            run_agent_workers(args)
+            sys.exit(0)
+
         # Handle AI project generation
         if args.command == "ai-project":
             # Initialize the LLM provider
@@ -9,16 +9,34 @@ from imbizopm_agents.agents import (
     TimelineAgent,
     ValidatorAgent,
 )
+from imbizopm_agents.cache import ResultCache
+from imbizopm_agents.draft import (
+    arefine_project_planning_graph,
+    refine_project_planning_graph,
+)
 from imbizopm_agents.graph import (
     DEFAULT_GRAPH_CONFIG,
+    areplan_project_planning_graph,
+    aresume_project_planning_graph,
+    arun_project_planning_graph,
     create_project_planning_graph,
+    replan_project_planning_graph,
+    resume_project_planning_graph,
     run_project_planning_graph,
 )
 
 __all__ = [
     "create_project_planning_graph",
     "run_project_planning_graph",
+    "arun_project_planning_graph",
+    "resume_project_planning_graph",
+    "aresume_project_planning_graph",
+    "replan_project_planning_graph",
+    "areplan_project_planning_graph",
+    "refine_project_planning_graph",
+    "arefine_project_planning_graph",
     "DEFAULT_GRAPH_CONFIG",
+    "ResultCache",
     "ClarifierAgent",
     "PlannerAgent",
     "ScoperAgent",
@@ -1,14 +1,35 @@
-from typing import Any, Callable, Dict, Optional
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
+from langchain_core.callbacks import BaseCallbackManager
 from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, convert_to_messages
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from langchain_core.runnables.config import ensure_config
+from langchain_core.tools import BaseTool
 from langgraph.graph.graph import CompiledGraph
 from langgraph.prebuilt import create_react_agent
 from llm_output_parser import parse_json
 from loguru import logger
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
+from ..cache import ResultCache, get_model_id, hash_text
+from ..capabilities import JSON_MODE, CapabilityProbe
+from ..hedging import Hedging
+from ..repair import (
+    MAX_FRAGMENT_CHARS,
+    apply_patch,
+    json_repairer,
+    validation_error_fragments,
+)
+from ..streaming import ItemStreamHandler, StructureError, stream_writer
 from .config import AgentDtypes, AgentState
 
+# Agents allowed to reuse their stored output once, set when re-planning
+REPLAY_FIELD = "replay"
+# Metadata key naming the agent behind an LLM call, e.g. to route streamed tokens
+AGENT_METADATA_KEY = "imbizopm_agent"
+
 
 def extract_structured_data(text: str) -> Dict[str, Any]:
     """
@@ -26,6 +47,16 @@ def extract_structured_data(text: str) -> Dict[str, Any]:
         return {"text": text, "error": str(e)}
 
 
+def answer_text(message: BaseMessage) -> str:
+    """Text of an answer, or the arguments of the tool call holding its output."""
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        return json.dumps(tool_call["args"])
+    for tool_call in getattr(message, "invalid_tool_calls", None) or []:
+        if tool_call.get("args"):
+            return tool_call["args"]
+    return message.content
+
+
 class BaseAgent:
     """Base agent class with React pattern support."""
 
@@ -37,22 +68,79 @@ class BaseAgent:
         system_prompt: str,
         model_class: Optional[Callable] = None,
         description: str = "",
+        cache: Optional[ResultCache] = None,
+        hedging: Optional[Hedging] = None,
+        tools: Sequence[BaseTool] = (),
+        structured_output_method: Optional[str] = None,
+        capability_probe: Optional[CapabilityProbe] = None,
     ):
         self.name = name
         self.description = description
         self.llm = llm
         self.model_class = model_class
         self.structured_output = model_class is not None
+        # Method of `with_structured_output`, the model's default if None
+        self.structured_output_method = structured_output_method
+        # Records whether the structured outputs of the model parse
+        self.capability_probe = capability_probe
         self.system_prompt = system_prompt
         self.format_prompt = format_prompt
-        self.agent: CompiledGraph = None
+        self.cache = cache
+        self.hedging = hedging
+        self.tools = list(tools)
+        self.agent: Union[CompiledGraph, Runnable] = None
+        self.hedge_agent: Union[CompiledGraph, Runnable] = None
         self._build_agent()
 
+    @property
+    def prompt_version(self) -> str:
+        """Digest of the prompts sent to the model, used to key cached outputs."""
+        parts = [self.system_prompt, self.format_prompt, str(self.structured_output)]
+        if self.structured_output_method is not None:
+            parts.append(self.structured_output_method)
+        return hash_text(*parts)[:16]
+
+    def _cache_key(self, content: str) -> str:
+        return ResultCache.make_key(
+            self.name, self.prompt_version, get_model_id(self.llm), content
+        )
+
+    def _cached_output(self, content: str) -> Optional[Dict[str, Any]]:
+        """Rebuild the agent output from the cache, skipping the LLM on a hit."""
+        if self.cache is None:
+            return None
+        parsed_content = self.cache.get(
+            self.name, self._cache_key(content), getattr(AgentDtypes, self.name)
+        )
+        if parsed_content is None:
+            return None
+        logger.info(f"Using cached output: {self.name}")
+        messages = convert_to_messages(self._format_input(content))
+        messages.append(AIMessage(content=parsed_content.model_dump_json()))
+        return {"messages": messages, "structured_response": parsed_content}
+
+    def _replayed_output(self, state: AgentState) -> Optional[Dict[str, Any]]:
+        """Reuse the stored output of an agent marked for replay, only once."""
+        replay = state.get(REPLAY_FIELD) or {}
+        if not replay.get(self.name) or state.get(self.name) is None:
+            return None
+        logger.info(f"Reusing stored output: {self.name}")
+        state[REPLAY_FIELD] = {**replay, self.name: False}
+        return {"messages": [], "structured_response": state[self.name]}
+
+    def _store_output(self, content: str, parsed_content: BaseModel):
+        if self.cache is not None:
+            self.cache.put(self.name, self._cache_key(content), parsed_content)
+
     def _format_input(self, content: str) -> str:
+        # JSON mode only guarantees valid JSON, the prompt still gives the format
+        needs_format = (
+            not self.structured_output or self.structured_output_method == JSON_MODE
+        )
         text = f"======= Input Data =======\n{content}" + (
-            ""
-            if self.structured_output
-            else f"\n\n\n======= Output Data =======\n{self.format_prompt}"
+            f"\n\n\n======= Output Data =======\n{self.format_prompt}"
+            if needs_format
+            else ""
         )
         return [
             {"role": "system", "content": self.system_prompt},
@@ -60,28 +148,172 @@ class BaseAgent:
         ]
 
     def _build_agent(self):
-        """Build the React agent."""
-        self.agent: CompiledGraph = create_react_agent(
-            self.llm, tools=[], prompt=None, response_format=self.model_class
+        """Build the agent, a React agent only when it has tools to call."""
+        self.agent = self._create_agent(self.llm)
+        # Duplicate requests of hedged calls go to the secondary model, if any
+        self.hedge_agent = self.agent
+        if self.hedging is not None and self.hedging.secondary_llm is not None:
+            self.hedge_agent = self._create_agent(self.hedging.secondary_llm)
+
+    def _create_agent(self, llm: BaseChatModel) -> Union[CompiledGraph, Runnable]:
+        if self.tools:
+            return self._create_react_agent(llm)
+        return self._create_direct_agent(llm)
+
+    def _create_react_agent(self, llm: BaseChatModel) -> CompiledGraph:
+        # Without a checkpointer of its own, the subgraph would share the
+        # checkpoint namespace of its graph node with every agent run there
+        return create_react_agent(
+            llm,
+            tools=self.tools,
+            prompt=None,
+            response_format=self.model_class,
+            checkpointer=False,
         )
 
-    def _parse_content(self, content: str):
-        parsed_content = extract_structured_data(content)
-        retry_text = None
-        if "error" in parsed_content:
-            logger.error(f"Errors found in output: {self.name}. Retrying...")
-            logger.error(f"Error: {parsed_content['error']}")
-            messages = [
-                {
-                    "role": "human",
-                    "content": f"Format the following text as JSON (strictly output only the JSON, choose the appropriate format):\n{content}"
-                    + self.format_prompt,
-                }
-            ]
-            retry_text = self.llm.invoke(messages).content
-            parsed_content = extract_structured_data(retry_text)
-            if "error" in parsed_content:
-                raise ValueError(f"Failed to parse output again: {self.name}")
+    def _create_direct_agent(self, llm: BaseChatModel) -> Runnable:
+        """
+        Agent calling the model once, without the graph of a React agent.
+
+        Takes and returns the same `messages` and `structured_response` as the
+        React agent; structured outputs come from the same single call through
+        the model's native structured output, instead of a second call. An
+        answer not matching the schema has no `structured_response`, and is
+        parsed from its text like the answers of agents without structured
+        output.
+        """
+        model = llm
+        if self.structured_output:
+            method = {}
+            if self.structured_output_method is not None:
+                method = {"method": self.structured_output_method}
+            model = llm.with_structured_output(
+                self.model_class, include_raw=True, **method
+            )
+
+        def output(messages: List[BaseMessage], response: Any) -> Dict[str, Any]:
+            if not self.structured_output:
+                return {"messages": [*messages, response]}
+            if (
+                self.capability_probe is not None
+                and self.structured_output_method is not None
+            ):
+                self.capability_probe.record(
+                    llm, self.structured_output_method, response["parsed"] is None
+                )
+            if response["parsed"] is None:
+                logger.warning(f"Failed to parse structured output: {self.name}")
+                logger.warning(f"Error: {response.get('parsing_error')}")
+            return {
+                "messages": [*messages, response["raw"]],
+                "structured_response": response["parsed"],
+            }
+
+        def invoke(inputs: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+            messages = convert_to_messages(inputs["messages"])
+            return output(messages, model.invoke(messages, config))
+
+        async def ainvoke(
+            inputs: Dict[str, Any], config: RunnableConfig
+        ) -> Dict[str, Any]:
+            messages = convert_to_messages(inputs["messages"])
+            return output(messages, await model.ainvoke(messages, config))
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=self.name)
+
+    def _run_config(self) -> Dict[str, Any]:
+        """Config of the agent's LLM calls, tagged with the agent name."""
+        return {"metadata": {AGENT_METADATA_KEY: self.name}}
+
+    def _streaming_config(self) -> Dict[str, Any]:
+        """
+        Config of the agent's LLM calls, also parsing their answer as it streams.
+
+        Completed list items (e.g. each task of a task plan) are written to the
+        custom stream of the graph as `(agent_name, field, item)`; a broken
+        structure aborts the call with a `StructureError`, after which
+        `(agent_name,)` is written so its streamed output gets discarded. Only streamed calls
+        are parsed, e.g. when the graph streams its tokens.
+        """
+        config = self._run_config()
+        if self.structured_output:
+            return config
+        writer = stream_writer()
+        handler = ItemStreamHandler(
+            getattr(AgentDtypes, self.name),
+            lambda field, item: writer((self.name, field, item)),
+        )
+        # Added to the callbacks of the node, which passing a list would replace
+        callbacks = ensure_config().get("callbacks")
+        if isinstance(callbacks, BaseCallbackManager):
+            callbacks = callbacks.copy()
+            callbacks.add_handler(handler)
+        else:
+            callbacks = [*(callbacks or []), handler]
+        return {**config, "callbacks": callbacks}
+
+    def _retry_messages(self, content: str) -> List[Dict[str, str]]:
+        """Build the reformatting request sent when the first parse fails."""
+        return [
+            {
+                "role": "human",
+                "content": f"Format the following text as JSON (strictly output only the JSON, choose the appropriate format):\n{content}"
+                + self.format_prompt,
+            }
+        ]
+
+    def _patch_messages(
+        self, parsed_content: Dict[str, Any], error: ValidationError
+    ) -> List[Dict[str, str]]:
+        """Build the request for a patch of the fields failing validation."""
+        errors, fragments = [], []
+        for path, details, fragment in validation_error_fragments(
+            parsed_content, error
+        ):
+            errors.append(f"- {json.dumps(path)}: {details['msg']}")
+            text = json.dumps(fragment, default=str)[:MAX_FRAGMENT_CHARS]
+            if text not in fragments:
+                fragments.append(text)
+        errors, fragments = "\n".join(errors), "\n\n".join(fragments)
+        return [
+            {
+                "role": "human",
+                "content": "Some fields of a JSON output do not have the expected format."
+                f"\n\nValidation errors (path from the root: error):\n{errors}"
+                f"\n\nJSON fragments containing them:\n{fragments}"
+                "\n\nStrictly output only a JSON list of fixes, each "
+                '{"path": [keys and list indices from the root], "value": <fixed value>}',
+            }
+        ]
+
+    def _apply_patch(self, parsed_content: Dict[str, Any], patch_text: str):
+        """Merge the fixes returned by the model into the parsed output."""
+        patch = extract_structured_data(patch_text)
+        if isinstance(patch, dict) and "error" in patch:
+            patch = json_repairer.repair(patch_text)
+        if isinstance(patch, dict):
+            patch = patch.get("fixes", patch.get("patch", [patch]))
+        if not isinstance(patch, list):
+            logger.warning(f"Failed to parse the patch: {self.name}")
+            return parsed_content
+        parsed_content, applied = apply_patch(parsed_content, patch)
+        logger.info(f"Applied {applied} fixes to the output: {self.name}")
+        return parsed_content
+
+    def _validate_or_patch(
+        self, parsed_content: Dict[str, Any]
+    ) -> Tuple[Optional[BaseModel], Optional[List[Dict[str, str]]]]:
+        """Validate the output, or build the patch request of its invalid fields."""
+        model_name: BaseModel = getattr(AgentDtypes, self.name)
+        try:
+            return model_name.model_validate(parsed_content, strict=False), None
+        except ValidationError as e:
+            logger.warning(f"Invalid output: {self.name}. Requesting a patch...")
+            return None, self._patch_messages(parsed_content, e)
+
+    def _validate_content(
+        self, parsed_content: Dict[str, Any], content: str, retry_text: Optional[str]
+    ) -> BaseModel:
         model_name: BaseModel = getattr(AgentDtypes, self.name)
         try:
             return model_name.model_validate(parsed_content, strict=False)
@@ -94,20 +326,159 @@ class BaseAgent:
                 logger.warning(f"Retry text: {retry_text}")
             raise ValueError(f"Failed to validate output: {self.name}")
 
-    def run(self, state: AgentState) -> AgentState:
-        raw_output = self.agent.invoke(
-            {"messages": self._format_input(self._prepare_input(state))}
-        )
-        if self.structured_output:
-            parsed_content: BaseModel = raw_output["structured_response"]
-            logger.debug(parsed_content)
+    def _extract_or_repair(self, text: str) -> Dict[str, Any]:
+        """Extract the JSON of an answer, repairing it locally if malformed."""
+        parsed_content = extract_structured_data(text)
+        # Answers the lenient parser accepts are kept as parsed
+        if "error" in parsed_content:
+            repaired = json_repairer.repair(text)
+            if isinstance(repaired, dict):
+                logger.info(f"Repaired output locally: {self.name}")
+                return repaired
+        return parsed_content
+
+    def _parse_content(self, content: str):
+        parsed_content = self._extract_or_repair(content)
+        retry_text = None
+        if "error" in parsed_content:
+            logger.error(f"Errors found in output: {self.name}. Retrying...")
+            logger.error(f"Error: {parsed_content['error']}")
+            retry_text = self.llm.invoke(self._retry_messages(content)).content
+            parsed_content = self._extract_or_repair(retry_text)
+            if "error" in parsed_content:
+                raise ValueError(f"Failed to parse output again: {self.name}")
+        validated, patch_messages = self._validate_or_patch(parsed_content)
+        if validated is not None:
+            return validated
+        patch_text = self.llm.invoke(patch_messages).content
+        parsed_content = self._apply_patch(parsed_content, patch_text)
+        return self._validate_content(parsed_content, content, retry_text)
+
+    async def _aparse_content(self, content: str):
+        """Async counterpart of `_parse_content`."""
+        parsed_content = self._extract_or_repair(content)
+        retry_text = None
+        if "error" in parsed_content:
+            logger.error(f"Errors found in output: {self.name}. Retrying...")
+            logger.error(f"Error: {parsed_content['error']}")
+            retry_text = (await self.llm.ainvoke(self._retry_messages(content))).content
+            parsed_content = self._extract_or_repair(retry_text)
+            if "error" in parsed_content:
+                raise ValueError(f"Failed to parse output again: {self.name}")
+        validated, patch_messages = self._validate_or_patch(parsed_content)
+        if validated is not None:
+            return validated
+        patch_text = (await self.llm.ainvoke(patch_messages)).content
+        parsed_content = self._apply_patch(parsed_content, patch_text)
+        return self._validate_content(parsed_content, content, retry_text)
+
+    def _generate(
+        self, content: str, hedge: bool = False
+    ) -> Tuple[Dict[str, Any], BaseModel]:
+        """Call the LLM on the agent input and parse its answer."""
+        inputs = {"messages": self._format_input(content)}
+        # The tokens of a hedged duplicate are not streamed under the agent name
+        if hedge:
+            raw_output = self.hedge_agent.invoke(inputs)
+        else:
+            try:
+                raw_output = self.agent.invoke(inputs, self._streaming_config())
+            except StructureError as e:
+                logger.warning(f"Broken output structure: {self.name} ({e})")
+                logger.warning("Retrying before the end of the generation...")
+                stream_writer()((self.name,))
+                raw_output = self.agent.invoke(inputs, self._run_config())
+        parsed_content = raw_output.get("structured_response")
+        if parsed_content is None:
+            # Also answers failing to match the schema of the structured output
+            parsed_content = self._parse_content(
+                answer_text(raw_output["messages"][-1])
+            )
+        logger.debug(parsed_content)
+        return raw_output, parsed_content
+
+    async def _agenerate(
+        self, content: str, hedge: bool = False
+    ) -> Tuple[Dict[str, Any], BaseModel]:
+        """Async counterpart of `_generate`."""
+        inputs = {"messages": self._format_input(content)}
+        if hedge:
+            raw_output = await self.hedge_agent.ainvoke(inputs)
         else:
-            parsed_content = self._parse_content(raw_output["messages"][-1].content)
+            try:
+                raw_output = await self.agent.ainvoke(inputs, self._streaming_config())
+            except StructureError as e:
+                logger.warning(f"Broken output structure: {self.name} ({e})")
+                logger.warning("Retrying before the end of the generation...")
+                stream_writer()((self.name,))
+                raw_output = await self.agent.ainvoke(inputs, self._run_config())
+        parsed_content = raw_output.get("structured_response")
+        if parsed_content is None:
+            parsed_content = await self._aparse_content(
+                answer_text(raw_output["messages"][-1])
+            )
+        logger.debug(parsed_content)
+        return raw_output, parsed_content
+
+    def _update_state(
+        self, state: AgentState, raw_output: Dict[str, Any], parsed_content: BaseModel
+    ) -> AgentState:
         state["messages"] = raw_output["messages"]
         state[self.name] = parsed_content
         state["routes"] = [self.name]
         return self._process_result(state, parsed_content)
 
+    def run(self, state: AgentState) -> AgentState:
+        replayed_output = self._replayed_output(state)
+        if replayed_output is not None:
+            return self._update_state(
+                state, replayed_output, replayed_output["structured_response"]
+            )
+
+        content = self._prepare_input(state)
+        cached_output = self._cached_output(content)
+        if cached_output is not None:
+            return self._update_state(
+                state, cached_output, cached_output["structured_response"]
+            )
+
+        if self.hedging is not None and self.hedging.applies(self.name):
+            raw_output, parsed_content = self.hedging.run(
+                self.name,
+                lambda: self._generate(content),
+                lambda: self._generate(content, hedge=True),
+            )
+        else:
+            raw_output, parsed_content = self._generate(content)
+        self._store_output(content, parsed_content)
+        return self._update_state(state, raw_output, parsed_content)
+
+    async def arun(self, state: AgentState) -> AgentState:
+        """Async counterpart of `run`, awaiting the LLM instead of blocking a thread."""
+        replayed_output = self._replayed_output(state)
+        if replayed_output is not None:
+            return self._update_state(
+                state, replayed_output, replayed_output["structured_response"]
+            )
+
+        content = self._prepare_input(state)
+        cached_output = self._cached_output(content)
+        if cached_output is not None:
+            return self._update_state(
+                state, cached_output, cached_output["structured_response"]
+            )
+
+        if self.hedging is not None and self.hedging.applies(self.name):
+            raw_output, parsed_content = await self.hedging.arun(
+                self.name,
+                lambda: self._agenerate(content),
+                lambda: self._agenerate(content, hedge=True),
+            )
+        else:
+            raw_output, parsed_content = await self._agenerate(content)
+        self._store_output(content, parsed_content)
+        return self._update_state(state, raw_output, parsed_content)
+
     def _prepare_input(self, state: AgentState) -> str:
         """Prepare input for the agent."""
         # Default implementation that can be overridden
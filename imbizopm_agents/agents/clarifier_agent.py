@@ -16,13 +16,16 @@ from .config import AgentRoute
 class ClarifierAgent(BaseAgent):
     """Agent that refines the idea, extracts goals, scope, and constraints."""
 
-    def __init__(self, llm: BaseChatModel, use_structured_output: bool = False):
+    def __init__(
+        self, llm: BaseChatModel, use_structured_output: bool = False, **kwargs
+    ):
         super().__init__(
             llm,
             AgentRoute.ClarifierAgent,
             get_clarifier_output_format(),
             get_clarifier_prompt(),
             ProjectPlan if use_structured_output else None,
+            **kwargs,
         )
 
     def _prepare_input(self, state: AgentState) -> str:
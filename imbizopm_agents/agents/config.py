@@ -49,6 +49,13 @@ agent_state_fields = {
     "backward": str,
     "forward": str,
     "warn_errors": dict[str, Any],
+    "pending_results": dict[str, Any],
+    "loop_counts": dict[str, int],
+    "replay": dict[str, bool],
+    "speculative": dict[str, Any],
+    "cancelled": str,
+    "deadline": float,
+    "degraded": dict[str, str],
     "routes": Annotated[list[str], add_messages],
     "messages": Annotated[list[str], add_messages],
 }
@@ -12,13 +12,14 @@ from .config import AgentDtypes, AgentRoute
 class NegotiatorAgent(BaseAgent):
     """Agent that coordinates conflict resolution among agents."""
 
-    def __init__(self, llm, use_structured_output: bool = False):
+    def __init__(self, llm, use_structured_output: bool = False, **kwargs):
         super().__init__(
             llm,
             AgentRoute.NegotiatorAgent,
             get_negotiator_output_format(),
             get_negotiator_prompt(),
             ConflictResolution if use_structured_output else None,
+            **kwargs,
         )
 
     def _prepare_input(self, state: AgentState) -> str:
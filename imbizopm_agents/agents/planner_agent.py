@@ -12,13 +12,14 @@ from .config import AgentDtypes, AgentRoute
 class PlannerAgent(BaseAgent):
     """Agent that breaks the project into phases, epics, and strategies."""
 
-    def __init__(self, llm, use_structured_output: bool = False):
+    def __init__(self, llm, use_structured_output: bool = False, **kwargs):
         super().__init__(
             llm,
             AgentRoute.PlannerAgent,
             get_planner_output_format(),
             get_planner_prompt(),
             ProjectPlanOutput if use_structured_output else None,
+            **kwargs,
         )
 
     def _prepare_input(self, state: AgentState) -> str:
@@ -14,16 +14,18 @@ from .config import AgentRoute
 class PMAdapterAgent(BaseAgent):
     """Agent that formats and exports the project plan for external tools."""
 
-    def __init__(self, llm, use_structured_output: bool = False):
+    def __init__(self, llm, use_structured_output: bool = False, **kwargs):
         super().__init__(
             llm,
             AgentRoute.PMAdapterAgent,
             get_pm_adapter_output_format(),
             get_pm_adapter_prompt(),
             ProjectSummary if use_structured_output else None,
+            **kwargs,
         )
 
     def _prepare_input(self, state: AgentState) -> str:
+        # Risks and validation are missing from draft plans
         return f""""# Clarifier Agent
 {dumps_to_yaml(state[AgentRoute.ClarifierAgent], indent=4)}
 
@@ -37,10 +39,10 @@ class PMAdapterAgent(BaseAgent):
 {dumps_to_yaml(state[AgentRoute.TimelineAgent], indent=4)}
 
 # Project Risks:
-{dumps_to_yaml(state[AgentRoute.RiskAgent], indent=4)}
+{dumps_to_yaml(state.get(AgentRoute.RiskAgent), indent=4)}
 
 # Validation:
-{dumps_to_yaml(state[AgentRoute.ValidatorAgent], indent=4)}
+{dumps_to_yaml(state.get(AgentRoute.ValidatorAgent), indent=4)}
 
 Format this project plan for exporting to JSON. Stricly output only the JSON, to the appropriate format."""
 
@@ -9,13 +9,14 @@ from .config import AgentRoute
 class RiskAgent(BaseAgent):
     """Agent that reviews feasibility and spots contradictions."""
 
-    def __init__(self, llm, use_structured_output: bool = False):
+    def __init__(self, llm, use_structured_output: bool = False, **kwargs):
         super().__init__(
             llm,
             AgentRoute.RiskAgent,
             get_risk_output_format(),
             get_risk_prompt(),
             FeasibilityAssessment if use_structured_output else None,
+            **kwargs,
         )
 
     def _prepare_input(self, state: AgentState) -> str:
@@ -12,13 +12,14 @@ from .config import AgentDtypes, AgentRoute
 class ScoperAgent(BaseAgent):
     """Agent that trims the plan into an MVP and resolves overload."""
 
-    def __init__(self, llm, use_structured_output: bool = False):
+    def __init__(self, llm, use_structured_output: bool = False, **kwargs):
         super().__init__(
             llm,
             AgentRoute.ScoperAgent,
             get_scoper_output_format(),
             get_scoper_prompt(),
             ScopeDefinition if use_structured_output else None,
+            **kwargs,
         )
 
     def _prepare_input(self, state: AgentState) -> str:
@@ -12,13 +12,14 @@ from .config import AgentDtypes, AgentRoute
 class TaskifierAgent(BaseAgent):
     """Agent that produces detailed tasks with owners and dependencies."""
 
-    def __init__(self, llm, use_structured_output: bool = False):
+    def __init__(self, llm, use_structured_output: bool = False, **kwargs):
         super().__init__(
             llm,
             AgentRoute.TaskifierAgent,
             get_taskifier_output_format(),
             get_taskifier_prompt(),
             TaskPlan if use_structured_output else None,
+            **kwargs,
         )
 
     def _prepare_input(self, state: AgentState) -> str:
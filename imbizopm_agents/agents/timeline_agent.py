@@ -12,13 +12,14 @@ from .config import AgentDtypes, AgentRoute
 class TimelineAgent(BaseAgent):
     """Agent that maps tasks to durations and milestones."""
 
-    def __init__(self, llm, use_structured_output: bool = False):
+    def __init__(self, llm, use_structured_output: bool = False, **kwargs):
         super().__init__(
             llm,
             AgentRoute.TimelineAgent,
             get_timeline_output_format(),
             get_timeline_prompt(),
             ProjectTimeline if use_structured_output else None,
+            **kwargs,
         )
 
     def _prepare_input(self, state: AgentState) -> str:
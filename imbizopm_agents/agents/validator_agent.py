@@ -12,13 +12,14 @@ from .config import AgentDtypes, AgentRoute
 class ValidatorAgent(BaseAgent):
     """Agent that verifies alignment between idea, plan, and goals."""
 
-    def __init__(self, llm, use_structured_output: bool = False):
+    def __init__(self, llm, use_structured_output: bool = False, **kwargs):
         super().__init__(
             llm,
             AgentRoute.ValidatorAgent,
             get_validator_prompt(),
             get_validator_output_format(),
             PlanValidation if use_structured_output else None,
+            **kwargs,
         )
 
     def _prepare_input(self, state: AgentState) -> str:
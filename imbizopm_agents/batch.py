@@ -0,0 +1,166 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from langgraph.graph.graph import CompiledGraph
+from loguru import logger
+
+from .agents.config import AgentState
+from .events import apply_delta
+from .graph import arun_project_planning_graph
+from .serialization import state_to_dict
+
+DEFAULT_CONCURRENCY = 4
+
+
+@dataclass
+class BatchResult:
+    """Outcome of planning one idea of a batch."""
+
+    idea_id: str
+    thread_id: str
+    latency: float
+    state: Optional[AgentState] = None
+    error: Optional[str] = None
+
+    def to_record(self) -> Dict[str, Any]:
+        """JSON-serializable record of the result, one line of the output file."""
+        record = {
+            "id": self.idea_id,
+            "thread_id": self.thread_id,
+            "latency": round(self.latency, 3),
+        }
+        if self.error is not None:
+            record["error"] = self.error
+        else:
+            record["state"] = state_to_dict(self.state)
+        return record
+
+
+def load_ideas(path: str) -> List[Tuple[str, str]]:
+    """
+    Read the project ideas of a JSONL file.
+
+    Each line is either a JSON string or an object with the idea under `input`
+    (or `idea`) and an optional `id`; ideas without an id are numbered by line.
+
+    Args:
+        path: The JSONL file of ideas
+
+    Returns:
+        List of (id, idea) pairs in file order
+    """
+    ideas = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if isinstance(data, str):
+                data = {"input": data}
+            idea = data.get("input") or data.get("idea")
+            if not idea:
+                raise ValueError(f"Line {line_number} of {path} has no idea")
+            ideas.append((str(data.get("id", line_number)), idea))
+    return ideas
+
+
+async def _plan_idea(
+    graph: CompiledGraph,
+    idea_id: str,
+    idea: str,
+    semaphore: asyncio.Semaphore,
+    recursion_limit: int,
+) -> BatchResult:
+    thread_id = f"batch-{idea_id}"
+    async with semaphore:
+        start = time.perf_counter()
+        final_state = {"input": idea}
+        try:
+            async for _, (_, delta) in arun_project_planning_graph(
+                graph,
+                idea,
+                thread_id=thread_id,
+                recursion_limit=recursion_limit,
+                print_results=False,
+                stream_updates=True,
+            ):
+                apply_delta(final_state, delta)
+        except Exception as e:
+            logger.warning(f"Planning failed for idea {idea_id}: {e}")
+            return BatchResult(
+                idea_id, thread_id, time.perf_counter() - start, error=str(e)
+            )
+        return BatchResult(idea_id, thread_id, time.perf_counter() - start, final_state)
+
+
+async def arun_planning_batch(
+    graph: CompiledGraph,
+    ideas: List[Tuple[str, str]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    recursion_limit: int = 30,
+) -> AsyncIterator[BatchResult]:
+    """
+    Plan many ideas with bounded concurrency.
+
+    At most `concurrency` runs are in flight at once, sharing one event loop.
+    Results are yielded as soon as each run finishes, so they can be written
+    out before the whole batch is done. A failed run yields a result with its
+    error instead of stopping the batch. Build the graph with `use_async=True`.
+
+    Args:
+        graph: The compiled project planning graph
+        ideas: The (id, idea) pairs to plan
+        concurrency: Maximum number of runs in flight
+        recursion_limit: Maximum number of agent steps per run
+
+    Yields:
+        The result of each run, in completion order
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    tasks = [
+        asyncio.ensure_future(
+            _plan_idea(graph, idea_id, idea, semaphore, recursion_limit)
+        )
+        for idea_id, idea in ideas
+    ]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize_batch(results: List[BatchResult], wall_time: float) -> Dict[str, Any]:
+    """
+    Throughput and latency figures of a finished batch.
+
+    Args:
+        results: The results of every run of the batch
+        wall_time: Elapsed seconds for the whole batch
+
+    Returns:
+        Counts of runs and failures, runs per minute and latency percentiles
+    """
+    latencies = sorted(result.latency for result in results)
+    summary = {
+        "runs": len(results),
+        "failed": sum(result.error is not None for result in results),
+        "wall_time": round(wall_time, 3),
+        "runs_per_minute": round(60 * len(results) / wall_time, 2) if wall_time else 0,
+    }
+    if latencies:
+        summary.update(
+            latency_p50=round(_percentile(latencies, 0.5), 3),
+            latency_p95=round(_percentile(latencies, 0.95), 3),
+            latency_max=round(latencies[-1], 3),
+        )
+    return summary
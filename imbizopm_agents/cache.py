@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Type
+
+from langchain_core.language_models import BaseChatModel
+from loguru import logger
+from pydantic import BaseModel
+
+DEFAULT_CACHE_PATH = os.path.join(".imbizopm_cache", "results.sqlite")
+DEFAULT_MAX_SIZE_BYTES = 100 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    agent TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+def get_model_id(llm: BaseChatModel) -> str:
+    """Return an identifier of the model behind a chat model client."""
+    for attribute in ("model_name", "model", "model_id"):
+        value = getattr(llm, attribute, None)
+        if isinstance(value, str) and value:
+            return f"{llm.__class__.__name__}:{value}"
+    return llm.__class__.__name__
+
+
+def hash_text(*parts: str) -> str:
+    """Stable SHA-256 digest of the given text parts."""
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def credential_fingerprint(api_key: Optional[str]) -> str:
+    """Digest identifying a credential without keeping the secret itself."""
+    return hash_text(api_key)[:16] if api_key else ""
+
+
+class ResultCache:
+    """
+    Content-addressed disk cache of parsed agent outputs.
+
+    Entries are keyed on the agent name, prompt version, model id and the exact
+    input text of the agent, so an identical request skips the LLM entirely.
+    The total size is bounded; the least recently used entries are evicted first.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite file holding the cached outputs
+            max_size_bytes: Maximum total size of the cached outputs
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0}
+        )
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(_SCHEMA)
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(
+        agent_name: str, prompt_version: str, model_id: str, input_text: str
+    ) -> str:
+        """Build the cache key of one agent execution."""
+        return hash_text(agent_name, prompt_version, model_id, input_text)
+
+    def get(
+        self, agent_name: str, key: str, model_class: Type[BaseModel]
+    ) -> Optional[BaseModel]:
+        """Return the cached output for `key`, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE results SET last_access = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+                self._conn.commit()
+            self._stats[agent_name]["hits" if row is not None else "misses"] += 1
+
+        if row is None:
+            return None
+        try:
+            return model_class.model_validate_json(row[0])
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry for {agent_name}: {e}")
+            return None
+
+    def put(self, agent_name: str, key: str, value: BaseModel):
+        """Store an agent output and evict old entries beyond the size bound."""
+        data = value.model_dump_json()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, agent_name, data, len(data), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results")
+        excess = total.fetchone()[0] - self.max_size_bytes
+        if excess <= 0:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM results ORDER BY last_access ASC"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", evicted)
+        logger.debug(f"Evicted {len(evicted)} cached agent outputs")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit and miss counters per agent since the cache was opened."""
+        with self._lock:
+            return {agent: dict(counts) for agent, counts in self._stats.items()}
+
+    def size_bytes(self) -> int:
+        """Total size of the cached outputs."""
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results")
+            return total.fetchone()[0]
+
+    def clear(self):
+        """Remove every cached output."""
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
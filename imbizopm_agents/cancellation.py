@@ -0,0 +1,133 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from loguru import logger
+
+# State field recording why a run was cancelled, cleared when it is resumed
+CANCELLED_FIELD = "cancelled"
+
+
+class RunCancelled(Exception):
+    """A planning run was cancelled before it finished."""
+
+    def __init__(self, reason: str = "Cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation of one planning run.
+
+    Once cancelled, the run stops at the next LLM token, LLM call or node
+    start (see `CancellationHandler`); async runs are also interrupted in the
+    middle of their pending LLM request through the registered callbacks.
+    """
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], Any]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "Cancelled"):
+        """Cancel the run, calling the registered callbacks once."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        logger.info(f"Cancelling run: {reason}")
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], Any]) -> Callable[[], None]:
+        """
+        Call a function on cancellation, right away if already cancelled.
+
+        Returns:
+            A function unregistering the callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback: Callable[[], Any]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RunCancelled(self.reason)
+
+
+class CancellationHandler(BaseCallbackHandler):
+    """Callback handler aborting the LLM calls and nodes of a cancelled run."""
+
+    raise_error = True
+
+    def __init__(self, token: CancellationToken):
+        self.token = token
+
+    def on_chain_start(self, serialized, inputs, **kwargs):
+        self.token.raise_if_cancelled()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.token.raise_if_cancelled()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.token.raise_if_cancelled()
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        # Raising here abandons the streamed response of the request in flight
+        self.token.raise_if_cancelled()
+
+
+class RunRegistry:
+    """Cancellation tokens of the runs in flight, keyed by run ID."""
+
+    def __init__(self):
+        self._tokens: Dict[str, CancellationToken] = {}
+        self._lock = threading.Lock()
+
+    def register(
+        self, run_id: str, token: Optional[CancellationToken] = None
+    ) -> CancellationToken:
+        """Track a run, returning its cancellation token."""
+        with self._lock:
+            token = self._tokens[run_id] = token or CancellationToken()
+            return token
+
+    def release(self, run_id: str):
+        """Stop tracking a finished run."""
+        with self._lock:
+            self._tokens.pop(run_id, None)
+
+    def cancel(self, run_id: str, reason: str = "Cancelled") -> bool:
+        """
+        Cancel a run in flight.
+
+        Returns:
+            Whether a run with this ID was in flight
+        """
+        with self._lock:
+            token = self._tokens.get(run_id)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+    def active(self) -> List[str]:
+        """IDs of the runs in flight."""
+        with self._lock:
+            return list(self._tokens)
@@ -0,0 +1,231 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, List
+
+from langchain_core.language_models import BaseChatModel
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from .cache import get_model_id
+
+DEFAULT_CAPABILITIES_PATH = os.path.join(".imbizopm_cache", "capabilities.json")
+
+# Structured output methods of `BaseChatModel.with_structured_output`
+JSON_SCHEMA = "json_schema"
+FUNCTION_CALLING = "function_calling"
+JSON_MODE = "json_mode"
+# Plain text answers following the format prompt, parsed from the text
+TEXT = "text"
+
+# In order of preference: the schema-constrained modes need no format prompt
+# and rarely fail to parse; JSON mode still needs the format prompt, but always
+# returns valid JSON
+STRUCTURED_OUTPUT_MODES = [JSON_SCHEMA, FUNCTION_CALLING, JSON_MODE]
+
+_PROBE_PROMPT = (
+    "Reply with a JSON object holding the integer field `answer`: what is 17 + 25?"
+)
+
+
+class _ProbeAnswer(BaseModel):
+    """Answer of the capability probe."""
+
+    answer: int = Field(description="The result of the sum")
+
+
+class CapabilityProbe:
+    """
+    Detection of the structured output modes supported by each model.
+
+    Each mode is tried on a small request the first time a model is seen; the
+    outcome is stored on disk by model id, so a model is only probed once.
+    The agents then `record` the outcome of their own calls, whose schemas
+    are larger than the probe's, so a mode failing on them gets demoted.
+    `best_mode` picks the supported mode with the lowest failure rate, then
+    the fewest tokens per probe request; models supporting none of them
+    answer in text.
+
+    The agent outcomes are saved every `save_every` records and at exit,
+    merged into the file as it is on disk so the probes of other processes
+    sharing it are kept.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CAPABILITIES_PATH,
+        samples: int = 1,
+        save_every: int = 20,
+    ):
+        """
+        Initialize the probe.
+
+        Args:
+            path: JSON file holding the probe results of each model
+            samples: Number of requests tried per mode
+            save_every: Number of agent outcomes recorded between two saves
+        """
+        self.path = path
+        self.samples = samples
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._results = self._load()
+        # Agent calls and failures recorded since the last save
+        self._unsaved: Dict[str, Dict[str, List[int]]] = {}
+        self._unsaved_count = 0
+        atexit.register(self.flush)
+
+    def results(self, llm: BaseChatModel) -> Dict[str, Dict[str, Any]]:
+        """
+        Outcome of each mode for a model, probing it if not known yet.
+
+        Returns:
+            The probe calls, failures (of which raised errors) and total
+            tokens, and the agent calls and failures of each mode
+        """
+        model_id = get_model_id(llm)
+        with self._lock:
+            if model_id in self._results:
+                return self._results[model_id]
+        results = {
+            mode: self._probe_mode(llm, mode) for mode in STRUCTURED_OUTPUT_MODES
+        }
+        # Requests failing in every mode rather mean the model could not be reached
+        if all(r["failures"] == r["calls"] for r in results.values()) and any(
+            r["errors"] for r in results.values()
+        ):
+            logger.warning(f"Could not probe the structured output of {model_id}")
+            return results
+        logger.info(f"Probed the structured output modes of {model_id}")
+        with self._lock:
+            self._results[model_id] = results
+            self._save()
+        return results
+
+    def _probe_mode(self, llm: BaseChatModel, mode: str) -> Dict[str, Any]:
+        result = {"calls": 0, "failures": 0, "errors": 0, "tokens": 0}
+        try:
+            structured_llm = llm.with_structured_output(
+                _ProbeAnswer, method=mode, include_raw=True
+            )
+        except Exception as e:
+            logger.debug(f"{mode} is not available: {e}")
+            return {**result, "calls": 1, "failures": 1}
+        for _ in range(self.samples):
+            result["calls"] += 1
+            try:
+                response = structured_llm.invoke(_PROBE_PROMPT)
+                usage = getattr(response["raw"], "usage_metadata", None) or {}
+                result["tokens"] += usage.get("total_tokens", 0)
+                if response["parsed"] is None or response["parsed"].answer != 42:
+                    result["failures"] += 1
+            except Exception as e:
+                logger.debug(f"{mode} failed: {e}")
+                result["failures"] += 1
+                result["errors"] += 1
+        return result
+
+    def record(self, llm: BaseChatModel, mode: str, failed: bool):
+        """
+        Record the outcome of an agent call made in a structured output mode.
+
+        Args:
+            llm: The model called
+            mode: The structured output mode of the call
+            failed: Whether its answer could not be parsed into the schema
+        """
+        model_id = get_model_id(llm)
+        with self._lock:
+            result = self._results.get(model_id, {}).get(mode)
+            if result is None:
+                return
+            result["agent_calls"] = result.get("agent_calls", 0) + 1
+            result["agent_failures"] = result.get("agent_failures", 0) + failed
+            counts = self._unsaved.setdefault(model_id, {}).setdefault(mode, [0, 0])
+            counts[0] += 1
+            counts[1] += failed
+            self._unsaved_count += 1
+            if self._unsaved_count >= self.save_every:
+                self._save()
+
+    def flush(self):
+        """Save the agent outcomes recorded since the last save."""
+        with self._lock:
+            if self._unsaved_count:
+                self._save()
+
+    def _failure_rate(self, result: Dict[str, Any]) -> float:
+        calls = result["calls"] + result.get("agent_calls", 0)
+        return (result["failures"] + result.get("agent_failures", 0)) / calls
+
+    def capabilities(self, llm: BaseChatModel) -> List[str]:
+        """Structured output modes the model supports, and text."""
+        results = self.results(llm)
+        return [
+            mode
+            for mode in STRUCTURED_OUTPUT_MODES
+            if self._failure_rate(results[mode]) < 1
+        ] + [TEXT]
+
+    def best_mode(self, llm: BaseChatModel) -> str:
+        """The supported mode with the lowest failure rate and fewest tokens."""
+        results = self.results(llm)
+        supported = [mode for mode in self.capabilities(llm) if mode != TEXT]
+        if not supported:
+            return TEXT
+        # Tokens are compared on the probe request, the same in every mode
+        return min(
+            supported,
+            key=lambda mode: (
+                self._failure_rate(results[mode]),
+                results[mode]["tokens"] / results[mode]["calls"],
+                STRUCTURED_OUTPUT_MODES.index(mode),
+            ),
+        )
+
+    def structured_output_kwargs(self, llm: BaseChatModel) -> Dict[str, Any]:
+        """Keyword arguments of the agents using the best mode of a model."""
+        mode = self.best_mode(llm)
+        if mode == TEXT:
+            return {"use_structured_output": False}
+        return {"use_structured_output": True, "structured_output_method": mode}
+
+    def _load(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                results = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable capabilities file {self.path}: {e}")
+            return {}
+        return results if isinstance(results, dict) else {}
+
+    def _save(self):
+        # Merge into the file as saved by other processes since it was loaded
+        results = self._load()
+        for model_id, modes in self._results.items():
+            if model_id not in results:
+                results[model_id] = modes
+                continue
+            for mode, (calls, failures) in self._unsaved.get(model_id, {}).items():
+                result = results[model_id].get(mode)
+                if result is not None:
+                    result["agent_calls"] = result.get("agent_calls", 0) + calls
+                    result["agent_failures"] = (
+                        result.get("agent_failures", 0) + failures
+                    )
+        self._results = results
+        self._unsaved = {}
+        self._unsaved_count = 0
+
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # Replaced in one step, so readers never see a partly written file
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(results, f, indent=2)
+        os.replace(f.name, self.path)
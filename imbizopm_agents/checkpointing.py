@@ -0,0 +1,261 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from loguru import logger
+
+# Defaults of the in-memory checkpoints of long-running servers
+DEFAULT_MAX_CHECKPOINT_BYTES = 256 * 1024 * 1024
+DEFAULT_CHECKPOINT_TTL = 24 * 60 * 60
+
+
+def _typed_size(typed: Tuple[str, bytes]) -> int:
+    return len(typed[0]) + len(typed[1])
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    In-memory checkpointer bounding the memory held by the checkpoints.
+
+    Threads not read or written for longer than the TTL are dropped, as well as
+    the least recently used ones once the serialized checkpoints, writes and
+    channel values exceed the maximum size. Only threads of finished runs are
+    dropped: a thread becomes active on its first write until `release` is
+    called at the end of its run, so the runs in flight of a shared saver keep
+    their checkpoints, however long they take or large they grow.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = DEFAULT_MAX_CHECKPOINT_BYTES,
+        ttl: Optional[float] = DEFAULT_CHECKPOINT_TTL,
+        max_threads: Optional[int] = None,
+        **kwargs,
+    ):
+        """
+        Initialize the checkpointer.
+
+        Args:
+            max_bytes: Maximum serialized size of all threads, unbounded if None
+            ttl: Seconds after which an unused thread is dropped, kept if None
+            max_threads: Maximum number of threads kept, unbounded if None
+        """
+        super().__init__(**kwargs)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_threads = max_threads
+        self.evicted_threads = 0
+        self.evicted_bytes = 0
+        # Serialized size of each thread, least recently used first
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        # Threads of the runs in flight, never evicted
+        self._active: Set[str] = set()
+        self._lock = threading.RLock()
+
+    def _touch(self, thread_id: str, added_bytes: int = 0):
+        self._sizes[thread_id] = self._sizes.get(thread_id, 0) + added_bytes
+        self._sizes.move_to_end(thread_id)
+        self._last_used[thread_id] = time.monotonic()
+
+    def release(self, thread_id: str):
+        """
+        Mark the run of a thread as finished, so its checkpoints can be evicted.
+
+        Args:
+            thread_id: The thread of the run
+        """
+        with self._lock:
+            self._active.discard(thread_id)
+
+    def _evict(self, current_thread: Optional[str] = None):
+        """Drop the expired threads, then the least recently used ones over the bounds."""
+        if self.ttl is not None:
+            deadline = time.monotonic() - self.ttl
+            for thread_id in [
+                t
+                for t, used in self._last_used.items()
+                if used < deadline and t not in self._active
+            ]:
+                self._drop(thread_id, "expired")
+
+        def over_bounds() -> bool:
+            return (
+                self.max_bytes is not None and self.memory_usage() > self.max_bytes
+            ) or (self.max_threads is not None and len(self._sizes) > self.max_threads)
+
+        while over_bounds():
+            thread_id = next(
+                (
+                    t
+                    for t in self._sizes
+                    if t != current_thread and t not in self._active
+                ),
+                None,
+            )
+            if thread_id is None:
+                break
+            self._drop(thread_id, "over the memory bound")
+
+    def _drop(self, thread_id: str, reason: str):
+        size = self._sizes.get(thread_id, 0)
+        super().delete_thread(thread_id)
+        self._sizes.pop(thread_id, None)
+        self._last_used.pop(thread_id, None)
+        self.evicted_threads += 1
+        self.evicted_bytes += size
+        logger.info(
+            f"Evicted checkpoints of thread {thread_id} ({reason}, {size} bytes)"
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            self._evict(thread_id)
+            if thread_id not in self._sizes:
+                # Reading an unknown thread would add it to the storage
+                return None
+            self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+            blob_keys = [
+                (thread_id, checkpoint_ns, k, v) for k, v in new_versions.items()
+            ]
+            before = self._entry_size(
+                thread_id, checkpoint_ns, checkpoint["id"], blob_keys
+            )
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            after = self._entry_size(
+                thread_id, checkpoint_ns, checkpoint["id"], blob_keys
+            )
+            self._active.add(thread_id)
+            self._touch(thread_id, after - before)
+            self._evict(thread_id)
+            return next_config
+
+    def _entry_size(
+        self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, blob_keys
+    ) -> int:
+        size = sum(_typed_size(self.blobs[k]) for k in blob_keys if k in self.blobs)
+        if thread_id not in self.storage:
+            return size
+        saved = self.storage[thread_id].get(checkpoint_ns, {}).get(checkpoint_id)
+        if saved is not None:
+            size += _typed_size(saved[0]) + _typed_size(saved[1])
+        return size
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            outer_key = (
+                thread_id,
+                config["configurable"].get("checkpoint_ns", ""),
+                config["configurable"]["checkpoint_id"],
+            )
+            before = self._writes_size(outer_key)
+            super().put_writes(config, writes, task_id, task_path)
+            self._active.add(thread_id)
+            self._touch(thread_id, self._writes_size(outer_key) - before)
+            self._evict(thread_id)
+
+    def _writes_size(self, outer_key: Tuple[str, str, str]) -> int:
+        if outer_key not in self.writes:
+            return 0
+        return sum(_typed_size(w[2]) for w in self.writes[outer_key].values())
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            super().delete_thread(thread_id)
+            self._sizes.pop(thread_id, None)
+            self._last_used.pop(thread_id, None)
+            self._active.discard(thread_id)
+
+    def memory_usage(self) -> int:
+        """Serialized size in bytes of the checkpoints currently held."""
+        return sum(self._sizes.values())
+
+    def stats(self) -> Dict[str, int]:
+        """Memory use, thread count and eviction counters of the checkpointer."""
+        with self._lock:
+            return {
+                "bytes": self.memory_usage(),
+                "threads": len(self._sizes),
+                "active_threads": len(self._active),
+                "evicted_threads": self.evicted_threads,
+                "evicted_bytes": self.evicted_bytes,
+            }
+
+
+def release_thread(checkpointer: Optional[BaseCheckpointSaver], thread_id: str):
+    """Mark the run of a thread as finished in a `BoundedMemorySaver`, if any."""
+    if isinstance(checkpointer, BoundedMemorySaver):
+        checkpointer.release(thread_id)
+
+
+def create_checkpointer(
+    checkpoint_db: Optional[str] = None,
+    use_async: bool = False,
+    max_bytes: Optional[int] = None,
+    ttl: Optional[float] = None,
+) -> BaseCheckpointSaver:
+    """
+    Create the checkpointer backing a planning graph.
+
+    Args:
+        checkpoint_db: Path to a SQLite file storing the checkpoints durably, so
+            runs can be resumed after a crash or restart. Keeps the checkpoints
+            in memory when not set.
+        use_async: Whether the graph runs asynchronously; its SQLite queries
+            then run in threads, see `ThreadedSqliteSaver`
+        max_bytes: Maximum size of the in-memory checkpoints, see
+            `BoundedMemorySaver`; unbounded if neither it nor `ttl` is set
+        ttl: Seconds after which the in-memory checkpoints of a thread are dropped
+
+    Returns:
+        BaseCheckpointSaver: The checkpointer to compile the graph with
+    """
+    if not checkpoint_db:
+        if max_bytes is None and ttl is None:
+            return MemorySaver()
+        return BoundedMemorySaver(max_bytes=max_bytes, ttl=ttl)
+
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+
+        from .sqlite_saver import ThreadedSqliteSaver
+    except ImportError as e:
+        raise ImportError(
+            f"Required package not found: {e}. "
+            f"Please install the SQLite checkpointer "
+            f"(`pip install langgraph-checkpoint-sqlite`)."
+        )
+    # The connection is shared by the threads running the queries of async runs
+    conn = sqlite3.connect(checkpoint_db, check_same_thread=False)
+    return ThreadedSqliteSaver(conn) if use_async else SqliteSaver(conn)
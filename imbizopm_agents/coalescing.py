@@ -0,0 +1,271 @@
+import bisect
+import json
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from .cache import hash_text
+
+# Events of a run kept for the submissions attaching to it late
+DEFAULT_MAX_REPLAY_EVENTS = 2000
+
+
+def normalize_input(text: str) -> str:
+    """Normalize a project idea so trivially different submissions match."""
+    return " ".join(text.split()).casefold()
+
+
+class Flight:
+    """
+    An in-flight run whose events are shared by every identical submission.
+
+    Iterating a flight yields the events of the run kept for replay, then the
+    live ones until it finishes; an error of the run is raised to every
+    subscriber. The replay buffer is bounded: past `max_events`, the older
+    transient events (e.g. streamed tokens, superseded by later updates) are
+    dropped first, then the oldest ones. Once every subscriber stopped
+    iterating before the end, e.g. because its client disconnected, the flight
+    is marked as cancelling and `on_abandoned` is called.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        run_id: Optional[str] = None,
+        on_abandoned: Optional[Callable[[], Any]] = None,
+        lock: Optional[threading.Lock] = None,
+        max_events: Optional[int] = DEFAULT_MAX_REPLAY_EVENTS,
+        is_transient: Optional[Callable[[Any], bool]] = None,
+    ):
+        """
+        Initialize the flight.
+
+        Args:
+            key: Key of the submissions sharing the run
+            run_id: Identifier of the run
+            on_abandoned: Called once every subscriber left before the end
+            lock: Lock guarding the subscribers, shared with the coalescer
+                attaching them
+            max_events: Maximum number of events kept for late subscribers,
+                unbounded if None
+            is_transient: Whether an event can be dropped from the replay
+                buffer before the others
+        """
+        self.key = key
+        self.run_id = run_id
+        self.on_abandoned = on_abandoned
+        self.max_events = max_events
+        self.is_transient = is_transient
+        self.subscribers = 1
+        self.cancelling = False
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.dropped_events = 0
+        # Events kept for replay, with their sequence number in the run
+        self._events: List[Tuple[int, Any]] = []
+        self._sequence = 0
+        self._lock = lock or threading.Lock()
+        self._condition = threading.Condition()
+
+    def _publish(self, start: Callable[[], Iterable[Any]], release: Callable):
+        """Record the events of the run, calling `release` before it is done."""
+        try:
+            for event in start():
+                with self._condition:
+                    self._events.append((self._sequence, event))
+                    self._sequence += 1
+                    if self.max_events is not None and len(self._events) > (
+                        self.max_events
+                    ):
+                        self._compact()
+                    self._condition.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            release()
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    def _compact(self):
+        """Shrink the replay buffer to half its bound, amortizing the copies."""
+        target = self.max_events // 2
+        events = self._events
+        if self.is_transient is not None:
+            recent = len(events) - target // 2
+            events = [
+                (sequence, event)
+                for i, (sequence, event) in enumerate(events)
+                if i >= recent or not self.is_transient(event)
+            ]
+        events = events[max(len(events) - target, 0) :]
+        self.dropped_events += len(self._events) - len(events)
+        self._events = events
+
+    def _pending(self, position: int) -> List[Tuple[int, Any]]:
+        index = bisect.bisect_left(self._events, position, key=lambda e: e[0])
+        return self._events[index:]
+
+    def __iter__(self) -> Iterator[Any]:
+        position = 0
+        finished = False
+        try:
+            while not finished:
+                with self._condition:
+                    while position >= self._sequence and not self.done:
+                        self._condition.wait()
+                    pending = self._pending(position)
+                    if pending and pending[0][0] > position:
+                        logger.warning(
+                            f"Subscriber of run {self.run_id} skipped"
+                            f" {pending[0][0] - position} dropped events"
+                        )
+                    finished = self.done
+                for sequence, event in pending:
+                    position = sequence + 1
+                    yield event
+        finally:
+            if not finished:
+                self._leave()
+        if self.error is not None:
+            raise self.error
+
+    def _join(self) -> bool:
+        """Attach a subscriber, unless the run is being cancelled; holds the lock."""
+        if self.cancelling:
+            return False
+        self.subscribers += 1
+        return True
+
+    def _leave(self):
+        with self._lock:
+            self.subscribers -= 1
+            abandoned = self.subscribers == 0 and not self.done
+            # No submission can attach to the run from now on
+            self.cancelling = self.cancelling or abandoned
+        if abandoned and self.on_abandoned is not None:
+            logger.info(f"All subscribers left run {self.run_id}")
+            self.on_abandoned()
+
+
+class RunCoalescer:
+    """
+    Singleflight coalescing of identical concurrent planning runs.
+
+    The first submission of a key starts the run in a background thread;
+    identical submissions arriving while it is in flight attach to it instead
+    of starting their own, and receive all of its streamed events. The key is
+    released once the run finishes, so later submissions start a new run.
+    """
+
+    def __init__(
+        self,
+        max_events: Optional[int] = DEFAULT_MAX_REPLAY_EVENTS,
+        is_transient: Optional[Callable[[Any], bool]] = None,
+    ):
+        """
+        Initialize the coalescer.
+
+        Args:
+            max_events: Maximum number of events of a run kept for late
+                submissions, see `Flight`
+            is_transient: Whether an event can be dropped from the replay
+                buffer before the others
+        """
+        self.max_events = max_events
+        self.is_transient = is_transient
+        self.started = 0
+        self.coalesced = 0
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        user_input: str, model_name: str, graph_config: Optional[Dict] = None, *extra
+    ) -> str:
+        """
+        Key of a submission, identical for runs that would produce the same plan.
+
+        Args:
+            user_input: The project idea, normalized with `normalize_input`
+            model_name: The model of the run
+            graph_config: The graph configuration of the run
+            extra: Further parts of the key, e.g. a credential fingerprint
+
+        Returns:
+            The digest keying the submission
+        """
+        return hash_text(
+            normalize_input(user_input),
+            model_name,
+            json.dumps(graph_config, sort_keys=True, default=str),
+            *extra,
+        )
+
+    def join(
+        self,
+        key: str,
+        start: Callable[[], Iterable[Any]],
+        run_id: Optional[str] = None,
+        on_abandoned: Optional[Callable[[], Any]] = None,
+    ) -> Flight:
+        """
+        Attach to the in-flight run of a key, or start it.
+
+        Args:
+            key: Key of the submission, see `make_key`
+            start: Function returning the event stream of a new run
+            run_id: Identifier of the run if this submission starts it; the
+                returned flight holds the identifier of the run it attached to
+            on_abandoned: Called if this submission starts the run and every
+                submission attached to it stops iterating, e.g. to cancel it
+
+        Returns:
+            The flight to iterate for the events of the run
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            # A run being cancelled is not joined, the submission starts its own
+            if flight is not None and flight._join():
+                self.coalesced += 1
+                logger.info(f"Attached submission to in-flight run {flight.run_id}")
+                return flight
+            flight = self._flights[key] = Flight(
+                key,
+                run_id,
+                lock=self._lock,
+                max_events=self.max_events,
+                is_transient=self.is_transient,
+            )
+            self.started += 1
+
+        def release():
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+        def abandon():
+            # Later submissions start a new run instead of joining this one
+            release()
+            if on_abandoned is not None:
+                on_abandoned()
+
+        flight.on_abandoned = abandon
+
+        threading.Thread(
+            target=flight._publish,
+            args=(start, release),
+            name=f"flight-{run_id or key[:8]}",
+            daemon=True,
+        ).start()
+        return flight
+
+    def stats(self) -> Dict[str, int]:
+        """Started runs, coalesced submissions and runs in flight."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights),
+            }
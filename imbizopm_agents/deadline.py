@@ -0,0 +1,187 @@
+import functools
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langgraph.graph import END
+from loguru import logger
+
+from .agents.config import AgentState
+from .parallel import edge_targets
+
+# State field holding the time (seconds since the epoch) the run must end by
+DEADLINE_FIELD = "deadline"
+# State field reporting the degraded nodes and why
+DEGRADED_FIELD = "degraded"
+# Expected duration of a node before any of its runs was observed
+DEFAULT_NODE_ESTIMATE = 20.0
+DEFAULT_SMOOTHING = 0.3
+
+
+class DeadlinePolicy:
+    """
+    Degrade the agents of runs falling behind their deadline.
+
+    Runs started with a `deadline` store the time they must end by in the
+    state. Before each node, the remaining time is compared with the expected
+    duration of the shortest path from the node to the end of the graph, from
+    the smoothed durations observed on previous runs. A late node runs on its
+    fallback model (the `fallback_model` of its node configuration, or the
+    policy's), if any, and does not take loop-back edges (the `loop_limits`
+    of the configuration), moving the plan forward in a single pass. Degraded
+    nodes are reported in the state's `degraded` field.
+    """
+
+    def __init__(
+        self,
+        fallback_model: Optional[str] = None,
+        default_estimate: float = DEFAULT_NODE_ESTIMATE,
+        smoothing: float = DEFAULT_SMOOTHING,
+    ):
+        """
+        Initialize the policy.
+
+        Args:
+            fallback_model: Faster model of the late nodes that do not name one
+            default_estimate: Expected seconds of a node never observed
+            smoothing: Weight of the latest duration in the smoothed average
+        """
+        self.fallback_model = fallback_model
+        self.default_estimate = default_estimate
+        self.smoothing = smoothing
+        self.estimates: Dict[str, float] = {}
+        self.edges: Dict[str, Any] = {}
+        self.loop_edges: Dict[str, Dict[str, int]] = {}
+        self.loop_fallbacks: Dict[str, str] = {}
+
+    def wrap_nodes(
+        self,
+        graph_config: Dict,
+        node_functions: Dict[str, Callable],
+        fallback_functions: Dict[str, Callable],
+        use_async: bool = False,
+    ) -> Dict[str, Callable]:
+        """
+        Apply the policy to the node functions of a graph.
+
+        Args:
+            graph_config: The graph configuration
+            node_functions: The function of each node
+            fallback_functions: The function of each node with a fallback model
+            use_async: Whether the node functions are coroutines
+
+        Returns:
+            The wrapped function of each node
+        """
+        self.edges = graph_config["edges"]
+        limits = graph_config.get("loop_limits", {})
+        self.loop_edges = limits.get("edges", {})
+        self.loop_fallbacks = limits.get("fallbacks", {})
+        wrap = self.awrap if use_async else self.wrap
+        return {
+            name: wrap(name, fn, fallback_functions.get(name))
+            for name, fn in node_functions.items()
+        }
+
+    def estimate(self, name: str) -> float:
+        return self.estimates.get(name, self.default_estimate)
+
+    def observe(self, name: str, seconds: float):
+        """Fold the duration of a node run at full quality into its estimate."""
+        previous = self.estimates.get(name)
+        self.estimates[name] = (
+            seconds
+            if previous is None
+            else self.smoothing * seconds + (1 - self.smoothing) * previous
+        )
+
+    def expected_remaining(self, name: str) -> float:
+        """Expected seconds from the start of a node to the end of the graph."""
+        # Relax the costs of the shortest paths, the graph is small
+        costs: Dict[str, float] = {END: 0.0}
+        for _ in range(len(self.edges)):
+            for node, edges in self.edges.items():
+                reachable = [costs[t] for t in edge_targets(edges) if t in costs]
+                if reachable:
+                    costs[node] = min(
+                        costs.get(node, float("inf")),
+                        self.estimate(node) + min(reachable),
+                    )
+        return costs.get(name, self.estimate(name))
+
+    def check(self, name: str, state: AgentState) -> Optional[str]:
+        """
+        Reason to degrade a node about to run, if the run is late.
+
+        Args:
+            name: The node about to run
+            state: The state of the run
+
+        Returns:
+            Why the node is degraded, or None to run it normally
+        """
+        deadline = state.get(DEADLINE_FIELD)
+        if deadline is None:
+            return None
+        remaining = deadline - time.time()
+        expected = self.expected_remaining(name)
+        if remaining >= expected:
+            return None
+        return f"{max(remaining, 0):.0f}s left for an expected {expected:.0f}s"
+
+    def wrap(
+        self, name: str, fn: Callable, fallback_fn: Optional[Callable] = None
+    ) -> Callable:
+        """Apply the policy to a synchronous node function."""
+
+        @functools.wraps(fn)
+        def run(state: AgentState) -> AgentState:
+            reason = self.check(name, state)
+            if reason is None:
+                start = time.perf_counter()
+                result = fn(state)
+                self.observe(name, time.perf_counter() - start)
+                return result
+            return self._degrade(name, reason, (fallback_fn or fn)(state), fallback_fn)
+
+        return run
+
+    def awrap(
+        self, name: str, fn: Callable, fallback_fn: Optional[Callable] = None
+    ) -> Callable:
+        """Apply the policy to an async node function."""
+
+        @functools.wraps(fn)
+        async def arun(state: AgentState) -> AgentState:
+            reason = self.check(name, state)
+            if reason is None:
+                start = time.perf_counter()
+                result = await fn(state)
+                self.observe(name, time.perf_counter() - start)
+                return result
+            result = await (fallback_fn or fn)(state)
+            return self._degrade(name, reason, result, fallback_fn)
+
+        return arun
+
+    def _degrade(
+        self,
+        name: str,
+        reason: str,
+        state: AgentState,
+        fallback_fn: Optional[Callable],
+    ) -> AgentState:
+        changes: List[str] = []
+        if fallback_fn is not None:
+            changes.append("fallback model")
+        target = state.get("forward")
+        if target in self.loop_edges.get(name, {}):
+            state["forward"] = self.loop_fallbacks[name]
+            changes.append(f"{name} -> {state['forward']} instead of {target}")
+        message = f"{', '.join(changes) or 'no cheaper path'} ({reason})"
+        logger.warning(f"Degraded {name}: {message}")
+        state[DEGRADED_FIELD] = {**(state.get(DEGRADED_FIELD) or {}), name: message}
+        return state
+
+    def stats(self) -> Dict[str, Any]:
+        """Current duration estimate of each observed node, in seconds."""
+        return dict(self.estimates)
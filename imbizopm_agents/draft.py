@@ -0,0 +1,266 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from langgraph.graph import END
+from langgraph.graph.graph import CompiledGraph
+from loguru import logger
+
+from .agents.config import AgentRoute
+from .cancellation import CancellationToken
+from .events import UPDATES_EVENT, VALUES_EVENT, apply_delta
+from .graph import (
+    DEFAULT_GRAPH_CONFIG,
+    areplan_project_planning_graph,
+    replan_project_planning_graph,
+    run_project_planning_graph,
+)
+
+# Agents of the fast draft, run once in this order
+DRAFT_NODES = [
+    AgentRoute.ClarifierAgent,
+    AgentRoute.PlannerAgent,
+    AgentRoute.TaskifierAgent,
+    AgentRoute.TimelineAgent,
+    AgentRoute.PMAdapterAgent,
+]
+
+
+def draft_graph_config(
+    graph_config: Dict = DEFAULT_GRAPH_CONFIG, nodes: List[str] = DRAFT_NODES
+) -> Dict:
+    """
+    Configuration of a graph running some agents once, in order, without loops.
+
+    Args:
+        graph_config: The configuration of the full graph
+        nodes: The agents of the draft
+
+    Returns:
+        The configuration of the draft graph
+    """
+    return {
+        **graph_config,
+        "nodes": {name: graph_config["nodes"][name] for name in nodes},
+        "edges": {
+            name: [target] for name, target in zip(nodes, list(nodes[1:]) + [END])
+        },
+        "loop_limits": {},
+        "entry_point": nodes[0],
+    }
+
+
+# Event separating the draft run from its refinement, holding the draft state
+DRAFT_EVENT = "draft"
+
+
+def _skipped_outputs(
+    graph_config: Dict, draft_config: Dict, draft_state: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Outputs of the agents the draft skipped, as edits of the draft state."""
+    return {
+        field: draft_state.get(field)
+        for name, node_config in graph_config["nodes"].items()
+        if name not in draft_config["nodes"]
+        for field in node_config.get("writes", [name])
+    }
+
+
+def refine_project_planning_graph(
+    graph: CompiledGraph,
+    draft_state: Dict[str, Any],
+    graph_config: Dict = DEFAULT_GRAPH_CONFIG,
+    draft_config: Optional[Dict] = None,
+    thread_id: str = "default",
+    recursion_limit: int = 30,
+    print_results: bool = True,
+    stream_tokens: bool = False,
+    stream_updates: bool = False,
+    cancellation: Optional[CancellationToken] = None,
+):
+    """
+    Refine a draft plan with the full graph, including its loops.
+
+    The draft outputs are reused as in `replan_project_planning_graph`: the
+    agents skipped by the draft run, and so do the draft agents reading their
+    outputs (e.g. the PM Adapter); the other draft agents reuse their output
+    once, unless a loop sends the plan back to them.
+
+    Args:
+        graph: The compiled full project planning graph
+        draft_state: The final state of the draft run
+        graph_config: The configuration of the full graph
+        draft_config: The configuration of the draft graph
+        thread_id: A unique identifier for the refinement thread
+        stream_tokens: Whether to also stream the LLM tokens of each agent, as
+            in `run_project_planning_graph`
+        stream_updates: Whether to stream only the fields changed by each node,
+            as in `run_project_planning_graph`
+        cancellation: Optional token cancelling the run, as in
+            `run_project_planning_graph`
+
+    Returns:
+        The state of the graph after each step
+    """
+    draft_config = draft_config or draft_graph_config(graph_config)
+    yield from replan_project_planning_graph(
+        graph,
+        draft_state,
+        _skipped_outputs(graph_config, draft_config, draft_state),
+        graph_config=graph_config,
+        thread_id=thread_id,
+        recursion_limit=recursion_limit,
+        print_results=print_results,
+        stream_tokens=stream_tokens,
+        stream_updates=stream_updates,
+        cancellation=cancellation,
+    )
+
+
+async def arefine_project_planning_graph(
+    graph: CompiledGraph,
+    draft_state: Dict[str, Any],
+    graph_config: Dict = DEFAULT_GRAPH_CONFIG,
+    draft_config: Optional[Dict] = None,
+    thread_id: str = "default",
+    recursion_limit: int = 30,
+    print_results: bool = True,
+    stream_tokens: bool = False,
+    stream_updates: bool = False,
+    cancellation: Optional[CancellationToken] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Async counterpart of `refine_project_planning_graph`.
+
+    Yields:
+        The state of the graph after each step
+    """
+    draft_config = draft_config or draft_graph_config(graph_config)
+    async for event in areplan_project_planning_graph(
+        graph,
+        draft_state,
+        _skipped_outputs(graph_config, draft_config, draft_state),
+        graph_config=graph_config,
+        thread_id=thread_id,
+        recursion_limit=recursion_limit,
+        print_results=print_results,
+        stream_tokens=stream_tokens,
+        stream_updates=stream_updates,
+        cancellation=cancellation,
+    ):
+        yield event
+
+
+def refine_in_background(
+    graph: CompiledGraph,
+    draft_state: Dict[str, Any],
+    on_refined: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    **refine_kwargs,
+) -> "Future[Dict[str, Any]]":
+    """
+    Refine a draft plan in a background thread.
+
+    Args:
+        graph: The compiled full project planning graph
+        draft_state: The final state of the draft run
+        on_refined: Optional callback receiving the refined final state
+        refine_kwargs: Keyword arguments of `refine_project_planning_graph`
+
+    Returns:
+        A future resolved with the refined final state
+    """
+    future: "Future[Dict[str, Any]]" = Future()
+    refine_kwargs = {
+        **refine_kwargs,
+        "print_results": False,
+        "stream_tokens": False,
+        "stream_updates": False,
+    }
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            refined = draft_state
+            for refined in refine_project_planning_graph(
+                graph, draft_state, **refine_kwargs
+            ):
+                pass
+        except BaseException as e:
+            logger.error(f"Refinement of the draft plan failed: {e}")
+            future.set_exception(e)
+            return
+        future.set_result(refined)
+        if on_refined is not None:
+            on_refined(refined)
+
+    threading.Thread(target=run, name="draft-refinement", daemon=True).start()
+    return future
+
+
+def run_draft_planning_graph(
+    graph: CompiledGraph,
+    draft_graph: CompiledGraph,
+    user_input: str,
+    thread_id: str = "default",
+    graph_config: Dict = DEFAULT_GRAPH_CONFIG,
+    draft_config: Optional[Dict] = None,
+    recursion_limit: int = 30,
+    print_results: bool = True,
+    stream_tokens: bool = False,
+    stream_updates: bool = False,
+    cancellation: Optional[CancellationToken] = None,
+):
+    """
+    Run a fast draft of the plan, then refine it with the full graph.
+
+    Events are `(kind, data)` pairs: those of the draft run (as with
+    `stream_tokens`), a `("draft", draft_state)` event once the draft plan is
+    ready, then those of the refinement.
+
+    Args:
+        graph: The compiled full project planning graph
+        draft_graph: The graph compiled from `draft_graph_config`
+        user_input: The user's project idea or request
+        thread_id: Identifier of the refinement thread; the draft runs in
+            `{thread_id}-draft`
+        graph_config: The configuration of the full graph
+        draft_config: The configuration of the draft graph
+        stream_tokens: Whether to also stream the LLM tokens of each agent
+        stream_updates: Whether to stream only the fields changed by each node
+        cancellation: Optional token cancelling the draft and its refinement
+
+    Returns:
+        The draft events, the draft state, then the refinement events
+    """
+    run_kwargs = {
+        "recursion_limit": recursion_limit,
+        "print_results": print_results,
+        "stream_tokens": stream_tokens,
+        "stream_updates": stream_updates,
+        "cancellation": cancellation,
+    }
+    tagged = stream_tokens or stream_updates
+
+    draft_state: Dict[str, Any] = {"input": user_input}
+    for event in run_project_planning_graph(
+        draft_graph, user_input, thread_id=f"{thread_id}-draft", **run_kwargs
+    ):
+        kind, data = event if tagged else (VALUES_EVENT, event)
+        if kind == VALUES_EVENT:
+            draft_state = data
+        elif kind == UPDATES_EVENT:
+            apply_delta(draft_state, data[1])
+        yield kind, data
+    logger.info(f"Draft plan ready, refining it in thread {thread_id}")
+    yield DRAFT_EVENT, draft_state
+
+    for event in refine_project_planning_graph(
+        graph,
+        draft_state,
+        graph_config=graph_config,
+        draft_config=draft_config,
+        thread_id=thread_id,
+        **run_kwargs,
+    ):
+        yield event if tagged else (VALUES_EVENT, event)
@@ -0,0 +1,172 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages.ai import AIMessage, AIMessageChunk
+from langgraph.graph.message import add_messages
+from loguru import logger
+
+from .agents.base_agent import AGENT_METADATA_KEY
+from .graph_config import NodeSuffix
+from .parallel import MERGED_FIELDS, ROUTING_FIELDS
+
+# Event kinds yielded by the run functions when streaming tokens or updates
+VALUES_EVENT = "values"
+UPDATES_EVENT = "updates"
+TOKENS_EVENT = "tokens"
+ITEMS_EVENT = "items"
+RESET_EVENT = "reset"
+
+
+def log_event(event: Dict):
+    messages = event["messages"]
+    if messages:
+        message: AIMessage = messages[-1]
+        logger.info(message.pretty_repr())
+    else:
+        logger.info(event)
+    logger.info(f"Next Direction: {event['forward']}")
+
+
+def log_update(node_name: str, delta: Dict):
+    messages = delta.get("messages")
+    if messages:
+        logger.info(messages[-1].pretty_repr())
+    logger.info(f"{node_name} updated: {', '.join(delta)}")
+    logger.info(f"Next Direction: {delta.get('forward')}")
+
+
+def token_event(chunk: Any, metadata: Dict) -> Optional[Tuple[str, Tuple[str, str]]]:
+    """Token event of a streamed LLM chunk, if an agent generated it."""
+    agent_name = metadata.get(AGENT_METADATA_KEY)
+    if not agent_name or not isinstance(chunk, AIMessageChunk):
+        return None
+    if not isinstance(chunk.content, str) or not chunk.content:
+        return None
+    return TOKENS_EVENT, (agent_name, chunk.content)
+
+
+def state_delta(known: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fields of a node update that changed, recording their new values.
+
+    Nodes return whole states, mostly holding the very objects they received,
+    so unchanged fields are found by identity without comparing their content.
+    Reducer fields (`messages`, `routes`) only hold what the node appended;
+    routing fields are always kept.
+
+    Args:
+        known: The latest value of every non-reducer field, updated in place
+        update: The fields returned by a node
+
+    Returns:
+        The changed fields of the update
+    """
+    delta = {}
+    for field, value in update.items():
+        if field in MERGED_FIELDS:
+            if value:
+                delta[field] = value
+            continue
+        previous = known.get(field)
+        if field in ROUTING_FIELDS or (value is not previous and value != previous):
+            delta[field] = value
+        known[field] = value
+    return delta
+
+
+def apply_delta(state: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply a delta of an updates stream to a state, in place.
+
+    Args:
+        state: The state to update, e.g. the initial state of the run
+        delta: The changed fields of one node
+
+    Returns:
+        The updated state
+    """
+    for field, value in delta.items():
+        if field in MERGED_FIELDS:
+            # The reducer of the graph, as deltas may remove or replace messages
+            state[field] = add_messages(state.get(field) or [], value)
+        else:
+            state[field] = value
+    return state
+
+
+class EventStream:
+    """
+    Convert the raw events of a graph stream into the events of a run.
+
+    By default a run yields the state after each step. With `stream_updates`
+    it yields `("updates", (node_name, delta))` events instead, holding only
+    the fields each node changed, so consumers do work proportional to the
+    change rather than to the whole state. With `stream_tokens` the LLM tokens
+    of each agent are yielded as `("tokens", (agent_name, text))` events, the
+    list items parsed from them as soon as complete (e.g. each task of a task
+    plan) as `("items", (agent_name, field, item))` events, and states as
+    `("values", state)` events. An agent call aborted on a broken structure
+    yields a `("reset", (agent_name,))` event, as its tokens and items so far
+    are discarded before the call is retried.
+    """
+
+    def __init__(
+        self,
+        initial_state: Optional[Dict[str, Any]] = None,
+        print_results: bool = True,
+        stream_tokens: bool = False,
+        stream_updates: bool = False,
+    ):
+        """
+        Initialize the stream.
+
+        Args:
+            initial_state: The state the run starts from, to compute deltas
+            print_results: Whether to log each step
+            stream_tokens: Whether to also yield the tokens of each agent
+            stream_updates: Whether to yield deltas instead of whole states
+        """
+        self.known = dict(initial_state or {})
+        self.print_results = print_results
+        self.stream_tokens = stream_tokens
+        self.stream_updates = stream_updates
+
+    @property
+    def mode(self):
+        """The `stream_mode` to stream the graph with."""
+        mode = UPDATES_EVENT if self.stream_updates else VALUES_EVENT
+        return [mode, "messages", "custom"] if self.stream_tokens else mode
+
+    def convert(self, event: Any) -> List[Any]:
+        """Events of a run for one raw event of the graph stream."""
+        if self.stream_tokens:
+            mode, data = event
+            if mode == "messages":
+                token = token_event(*data)
+                return [token] if token is not None else []
+            if mode == "custom":
+                # Agents write `(agent_name,)` when discarding their output so far
+                return [(RESET_EVENT if len(data) == 1 else ITEMS_EVENT, data)]
+        else:
+            data = event
+
+        if not self.stream_updates:
+            if self.print_results:
+                log_event(data)
+            return [(VALUES_EVENT, data) if self.stream_tokens else data]
+
+        events = []
+        for node, update in data.items():
+            if not isinstance(update, dict):
+                continue
+            node_name = node.removesuffix(NodeSuffix)
+            delta = state_delta(self.known, update)
+            if self.print_results:
+                log_update(node_name, delta)
+            events.append((UPDATES_EVENT, (node_name, delta)))
+        return events
+
+    def convert_snapshot(self, values: Dict[str, Any]) -> List[Any]:
+        """Events of a run for a finished thread, with nothing left to stream."""
+        if self.stream_updates:
+            return []
+        return [(VALUES_EVENT, values) if self.stream_tokens else values]
@@ -1,14 +1,39 @@
-from typing import Dict, Optional, Type
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Type
 
+from langchain.chat_models import init_chat_model
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages.ai import AIMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import END, StateGraph
 from langgraph.graph.graph import CompiledGraph
 from loguru import logger
 
 from .agents.base_agent import AgentState, BaseAgent
+from .cache import ResultCache
+from .cancellation import (
+    CANCELLED_FIELD,
+    CancellationHandler,
+    CancellationToken,
+    RunCancelled,
+)
+from .capabilities import CapabilityProbe
+from .checkpointing import create_checkpointer, release_thread
+from .deadline import DEADLINE_FIELD, DeadlinePolicy
+from .events import EventStream
 from .graph_config import DEFAULT_GRAPH_CONFIG, NodeSuffix
+from .hedging import Hedging
+from .loops import LoopGuard
+from .parallel import (
+    ParallelStage,
+    ParallelStats,
+    edge_targets,
+    find_parallel_chains,
+)
+from .replan import build_replan_state
+from .retention import MessageRetention
+from .speculation import Speculation
+from .workers import WorkerQueue
 
 
 def update_name(name: str):
@@ -17,19 +42,166 @@ def update_name(name: str):
     return name + NodeSuffix
 
 
+def _create_node_llms(
+    graph_config: Dict,
+    default_llm: Optional[BaseChatModel],
+    create_llm: Callable[..., BaseChatModel],
+    model_kwargs: Dict[str, Any],
+    model_key: str = "model",
+    default_model: Optional[str] = None,
+    clients: Optional[Dict[str, BaseChatModel]] = None,
+) -> Dict[str, BaseChatModel]:
+    """Chat model of each node: one shared client per model named in the config."""
+    clients = {} if clients is None else clients
+    node_llms = {}
+    for node_name, node_config in graph_config["nodes"].items():
+        model = node_config.get(model_key) or default_model
+        if not model:
+            node_llms[node_name] = default_llm
+            continue
+        if model not in clients:
+            clients[model] = create_llm(model, **model_kwargs)
+            logger.info(f"Created model '{model}' for the graph nodes")
+        node_llms[node_name] = clients[model]
+    return node_llms
+
+
+def create_node_functions(
+    llm: BaseChatModel,
+    graph_config: Dict,
+    use_structured_output: bool = True,
+    use_async: bool = False,
+    cache: Optional[ResultCache] = None,
+    hedging: Optional[Hedging] = None,
+    create_llm: Callable[..., BaseChatModel] = init_chat_model,
+    model_kwargs: Optional[Dict[str, Any]] = None,
+    deadline_policy: Optional[DeadlinePolicy] = None,
+    capability_probe: Optional[CapabilityProbe] = None,
+) -> Dict[str, Callable]:
+    """
+    Create the agent behind each node of the graph, bounding its routing loops.
+
+    Args:
+        llm: The language model of the agents whose node does not name a `model`
+        graph_config: The graph configuration
+        use_structured_output: Whether the agents request structured output
+        use_async: Whether to return the agents' async `arun` method
+        deadline_policy: Optional policy degrading the nodes of late runs, with
+            agents on the `fallback_model` of each node
+        capability_probe: Optional probe choosing the structured output mode of
+            each agent from its model, instead of `use_structured_output`
+
+    Returns:
+        The function of each node, taking and returning the state
+    """
+    loop_guard = LoopGuard(graph_config)
+    clients: Dict[str, BaseChatModel] = {}
+    node_llms = _create_node_llms(
+        graph_config, llm, create_llm, model_kwargs or {}, clients=clients
+    )
+    fallback_llms = {}
+    if deadline_policy is not None:
+        fallback_llms = _create_node_llms(
+            graph_config,
+            None,
+            create_llm,
+            model_kwargs or {},
+            model_key="fallback_model",
+            default_model=deadline_policy.fallback_model,
+            clients=clients,
+        )
+
+    node_functions = {}
+    fallback_functions = {}
+    for node_name, node_config in graph_config["nodes"].items():
+        agent_class: Type[BaseAgent] = node_config["agent_class"]
+        for functions, node_llm in (
+            (node_functions, node_llms[node_name]),
+            (fallback_functions, fallback_llms.get(node_name)),
+        ):
+            if node_llm is None:
+                continue
+            output_kwargs = {"use_structured_output": use_structured_output}
+            if capability_probe is not None:
+                output_kwargs = capability_probe.structured_output_kwargs(node_llm)
+            agent = agent_class(
+                node_llm,
+                cache=cache,
+                hedging=hedging,
+                capability_probe=capability_probe,
+                **output_kwargs,
+            )
+            functions[node_name] = (
+                loop_guard.awrap(node_name, agent.arun)
+                if use_async
+                else loop_guard.wrap(node_name, agent.run)
+            )
+
+    if deadline_policy is not None:
+        node_functions = deadline_policy.wrap_nodes(
+            graph_config, node_functions, fallback_functions, use_async
+        )
+    return node_functions
+
+
 def create_project_planning_graph(
     llm: BaseChatModel,
     graph_config: Optional[Dict[str, Dict]] = DEFAULT_GRAPH_CONFIG,
     use_checkpointing: bool = True,
     use_structured_output: bool = True,
+    use_async: bool = False,
+    use_parallel: bool = False,
+    parallel_stats: Optional[ParallelStats] = None,
+    checkpoint_db: Optional[str] = None,
+    cache: Optional[ResultCache] = None,
+    message_retention: Optional[MessageRetention] = None,
+    speculation: Optional[Speculation] = None,
+    hedging: Optional[Hedging] = None,
+    create_llm: Callable[..., BaseChatModel] = init_chat_model,
+    model_kwargs: Optional[Dict[str, Any]] = None,
+    worker_queue: Optional[WorkerQueue] = None,
+    worker_model: Optional[str] = None,
+    checkpointer: Optional[BaseCheckpointSaver] = None,
+    deadline_policy: Optional[DeadlinePolicy] = None,
+    capability_probe: Optional[CapabilityProbe] = None,
 ) -> CompiledGraph:
     """
     Create the project planning graph with all agents and their connections.
 
     Args:
-        llm: The language model to use for all agents
+        llm: The language model of the agents whose node does not name a `model`
         graph_config: Optional custom configuration for the graph structure
         use_checkpointing: Whether to use memory checkpointing for the graph
+        use_async: Whether nodes should run the agents' async `arun` method, for
+            graphs driven through `arun_project_planning_graph`
+        use_parallel: Whether to run nodes that do not read each other's outputs
+            (per the `reads`/`writes` of each node in the config) concurrently
+        parallel_stats: Optional counter of the agent calls of the parallel
+            stages, reporting the calls discarded because an earlier agent of
+            the stage routed elsewhere (e.g. the Scoper to the Negotiator)
+        checkpoint_db: Optional SQLite file to persist checkpoints in, so a run can
+            be resumed with `resume_project_planning_graph` after a failure
+        cache: Optional cache of agent outputs; an agent called again with the
+            same input, prompts and model reuses its stored output
+        message_retention: Optional policy bounding the messages kept in the
+            state, so checkpoints and stream events stay small on long runs
+        speculation: Optional speculative execution, starting the likely next
+            agent while the current one runs; its `stats()` report the hit rate
+            and wasted tokens per edge
+        hedging: Optional hedging of the LLM calls of slow agents, duplicating a
+            call that runs past a percentile of the agent's latency history
+        create_llm: Factory of the chat models named by the `model` of nodes
+        model_kwargs: Keyword arguments of `create_llm`, e.g. the API key
+        worker_queue: Optional queue dispatching the nodes to worker processes
+            (see `imbizopm_agents.workers`); `llm` is then not called
+        worker_model: Model name the workers create the default model from
+        checkpointer: Optional checkpointer to use instead of creating one, e.g.
+            a `BoundedMemorySaver` shared by the graphs of a long-running server
+        deadline_policy: Optional policy switching the nodes of runs started with
+            a `deadline` to their fallback model and a single pass once late
+        capability_probe: Optional probe picking the cheapest structured output
+            mode each model supports (see `imbizopm_agents.capabilities`),
+            instead of `use_structured_output`
 
     Returns:
         CompiledGraph: The configured graph ready to process user requests
@@ -41,16 +213,76 @@ def create_project_planning_graph(
     # Create the graph
     workflow = StateGraph(AgentState)
 
-    # Initialize agents dictionary to store references
-    # agents = {}
+    # Create the agent behind each node, or dispatch the nodes to workers
+    if worker_queue is not None:
+        node_functions = worker_queue.node_functions(
+            config,
+            worker_model,
+            use_structured_output,
+            use_async,
+            model_kwargs=model_kwargs,
+            cache=cache,
+            hedging=hedging,
+            deadline_policy=deadline_policy,
+            capability_probe=capability_probe,
+        )
+    else:
+        node_functions = create_node_functions(
+            llm,
+            config,
+            use_structured_output=use_structured_output,
+            use_async=use_async,
+            cache=cache,
+            hedging=hedging,
+            create_llm=create_llm,
+            model_kwargs=model_kwargs,
+            deadline_policy=deadline_policy,
+            capability_probe=capability_probe,
+        )
 
-    # Add all nodes to the graph
-    for node_name, node_config in config["nodes"].items():
-        # Create and add agent nodes
-        agent_class: Type[BaseAgent] = node_config["agent_class"]
-        agent = agent_class(llm, use_structured_output=use_structured_output)
-        # agents[node_name] = agent
-        workflow.add_node(update_name(node_name), agent.run)
+    def add_node(name: str, fn: Callable):
+        """Add a graph node, applying the message retention policy."""
+        if message_retention is not None:
+            fn = (
+                message_retention.awrap(fn) if use_async else message_retention.wrap(fn)
+            )
+        workflow.add_node(name, fn)
+
+    # Group nodes that do not read each other's outputs into concurrent stages
+    stage_of: Dict[str, str] = {}
+    stage_chains: Dict[str, List[str]] = {}
+    if use_parallel:
+        for chain, stages in find_parallel_chains(config):
+            for index, members in enumerate(stages):
+                stage_name = update_name("+".join(members))
+                stage = ParallelStage(
+                    chain,
+                    {name: node_functions[name] for name in members},
+                    {
+                        name: config["nodes"][name].get("writes", [name])
+                        for name in chain
+                    },
+                    is_head=index == 0,
+                    stats=parallel_stats,
+                )
+                add_node(stage_name, stage.arun if use_async else stage.run)
+                stage_of.update({name: stage_name for name in members})
+                stage_chains[stage_name] = chain
+
+    # Start likely successors early, outside of the concurrent stages
+    if speculation is not None:
+        node_functions = speculation.wrap_nodes(
+            config, node_functions, excluded=stage_of, use_async=use_async
+        )
+
+    def resolve(name: str) -> str:
+        """Graph node executing the given agent."""
+        return stage_of.get(name, update_name(name))
+
+    # Add the remaining agents as their own nodes
+    for node_name, node_function in node_functions.items():
+        if node_name not in stage_of:
+            add_node(update_name(node_name), node_function)
 
     # Define the conditional routing logic
     def route_next(state: AgentState) -> str:
@@ -60,34 +292,165 @@ def create_project_planning_graph(
         return update_name(state["forward"])
 
     # Set entry point
-    workflow.set_entry_point(update_name(config["entry_point"]))
+    workflow.set_entry_point(resolve(config["entry_point"]))
 
     # Connect all nodes with conditional routing
     for node_name, edges in config["edges"].items():
-        if len(edges) == 1:
+        if node_name in stage_of:
+            continue
+        elif len(edges) == 1:
             # Direct connection to the next node
-            workflow.add_edge(update_name(node_name), update_name(edges[0]))
+            workflow.add_edge(update_name(node_name), resolve(edges[0]))
         else:
             workflow.add_conditional_edges(
                 node_name + NodeSuffix,
                 route_next,
-                {update_name(k): update_name(v) for k, v in edges.items()},
+                {update_name(k): resolve(v) for k, v in edges.items()},
             )
 
+    # A stage routes on the last agent it committed, which may be any agent
+    # of its chain when pending results are committed along
+    for stage_name, chain in stage_chains.items():
+        workflow.add_conditional_edges(
+            stage_name,
+            route_next,
+            {
+                update_name(target): resolve(target)
+                for name in chain
+                for target in edge_targets(config["edges"][name])
+            },
+        )
+
     # Apply checkpointing if requested
     if use_checkpointing:
-        memory = MemorySaver()
+        memory = checkpointer
+        if memory is None:
+            memory = create_checkpointer(checkpoint_db, use_async=use_async)
         return workflow.compile(checkpointer=memory)
     else:
         return workflow.compile()
 
 
+def _build_run_config(
+    thread_id: str,
+    recursion_limit: int,
+    cancellation: Optional[CancellationToken] = None,
+) -> Dict:
+    config = {
+        "configurable": {"thread_id": thread_id},
+        "recursion_limit": recursion_limit,
+    }
+    if cancellation is not None:
+        config["callbacks"] = [CancellationHandler(cancellation)]
+    return config
+
+
+def _cancelled_update(graph: CompiledGraph, reason: str) -> Optional[Dict]:
+    """State update marking the checkpoint of a cancelled run, if checkpointed."""
+    if graph.checkpointer is None:
+        return None
+    logger.info(f"Marking checkpoint as cancelled: {reason}")
+    return {CANCELLED_FIELD: reason}
+
+
+def _stream_graph(
+    graph: CompiledGraph,
+    graph_input: Optional[Dict],
+    config: Dict,
+    stream: EventStream,
+    cancellation: Optional[CancellationToken],
+):
+    """Stream the converted events of a run, stopping it once cancelled."""
+    events = graph.stream(graph_input, config, stream_mode=stream.mode)
+    try:
+        for event in events:
+            if cancellation is not None:
+                cancellation.raise_if_cancelled()
+            yield from stream.convert(event)
+    except RunCancelled as e:
+        events.close()
+        update = _cancelled_update(graph, e.reason)
+        if update is not None:
+            graph.update_state({"configurable": config["configurable"]}, update)
+        raise
+    finally:
+        # The checkpoints of finished runs can be evicted from a bounded saver
+        release_thread(graph.checkpointer, config["configurable"]["thread_id"])
+
+
+async def _astream_graph(
+    graph: CompiledGraph,
+    graph_input: Optional[Dict],
+    config: Dict,
+    stream: EventStream,
+    cancellation: Optional[CancellationToken],
+) -> AsyncIterator:
+    """Async counterpart of `_stream_graph`, also interrupting pending LLM requests."""
+    task = asyncio.current_task()
+    unregister = None
+    if cancellation is not None:
+        loop = asyncio.get_running_loop()
+        unregister = cancellation.add_callback(
+            lambda: loop.call_soon_threadsafe(task.cancel)
+        )
+
+    events = graph.astream(graph_input, config, stream_mode=stream.mode)
+    reason = None
+    try:
+        try:
+            async for event in events:
+                for converted in stream.convert(event):
+                    yield converted
+        except asyncio.CancelledError:
+            if cancellation is None or not cancellation.cancelled:
+                raise
+            # The task was cancelled by the token, not by its owner
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+            reason = cancellation.reason
+        except RunCancelled as e:
+            reason = e.reason
+        finally:
+            if unregister is not None:
+                unregister()
+            await events.aclose()
+
+        if reason is not None:
+            update = _cancelled_update(graph, reason)
+            if update is not None:
+                await graph.aupdate_state(
+                    {"configurable": config["configurable"]}, update
+                )
+            raise RunCancelled(reason)
+    finally:
+        release_thread(graph.checkpointer, config["configurable"]["thread_id"])
+
+
+def _build_initial_state(user_input: str, deadline: Optional[float] = None) -> Dict:
+    state = {
+        "input": user_input,
+        "messages": [],
+        "forward": update_name(DEFAULT_GRAPH_CONFIG["entry_point"]),
+        "backward": "",
+        "routes": [],
+        "loop_counts": {},
+        "warn_errors": {},
+    }
+    if deadline is not None:
+        state[DEADLINE_FIELD] = time.time() + deadline
+    return state
+
+
 def run_project_planning_graph(
     graph: CompiledGraph,
     user_input: str,
     thread_id: str = "default",
     recursion_limit: int = 5,
     print_results: bool = True,
+    stream_tokens: bool = False,
+    stream_updates: bool = False,
+    cancellation: Optional[CancellationToken] = None,
+    deadline: Optional[float] = None,
 ):
     """
     Run the project planning graph with the given user input.
@@ -96,43 +459,245 @@ def run_project_planning_graph(
         graph: The compiled project planning graph
         user_input: The user's project idea or request
         thread_id: A unique identifier for this conversation thread
+        stream_tokens: Whether to also stream the LLM tokens of each agent as
+            they are generated. Events are then `(kind, data)` pairs: either
+            `("values", state)` or `("tokens", (agent_name, text))`.
+        stream_updates: Whether to stream only the fields changed by each node,
+            as `("updates", (node_name, delta))` events, instead of the state
+        cancellation: Optional token cancelling the run; the pending LLM call
+            is aborted, the checkpoint marked as cancelled and `RunCancelled`
+            raised
+        deadline: Optional budget of the run in seconds; once it falls behind,
+            the graph's `deadline_policy` degrades the remaining nodes and
+            reports them in the `degraded` field of the state
 
     Returns:
         The final state of the graph after processing
     """
-    config = {
-        "configurable": {"thread_id": thread_id},
-        "recursion_limit": recursion_limit,
-    }
+    config = _build_run_config(thread_id, recursion_limit, cancellation)
 
     # Initialize the state with the user input
-    initial_state = {
-        "input": user_input,
-        "messages": [],
-        "forward": update_name(DEFAULT_GRAPH_CONFIG["entry_point"]),
-        "backward": "",
-        "routes": [],
-    }
+    initial_state = _build_initial_state(user_input, deadline)
+    stream = EventStream(initial_state, print_results, stream_tokens, stream_updates)
 
     # Stream the events
-    events = graph.stream(
-        initial_state,
-        config,
-        stream_mode="values",
+    yield from _stream_graph(graph, initial_state, config, stream, cancellation)
+
+
+async def arun_project_planning_graph(
+    graph: CompiledGraph,
+    user_input: str,
+    thread_id: str = "default",
+    recursion_limit: int = 5,
+    print_results: bool = True,
+    stream_tokens: bool = False,
+    stream_updates: bool = False,
+    cancellation: Optional[CancellationToken] = None,
+    deadline: Optional[float] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Async counterpart of `run_project_planning_graph`.
+
+    Streams the same state snapshots through `graph.astream`, so many runs can
+    share one event loop. Build the graph with `use_async=True` so the agents
+    await their LLM calls instead of running in executor threads.
+
+    Args:
+        graph: The compiled project planning graph
+        user_input: The user's project idea or request
+        thread_id: A unique identifier for this conversation thread
+        stream_tokens: Whether to also stream the LLM tokens of each agent, as
+            in `run_project_planning_graph`
+        stream_updates: Whether to stream only the fields changed by each node,
+            as in `run_project_planning_graph`
+        cancellation: Optional token cancelling the run, as in
+            `run_project_planning_graph`
+        deadline: Optional budget of the run in seconds, as in
+            `run_project_planning_graph`
+
+    Yields:
+        The state of the graph after each step
+    """
+    config = _build_run_config(thread_id, recursion_limit, cancellation)
+    initial_state = _build_initial_state(user_input, deadline)
+    stream = EventStream(initial_state, print_results, stream_tokens, stream_updates)
+
+    async for converted in _astream_graph(
+        graph, initial_state, config, stream, cancellation
+    ):
+        yield converted
+
+
+def _check_resumable(snapshot, thread_id: str):
+    if not snapshot.values:
+        raise ValueError(f"No checkpoint found for thread: {thread_id}")
+    if not snapshot.next:
+        logger.info(f"Thread {thread_id} already finished, nothing to resume")
+
+
+def resume_project_planning_graph(
+    graph: CompiledGraph,
+    thread_id: str,
+    recursion_limit: int = 5,
+    print_results: bool = True,
+    stream_tokens: bool = False,
+    stream_updates: bool = False,
+    cancellation: Optional[CancellationToken] = None,
+):
+    """
+    Resume an interrupted run from its last successful node.
+
+    Nodes that finished before the failure are restored from the checkpoint
+    instead of being run again; execution restarts at the node that failed.
+
+    Args:
+        graph: The compiled project planning graph, with checkpointing enabled
+        thread_id: The thread identifier of the run to resume
+        stream_tokens: Whether to also stream the LLM tokens of each agent, as
+            in `run_project_planning_graph`
+        stream_updates: Whether to stream only the fields changed by each node,
+            as in `run_project_planning_graph`
+        cancellation: Optional token cancelling the run, as in
+            `run_project_planning_graph`
+
+    Returns:
+        The state of the graph after each resumed step
+    """
+    config = _build_run_config(thread_id, recursion_limit, cancellation)
+    snapshot = graph.get_state(config)
+    _check_resumable(snapshot, thread_id)
+    stream = EventStream(snapshot.values, print_results, stream_tokens, stream_updates)
+    if not snapshot.next:
+        yield from stream.convert_snapshot(snapshot.values)
+        return
+    if snapshot.values.get(CANCELLED_FIELD):
+        graph.update_state(config, {CANCELLED_FIELD: None})
+
+    yield from _stream_graph(graph, None, config, stream, cancellation)
+
+
+async def aresume_project_planning_graph(
+    graph: CompiledGraph,
+    thread_id: str,
+    recursion_limit: int = 5,
+    print_results: bool = True,
+    stream_tokens: bool = False,
+    stream_updates: bool = False,
+    cancellation: Optional[CancellationToken] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Async counterpart of `resume_project_planning_graph`.
+
+    Args:
+        graph: The compiled project planning graph, with checkpointing enabled
+        thread_id: The thread identifier of the run to resume
+        stream_tokens: Whether to also stream the LLM tokens of each agent, as
+            in `run_project_planning_graph`
+        stream_updates: Whether to stream only the fields changed by each node,
+            as in `run_project_planning_graph`
+        cancellation: Optional token cancelling the run, as in
+            `run_project_planning_graph`
+
+    Yields:
+        The state of the graph after each resumed step
+    """
+    config = _build_run_config(thread_id, recursion_limit, cancellation)
+    snapshot = await graph.aget_state(config)
+    _check_resumable(snapshot, thread_id)
+    stream = EventStream(snapshot.values, print_results, stream_tokens, stream_updates)
+    if not snapshot.next:
+        for converted in stream.convert_snapshot(snapshot.values):
+            yield converted
+        return
+    if snapshot.values.get(CANCELLED_FIELD):
+        await graph.aupdate_state(config, {CANCELLED_FIELD: None})
+
+    async for converted in _astream_graph(graph, None, config, stream, cancellation):
+        yield converted
+
+
+def replan_project_planning_graph(
+    graph: CompiledGraph,
+    state: Dict[str, Any],
+    edits: Dict[str, Any],
+    graph_config: Dict[str, Dict] = DEFAULT_GRAPH_CONFIG,
+    thread_id: str = "default",
+    recursion_limit: int = 5,
+    print_results: bool = True,
+    stream_tokens: bool = False,
+    stream_updates: bool = False,
+    cancellation: Optional[CancellationToken] = None,
+):
+    """
+    Re-plan a finished run after editing some fields of its state.
+
+    Only the agents consuming an edited field, directly or through other
+    invalidated agents (per the `reads`/`writes` of each node in the config),
+    call the LLM again; the others reuse their stored output.
+
+    Args:
+        graph: The compiled project planning graph
+        state: The final state of the previous run
+        edits: New values of some state fields, e.g. an edited agent output
+        graph_config: The configuration the graph was built from
+        thread_id: A unique identifier for the new conversation thread
+        stream_tokens: Whether to also stream the LLM tokens of each agent, as
+            in `run_project_planning_graph`
+        stream_updates: Whether to stream only the fields changed by each node,
+            as in `run_project_planning_graph`
+        cancellation: Optional token cancelling the run, as in
+            `run_project_planning_graph`
+
+    Returns:
+        The state of the graph after each step
+    """
+    config = _build_run_config(thread_id, recursion_limit, cancellation)
+    initial_state = build_replan_state(
+        graph_config, state, edits, _build_initial_state(state["input"])
+    )
+    stream = EventStream(initial_state, print_results, stream_tokens, stream_updates)
+
+    yield from _stream_graph(graph, initial_state, config, stream, cancellation)
+
+
+async def areplan_project_planning_graph(
+    graph: CompiledGraph,
+    state: Dict[str, Any],
+    edits: Dict[str, Any],
+    graph_config: Dict[str, Dict] = DEFAULT_GRAPH_CONFIG,
+    thread_id: str = "default",
+    recursion_limit: int = 5,
+    print_results: bool = True,
+    stream_tokens: bool = False,
+    stream_updates: bool = False,
+    cancellation: Optional[CancellationToken] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Async counterpart of `replan_project_planning_graph`.
+
+    Args:
+        graph: The compiled project planning graph
+        state: The final state of the previous run
+        edits: New values of some state fields, e.g. an edited agent output
+        graph_config: The configuration the graph was built from
+        thread_id: A unique identifier for the new conversation thread
+        stream_tokens: Whether to also stream the LLM tokens of each agent, as
+            in `run_project_planning_graph`
+        stream_updates: Whether to stream only the fields changed by each node,
+            as in `run_project_planning_graph`
+        cancellation: Optional token cancelling the run, as in
+            `run_project_planning_graph`
+
+    Yields:
+        The state of the graph after each step
+    """
+    config = _build_run_config(thread_id, recursion_limit, cancellation)
+    initial_state = build_replan_state(
+        graph_config, state, edits, _build_initial_state(state["input"])
     )
+    stream = EventStream(initial_state, print_results, stream_tokens, stream_updates)
 
-    # results = []
-    for event in events:
-        yield event
-        if print_results:
-            messages = event["messages"]
-            if messages:
-                message: AIMessage = messages[-1]
-                logger.info(message.pretty_repr())
-            else:
-                logger.info(event)
-            logger.info(f"Next Direction: {event['forward']}")
-            # Store each state update
-            # results.append(event)
-
-    # return results
+    async for converted in _astream_graph(
+        graph, initial_state, config, stream, cancellation
+    ):
+        yield converted
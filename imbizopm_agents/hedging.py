@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from loguru import logger
+
+DEFAULT_MIN_SAMPLES = 5
+DEFAULT_WINDOW = 100
+
+T = TypeVar("T")
+
+
+class Hedging:
+    """
+    Hedged LLM requests for agents with a heavy latency tail.
+
+    The latency of each hedged agent's calls is recorded. Once enough calls
+    were seen, a call still running after the configured percentile of that
+    history gets a duplicate request, to the secondary model if one is set.
+    The first request producing a valid parsed result wins and the other is
+    cancelled (for threads, its result is ignored as it cannot be stopped).
+    """
+
+    def __init__(
+        self,
+        percentiles: Dict[str, float],
+        secondary_llm: Optional[BaseChatModel] = None,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+        window: int = DEFAULT_WINDOW,
+    ):
+        """
+        Initialize the hedging policy.
+
+        Args:
+            percentiles: Latency percentile (0 to 1) after which a duplicate
+                request is sent, per agent name; other agents are not hedged
+            secondary_llm: Model receiving the duplicate requests; the agent's
+                own model when not set
+            min_samples: Calls of an agent observed before hedging it
+            window: Number of recent calls the latency history keeps
+        """
+        invalid = {name: p for name, p in percentiles.items() if not 0 < p <= 1}
+        if invalid:
+            raise ValueError(f"Hedging percentiles must be in (0, 1]: {invalid}")
+        self.percentiles = percentiles
+        self.secondary_llm = secondary_llm
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "hedged": 0, "hedge_wins": 0}
+        )
+
+    def applies(self, name: str) -> bool:
+        """Whether the calls of an agent are hedged."""
+        return name in self.percentiles
+
+    def delay(self, name: str) -> Optional[float]:
+        """Seconds after which a call of `name` is hedged, once enough calls were seen."""
+        with self._lock:
+            latencies = sorted(self._latencies[name])
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(len(latencies) - 1, int(self.percentiles[name] * len(latencies)))
+        return latencies[index]
+
+    def _observe(self, name: str, start: float, hedged: bool, hedge_won: bool):
+        with self._lock:
+            self._latencies[name].append(time.perf_counter() - start)
+            stats = self._stats[name]
+            stats["calls"] += 1
+            stats["hedged"] += hedged
+            stats["hedge_wins"] += hedge_won
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Calls, fired hedges and hedges that won, per agent."""
+        with self._lock:
+            stats = {name: dict(counts) for name, counts in self._stats.items()}
+        for counts in stats.values():
+            counts["hedge_rate"] = counts["hedged"] / counts["calls"]
+            counts["hedge_win_rate"] = (
+                counts["hedge_wins"] / counts["hedged"] if counts["hedged"] else 0.0
+            )
+        return stats
+
+    def run(self, name: str, primary: Callable[[], T], hedge: Callable[[], T]) -> T:
+        """
+        Run a call of an agent, hedging it when it runs late.
+
+        Args:
+            name: The agent making the call
+            primary: The call
+            hedge: The duplicate call, sent when the primary one runs late
+
+        Returns:
+            The result of the first call that succeeded
+        """
+        start = time.perf_counter()
+        delay = self.delay(name)
+        if delay is None:
+            result = primary()
+            self._observe(name, start, hedged=False, hedge_won=False)
+            return result
+
+        executor = ContextThreadPoolExecutor(max_workers=2)
+        try:
+            first = executor.submit(primary)
+            pending = {first}
+            done, _ = wait(pending, timeout=delay)
+            hedged = not done
+            if hedged:
+                logger.info(f"Hedging {name} after {delay:.1f}s")
+                pending.add(executor.submit(hedge))
+            error = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        self._observe(name, start, hedged, future is not first)
+                        return future.result()
+                    error = future.exception()
+                    logger.warning(f"Hedged call of {name} failed: {error}")
+            raise error
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def arun(
+        self,
+        name: str,
+        primary: Callable[[], Awaitable[T]],
+        hedge: Callable[[], Awaitable[T]],
+    ) -> T:
+        """Async counterpart of `run`, cancelling the losing request."""
+        start = time.perf_counter()
+        delay = self.delay(name)
+        if delay is None:
+            result = await primary()
+            self._observe(name, start, hedged=False, hedge_won=False)
+            return result
+
+        first = asyncio.ensure_future(primary())
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            hedged = not done
+            if hedged:
+                logger.info(f"Hedging {name} after {delay:.1f}s")
+                pending.add(asyncio.ensure_future(hedge()))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        self._observe(name, start, hedged, task is not first)
+                        return task.result()
+                    error = task.exception()
+                    logger.warning(f"Hedged call of {name} failed: {error}")
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -1,24 +1,43 @@
-from typing import Any, Dict, Generator, List, Optional, Tuple
+import time
+import uuid
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple
 
 import gradio as gr
-from langchain.chat_models import init_chat_model
 from langgraph.graph.graph import CompiledGraph
 from loguru import logger
 
 # Imports
 from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.cancellation import RunCancelled, RunRegistry
+from imbizopm_agents.capabilities import DEFAULT_CAPABILITIES_PATH, CapabilityProbe
+from imbizopm_agents.checkpointing import (
+    DEFAULT_CHECKPOINT_TTL,
+    DEFAULT_MAX_CHECKPOINT_BYTES,
+    BoundedMemorySaver,
+)
+from imbizopm_agents.coalescing import RunCoalescer
+from imbizopm_agents.draft import (
+    DRAFT_EVENT,
+    draft_graph_config,
+    run_draft_planning_graph,
+)
+from imbizopm_agents.events import ITEMS_EVENT, RESET_EVENT, TOKENS_EVENT
 from imbizopm_agents.graph import (
-    create_project_planning_graph,
+    DEFAULT_GRAPH_CONFIG,
+    resume_project_planning_graph,
     run_project_planning_graph,
 )
-from imbizopm_agents.project_refined import (
-    get_interface as refine_project_idea,
-)
+from imbizopm_agents.pool import GraphPool, credential_fingerprint
+from imbizopm_agents.project_refined import get_interface as refine_project_idea
 from imbizopm_agents.prompts.utils import dumps_to_yaml
+from imbizopm_agents.retention import is_retention_marker
+from imbizopm_agents.workers import WorkerQueue
 
 # Configuration
 DEFAULT_MODEL = "ollama:cogito:32b"
 LOGO_PATH = "examples/image.png"
+# Minimum delay between two UI refreshes while tokens are streaming
+TOKEN_UPDATE_INTERVAL = 0.2
 
 # Agent tabs to display in the UI
 AGENT_TABS = [
@@ -37,7 +56,53 @@ AGENT_TABS = [
 class PlannerUI:
     """Handles the UI components and rendering for the project planner."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        checkpoint_db: Optional[str] = None,
+        worker_queue: Optional[str] = None,
+        checkpoint_max_bytes: Optional[int] = DEFAULT_MAX_CHECKPOINT_BYTES,
+        checkpoint_ttl: Optional[float] = DEFAULT_CHECKPOINT_TTL,
+        capabilities_path: Optional[str] = None,
+    ):
+        self.checkpoint_db = checkpoint_db
+        # Without a database, the runs of all models share one bounded store, so
+        # the server does not grow for as long as it stays up
+        self.checkpointer = (
+            None
+            if checkpoint_db
+            else BoundedMemorySaver(max_bytes=checkpoint_max_bytes, ttl=checkpoint_ttl)
+        )
+        self.graph_pool = GraphPool(
+            graph_kwargs={
+                "use_checkpointing": True,
+                "use_structured_output": False,
+                # Opt-in: agents use the cheapest structured output mode of
+                # their model instead of answering in text
+                "capability_probe": (
+                    CapabilityProbe(capabilities_path) if capabilities_path else None
+                ),
+                "checkpoint_db": checkpoint_db,
+                "checkpointer": self.checkpointer,
+                # Agents run in worker processes, this one only orchestrates
+                "worker_queue": WorkerQueue(worker_queue) if worker_queue else None,
+            }
+        )
+        # Graphs of the fast drafts, refined by the graphs above
+        self.draft_pool = GraphPool(
+            graph_kwargs={
+                **self.graph_pool.graph_kwargs,
+                "graph_config": draft_graph_config(DEFAULT_GRAPH_CONFIG),
+            }
+        )
+        # Identical submissions made while a run is in flight attach to it
+        # Streamed tokens are superseded by the updates of their agent, so
+        # they are the first events dropped from the replay of late clients
+        self.coalescer = RunCoalescer(
+            is_transient=lambda event: event[0]
+            in (TOKENS_EVENT, ITEMS_EVENT, RESET_EVENT)
+        )
+        # Cancellation tokens of the runs in flight, see `cancel_run`
+        self.runs = RunRegistry()
         self.agent_outputs = {}
         self.status_output = None
         self.route_info_output = None
@@ -80,12 +145,14 @@ class PlannerUI:
             self._create_agent_tabs()
 
             # Connect the submit button to the processing function
-            input_area["submit_button"].click(
+            submit_event = input_area["submit_button"].click(
                 fn=self.process_input,
                 inputs=[
                     input_area["input_textbox"],
                     model_controls["model_name"],
                     model_controls["api_key"],
+                    model_controls["resume_thread_id"],
+                    model_controls["draft_first"],
                 ],
                 outputs=[
                     self.status_output,
@@ -94,6 +161,13 @@ class PlannerUI:
                 ]
                 + list(self.agent_outputs.values()),
             )
+            # Stopping closes the run's stream, which cancels the run unless
+            # another client is attached to it
+            input_area["stop_button"].click(
+                fn=lambda: gr.update(value="### Status: ⏹ Run stopped"),
+                outputs=[self.status_output],
+                cancels=[submit_event],
+            )
 
             # Add examples section
             with gr.Accordion("Examples", open=True):
@@ -141,8 +215,18 @@ class PlannerUI:
             variant="primary",
             elem_id="submit-button",
         )
+        stop_button = gr.Button(
+            "⏹ Stop",
+            scale=1,
+            variant="stop",
+            elem_id="stop-button",
+        )
 
-        return {"input_textbox": input_textbox, "submit_button": submit_button}
+        return {
+            "input_textbox": input_textbox,
+            "submit_button": submit_button,
+            "stop_button": stop_button,
+        }
 
     def _create_model_controls(self) -> Dict:
         """Create the model configuration controls."""
@@ -161,7 +245,26 @@ class PlannerUI:
             elem_id="api-key",
         )
 
-        return {"model_name": model_name, "api_key": api_key}
+        resume_thread_id = gr.Textbox(
+            label="🔁 Resume Run ID (Optional)",
+            placeholder="Run ID of a failed run to resume from its last successful step",
+            visible=self.checkpoint_db is not None,
+            scale=2,
+            elem_id="resume-thread-id",
+        )
+
+        draft_first = gr.Checkbox(
+            label="⚡ Draft First",
+            info="Show a quick draft plan, then refine it in the background",
+            elem_id="draft-first",
+        )
+
+        return {
+            "model_name": model_name,
+            "api_key": api_key,
+            "resume_thread_id": resume_thread_id,
+            "draft_first": draft_first,
+        }
 
     def _create_logo_area(self):
         """Create the logo area of the UI."""
@@ -185,7 +288,12 @@ class PlannerUI:
                     )
 
     def process_input(
-        self, user_input: str, model_name: str, api_key: str
+        self,
+        user_input: str,
+        model_name: str,
+        api_key: str,
+        resume_thread_id: str = "",
+        draft_first: bool = False,
     ) -> Generator[Dict[Any, Any], None, None]:
         """
         Process the user input and run the project planning pipeline.
@@ -194,6 +302,8 @@ class PlannerUI:
             user_input: The project idea description
             model_name: The name of the model to use
             api_key: Optional API key for the model
+            resume_thread_id: Optional run ID to resume instead of starting a new run
+            draft_first: Whether to show a fast draft plan before refining it
 
         Yields:
             Dictionary of component updates for Gradio
@@ -201,20 +311,28 @@ class PlannerUI:
         # Clean inputs
         user_input = user_input.strip()
         model_name = model_name.strip()
+        resume_thread_id = (resume_thread_id or "").strip()
 
         # Input validation
-        validation_result = self._validate_inputs(user_input, model_name)
+        validation_result = self._validate_inputs(
+            user_input, model_name, resume=bool(resume_thread_id)
+        )
         if validation_result:
             yield validation_result
             return
 
         # Initialize process tracking
-        thread_id = f"run-{hash(user_input + model_name)}"
-        logger.info(f"Started planning run: {thread_id} with model {model_name}")
+        thread_id = resume_thread_id or f"run-{uuid.uuid4().hex}"
 
         # Initialize model and graph
+        draft_first = draft_first and not resume_thread_id
         try:
             llm, graph = self._initialize_model_and_graph(model_name, api_key)
+            draft_graph = None
+            if draft_first:
+                _, draft_graph = self._initialize_model_and_graph(
+                    model_name, api_key, draft=True
+                )
             logger.info(
                 f"Initialized model '{model_name}' and graph for run {thread_id}"
             )
@@ -222,22 +340,57 @@ class PlannerUI:
             yield self._create_error_state("initialization", str(e))
             return
 
+        # Runs go through the coalescer, which cancels them once every client
+        # attached to them disconnected or pressed stop
+        stream = self._stream_run(
+            graph,
+            user_input,
+            thread_id,
+            resume=bool(resume_thread_id),
+            draft_graph=draft_graph,
+        )
+        if resume_thread_id:
+            key = f"resume:{thread_id}"
+        else:
+            pool = self.draft_pool if draft_first else self.graph_pool
+            graph_config = pool.graph_kwargs.get("graph_config", DEFAULT_GRAPH_CONFIG)
+            key = RunCoalescer.make_key(
+                user_input, model_name, graph_config, credential_fingerprint(api_key)
+            )
+        events = self.coalescer.join(
+            key,
+            lambda: stream,
+            run_id=thread_id,
+            on_abandoned=lambda run_id=thread_id: self.cancel_run(
+                run_id, "All clients left"
+            ),
+        )
+        thread_id = events.run_id
+        logger.info(f"Started planning run: {thread_id} with model {model_name}")
+
         # Start processing - initial state update
-        current_updates = self._create_processing_state()
+        current_updates = self._create_processing_state(thread_id)
         yield current_updates
 
         # Run the graph and process events
         try:
-            yield from self._run_planning_graph(graph, user_input, thread_id)
+            yield from self._run_planning_graph(events, thread_id)
+        except RunCancelled as e:
+            logger.info(f"Cancelled run {thread_id}: {e.reason}")
+            yield {
+                self.status_output: gr.update(
+                    value=f"### Status: ⏹ Run cancelled ({e.reason})"
+                )
+            }
         except Exception as e:
             logger.error(f"Graph error during run {thread_id}: {e}", exc_info=True)
             yield self._create_error_state("execution", str(e))
 
     def _validate_inputs(
-        self, user_input: str, model_name: str
+        self, user_input: str, model_name: str, resume: bool = False
     ) -> Optional[Dict[Any, Any]]:
         """Validate user inputs and return error state if invalid."""
-        if not user_input:
+        if not user_input and not resume:
             return self._create_error_state(
                 "input", "Input cannot be empty. Please provide a project idea."
             )
@@ -248,21 +401,12 @@ class PlannerUI:
         return None
 
     def _initialize_model_and_graph(
-        self, model_name: str, api_key: str
+        self, model_name: str, api_key: str, draft: bool = False
     ) -> Tuple[Any, CompiledGraph]:
-        """Initialize the LLM and planning graph."""
+        """Get the LLM and planning graph, reusing warm ones from the pool."""
         try:
-            # Prepare model initialization
-            model_kwargs = {}
-            if api_key:
-                model_kwargs["api_key"] = api_key
-
-            # Initialize model and graph
-            llm = init_chat_model(model_name, **model_kwargs)
-            graph = create_project_planning_graph(
-                llm, use_checkpointing=True, use_structured_output=False
-            )
-            return llm, graph
+            pool = self.draft_pool if draft else self.graph_pool
+            return pool.get(model_name, api_key)
         except ImportError as e:
             error_msg = (
                 f"Required package not found: {e}. "
@@ -275,11 +419,12 @@ class PlannerUI:
             logger.error(f"Error initializing model/graph: {e}", exc_info=True)
             raise
 
-    def _create_processing_state(self) -> Dict[Any, Any]:
+    def _create_processing_state(self, thread_id: str = "") -> Dict[Any, Any]:
         """Create the initial processing state updates."""
+        run_info = f" (Run ID: `{thread_id}`)" if thread_id else ""
         return {
             self.status_output: gr.update(
-                value="### Status: ⏳ Running agent pipeline..."
+                value=f"### Status: ⏳ Running agent pipeline...{run_info}"
             ),
             self.route_info_output: gr.update(value="Execution path starting..."),
             **{
@@ -309,35 +454,149 @@ class PlannerUI:
             self.message_trace_output: gr.update(value="[]"),
         }
 
+    def _stream_run(
+        self,
+        graph: CompiledGraph,
+        user_input: str,
+        thread_id: str,
+        resume: bool = False,
+        draft_graph: Optional[CompiledGraph] = None,
+    ) -> Generator[Tuple[str, Any], None, None]:
+        """Stream the events of a run, or continue a failed run from its checkpoint."""
+        cancellation = self.runs.register(thread_id)
+        try:
+            if draft_graph is not None:
+                yield from run_draft_planning_graph(
+                    graph,
+                    draft_graph,
+                    user_input,
+                    thread_id=thread_id,
+                    graph_config=self.graph_pool.graph_kwargs.get(
+                        "graph_config", DEFAULT_GRAPH_CONFIG
+                    ),
+                    draft_config=self.draft_pool.graph_kwargs["graph_config"],
+                    print_results=False,
+                    stream_tokens=True,
+                    stream_updates=True,
+                    cancellation=cancellation,
+                )
+            elif resume:
+                yield from resume_project_planning_graph(
+                    graph,
+                    thread_id,
+                    recursion_limit=30,
+                    print_results=False,
+                    stream_tokens=True,
+                    stream_updates=True,
+                    cancellation=cancellation,
+                )
+            else:
+                yield from run_project_planning_graph(
+                    graph,
+                    user_input=user_input,
+                    thread_id=thread_id,
+                    recursion_limit=30,
+                    print_results=False,
+                    stream_tokens=True,
+                    stream_updates=True,
+                    cancellation=cancellation,
+                )
+        finally:
+            self.runs.release(thread_id)
+
+    def cancel_run(self, run_id: str, reason: str = "Stopped by the user") -> bool:
+        """
+        Cancel a run in flight, aborting the LLM call of its current agent.
+
+        Args:
+            run_id: The ID of the run
+            reason: Why the run is cancelled, recorded in its checkpoint
+
+        Returns:
+            Whether a run with this ID was in flight
+        """
+        return self.runs.cancel(run_id, reason)
+
     def _run_planning_graph(
-        self, graph: CompiledGraph, user_input: str, thread_id: str
+        self, events: Iterable[Tuple[str, Any]], thread_id: str
     ) -> Generator[Dict[Any, Any], None, None]:
-        """Run the planning graph and yield updates."""
+        """Render the events of a run and yield updates."""
         execution_path_history = []
-        all_messages_dict = []
-        current_updates = self._create_processing_state()
-
-        # Run the graph
-        for event in run_project_planning_graph(
-            graph,
-            user_input=user_input,
-            thread_id=thread_id,
-            recursion_limit=30,
-            print_results=False,
-        ):
-            # Extract event information
-            backward_node = event.get("backward")
-            forward_node = event.get("forward")
-            messages = event.get("messages", [])
-
-            # Process agent output
-            if backward_node and backward_node in self.agent_outputs:
-                agent_data = event.get(backward_node)
+        messages_yaml = ""
+        current_updates = self._create_processing_state(thread_id)
+
+        # Text generated so far by the agents still running
+        live_outputs: Dict[str, str] = {}
+        # Items of their output already complete, e.g. each finished task
+        live_items: Dict[str, List[Tuple[str, Any]]] = {}
+        # Latest formatted output of every agent that produced one
+        formatted_outputs: Dict[str, str] = {}
+        last_refresh = 0.0
+
+        for kind, event in events:
+            # The draft plan is rendered, the refinement goes on
+            if kind == DRAFT_EVENT:
+                current_updates[self.status_output] = gr.update(
+                    value="### Status: 📝 Draft plan ready, refining it..."
+                )
+                yield current_updates
+                continue
+
+            # An aborted call is retried, so its text so far is dropped
+            if kind == RESET_EVENT:
+                agent_name = event[0]
+                if agent_name in self.agent_outputs:
+                    live_outputs.pop(agent_name, None)
+                    live_items.pop(agent_name, None)
+                    current_updates[self.agent_outputs[agent_name]] = gr.update(
+                        value=self._format_live_output(agent_name, "")
+                    )
+                    yield current_updates
+                continue
+
+            # Render the tokens live in the tab of the agent generating them
+            if kind in (TOKENS_EVENT, ITEMS_EVENT):
+                agent_name, *data = event
+                if agent_name not in self.agent_outputs:
+                    continue
+                if kind == ITEMS_EVENT:
+                    live_items.setdefault(agent_name, []).append(tuple(data))
+                else:
+                    text = live_outputs.get(agent_name, "") + data[0]
+                    live_outputs[agent_name] = text
+                if time.monotonic() - last_refresh < TOKEN_UPDATE_INTERVAL:
+                    continue
+                last_refresh = time.monotonic()
+                for name, live_text in live_outputs.items():
+                    current_updates[self.agent_outputs[name]] = gr.update(
+                        value=self._format_live_output(
+                            name, live_text, live_items.get(name, [])
+                        )
+                    )
+                yield current_updates
+                continue
+
+            # Updates only hold the fields the node changed
+            _, delta = event
+            backward_node = delta.get("backward")
+            forward_node = delta.get("forward")
+            messages = delta.get("messages", [])
+
+            # Process the outputs the node changed
+            for agent_name, md in self.agent_outputs.items():
+                agent_data = delta.get(agent_name)
                 if agent_data:
-                    formatted = self._format_agent_output(backward_node, agent_data)
-                    current_updates[self.agent_outputs[backward_node]] = gr.update(
-                        value=formatted
+                    formatted_outputs[agent_name] = self._format_agent_output(
+                        agent_name, agent_data
                     )
+                # An agent that finished with an unchanged output leaves live text
+                if agent_name in delta or agent_name == backward_node:
+                    live_outputs.pop(agent_name, None)
+                    live_items.pop(agent_name, None)
+                    if agent_name in formatted_outputs:
+                        current_updates[md] = gr.update(
+                            value=formatted_outputs[agent_name]
+                        )
 
             # Update execution path
             if backward_node:
@@ -347,11 +606,11 @@ class PlannerUI:
                     value="<br>".join(execution_path_history)
                 )
 
-            # Update message trace
+            # Update message trace with the new messages only
+            messages = [msg for msg in messages if not is_retention_marker(msg)]
             if messages:
                 new_message_dicts = [msg.dict() for msg in messages]
-                all_messages_dict.extend(new_message_dicts)
-                messages_yaml = dumps_to_yaml(all_messages_dict, add_type=False)
+                messages_yaml += dumps_to_yaml(new_message_dicts, add_type=False)
                 current_updates[self.message_trace_output] = gr.update(
                     value=messages_yaml
                 )
@@ -364,12 +623,27 @@ class PlannerUI:
         )
 
         logger.info(f"Finished planning run: {thread_id}")
+        if self.checkpointer is not None:
+            logger.info(f"Checkpoint memory: {self.checkpointer.stats()}")
         yield current_updates
 
     def _format_agent_output(self, agent_name: str, agent_data: Any) -> str:
         """Format agent output for display."""
         return f"### {agent_name}\n\n{dumps_to_yaml(agent_data, add_type=False)}\n"
 
+    def _format_live_output(
+        self, agent_name: str, text: str, items: List[Tuple[str, Any]] = ()
+    ) -> str:
+        """Format the partial output of a running agent for display."""
+        completed, previous_field = "", None
+        for field, item in items:
+            if field != previous_field:
+                completed += f"#### {field.replace('_', ' ').title()}\n"
+                previous_field = field
+            completed += f"```yaml\n{dumps_to_yaml(item.model_dump())}```\n"
+        # A longer fence keeps the code blocks written by the model inside it
+        return f"### {agent_name}\n*Generating...*\n\n{completed}````\n{text}\n````\n"
+
     def _format_execution_step(
         self, backward_node: str, forward_node: Optional[str]
     ) -> str:
@@ -378,7 +652,16 @@ class PlannerUI:
         return f"📍 **Executed:** `{backward_node}` → **Next:** `{next_node}`"
 
 
-def main(share: bool = False, server_name: str = "0.0.0.0", server_port: int = 7860):
+def main(
+    share: bool = False,
+    server_name: str = "0.0.0.0",
+    server_port: int = 7860,
+    checkpoint_db: Optional[str] = None,
+    worker_queue: Optional[str] = None,
+    checkpoint_max_bytes: Optional[int] = DEFAULT_MAX_CHECKPOINT_BYTES,
+    checkpoint_ttl: Optional[float] = DEFAULT_CHECKPOINT_TTL,
+    capabilities_path: Optional[str] = None,
+):
     """
     Main function to launch the Gradio interface.
 
@@ -386,9 +669,22 @@ def main(share: bool = False, server_name: str = "0.0.0.0", server_port: int = 7
         share: Whether to create a public shareable link
         server_name: Server address to bind to
         server_port: Server port to bind to
+        checkpoint_db: Optional SQLite file to persist runs in, enabling resume
+        worker_queue: Optional SQLite queue dispatching the agents to workers
+            started with `imbizopm plan-worker`
+        checkpoint_max_bytes: Maximum size of the in-memory checkpoints of runs
+        checkpoint_ttl: Seconds after which the checkpoints of a run are dropped
+        capabilities_path: Optional file caching the structured output modes of
+            each model, probed on first use; None to answer in text with every model
     """
     # Initialize and create the UI
-    planner_ui = PlannerUI()
+    planner_ui = PlannerUI(
+        checkpoint_db=checkpoint_db,
+        worker_queue=worker_queue,
+        checkpoint_max_bytes=checkpoint_max_bytes,
+        checkpoint_ttl=checkpoint_ttl,
+        capabilities_path=capabilities_path,
+    )
     planner = planner_ui.create_interface()
     refined = refine_project_idea()
 
@@ -422,6 +718,43 @@ if __name__ == "__main__":
     parser.add_argument(
         "--server-port", type=int, default=7860, help="Server port to bind to"
     )
+    parser.add_argument(
+        "--checkpoint-db", help="SQLite file to persist runs in, enabling resume"
+    )
+
+    parser.add_argument(
+        "--worker-queue",
+        help="SQLite queue dispatching the agents to `imbizopm plan-worker` processes",
+    )
+    parser.add_argument(
+        "--checkpoint-max-mb",
+        type=float,
+        default=DEFAULT_MAX_CHECKPOINT_BYTES / 2**20,
+        help="Maximum size of the in-memory checkpoints of runs, in MB",
+    )
+    parser.add_argument(
+        "--checkpoint-ttl",
+        type=float,
+        default=DEFAULT_CHECKPOINT_TTL,
+        help="Seconds after which the in-memory checkpoints of a run are dropped",
+    )
+    parser.add_argument(
+        "--capabilities",
+        nargs="?",
+        const=DEFAULT_CAPABILITIES_PATH,
+        help="Probe the structured output modes of each model, caching them in"
+        f" this file (default: {DEFAULT_CAPABILITIES_PATH}); agents answer in"
+        " text otherwise",
+    )
 
     args = parser.parse_args()
-    main(args.share, args.server_name, args.server_port)
+    main(
+        args.share,
+        args.server_name,
+        args.server_port,
+        args.checkpoint_db,
+        args.worker_queue,
+        int(args.checkpoint_max_mb * 2**20),
+        args.checkpoint_ttl,
+        args.capabilities,
+    )
@@ -0,0 +1,119 @@
+import difflib
+import functools
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+
+from .agents.config import AgentState
+
+LOOP_COUNTS_FIELD = "loop_counts"
+WARNINGS_FIELD = "warn_errors"
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+
+def output_similarity(previous: Any, current: Any) -> float:
+    """Similarity ratio (0 to 1) between two outputs of the same agent."""
+    if isinstance(previous, BaseModel):
+        previous = previous.model_dump_json()
+    if isinstance(current, BaseModel):
+        current = current.model_dump_json()
+    if previous == current:
+        return 1.0
+    return difflib.SequenceMatcher(None, str(previous), str(current)).ratio()
+
+
+class LoopGuard:
+    """
+    Bound the routing loops of the planning graph.
+
+    The `loop_limits` section of the graph configuration sets, per source node,
+    the maximum number of times each loop-back edge may be taken and the
+    fallback target moving the plan forward. An agent routing along a limited
+    edge is sent to its fallback instead when the edge budget is exhausted, or
+    when its output barely changed since its previous run (convergence). Forced
+    decisions are recorded in the state's `warn_errors`.
+    """
+
+    def __init__(self, graph_config: Dict):
+        """
+        Initialize the guard.
+
+        Args:
+            graph_config: The graph configuration with a `loop_limits` section
+        """
+        limits = graph_config.get("loop_limits", {})
+        self.edges: Dict[str, Dict[str, int]] = limits.get("edges", {})
+        self.fallbacks: Dict[str, str] = limits.get("fallbacks", {})
+        self.similarity_threshold: float = limits.get(
+            "similarity_threshold", DEFAULT_SIMILARITY_THRESHOLD
+        )
+        missing = set(self.edges) - set(self.fallbacks)
+        if missing:
+            raise ValueError(f"Loop limits without a fallback target: {missing}")
+
+    def wrap(self, name: str, fn: Callable) -> Callable:
+        """Guard the routing decision of a synchronous node function."""
+        if name not in self.edges:
+            return fn
+
+        @functools.wraps(fn)
+        def run(state: AgentState) -> AgentState:
+            previous = state.get(name)
+            return self.check(name, previous, fn(state))
+
+        return run
+
+    def awrap(self, name: str, fn: Callable) -> Callable:
+        """Guard the routing decision of an async node function."""
+        if name not in self.edges:
+            return fn
+
+        @functools.wraps(fn)
+        async def arun(state: AgentState) -> AgentState:
+            previous = state.get(name)
+            return self.check(name, previous, await fn(state))
+
+        return arun
+
+    def check(
+        self, name: str, previous: Optional[Any], state: AgentState
+    ) -> AgentState:
+        """
+        Apply the revisit budget and convergence check to an agent's decision.
+
+        Args:
+            name: The agent that just ran
+            previous: The agent's output before this run, if any
+            state: The state returned by the agent
+
+        Returns:
+            The state, with `forward` replaced by the fallback when forced
+        """
+        target = state.get("forward")
+        budget = self.edges[name].get(target)
+        if budget is None:
+            return state
+
+        edge = f"{name}->{target}"
+        counts = dict(state.get(LOOP_COUNTS_FIELD) or {})
+        reason = None
+        if counts.get(edge, 0) >= budget:
+            reason = f"revisit budget of {budget} exhausted"
+        elif previous is not None:
+            similarity = output_similarity(previous, state.get(name))
+            if similarity >= self.similarity_threshold:
+                reason = f"output converged (similarity {similarity:.2f})"
+
+        if reason is None:
+            counts[edge] = counts.get(edge, 0) + 1
+        else:
+            fallback = self.fallbacks[name]
+            message = f"Forced {name} -> {fallback} instead of {target}: {reason}"
+            logger.warning(message)
+            warnings = dict(state.get(WARNINGS_FIELD) or {})
+            warnings[name] = message
+            state[WARNINGS_FIELD] = warnings
+            state["forward"] = fallback
+        state[LOOP_COUNTS_FIELD] = counts
+        return state
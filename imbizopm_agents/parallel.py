@@ -0,0 +1,272 @@
+import asyncio
+import threading
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from langgraph.graph import END
+
+from .agents.config import AgentState
+
+# Every agent sets the routing fields, so reading them creates a dependency
+ROUTING_FIELDS = ["forward", "backward"]
+# Reducer fields: the outputs of all committed agents are concatenated
+MERGED_FIELDS = ["messages", "routes"]
+# Bookkeeping dicts: the entries of all committed agents are combined
+UPDATED_FIELDS = ["loop_counts", "warn_errors", "degraded"]
+# Flag dicts: a flag cleared by any committed agent stays cleared
+CLEARED_FIELDS = ["replay"]
+PENDING_FIELD = "pending_results"
+
+
+def estimate_tokens(messages: Iterable[Any]) -> int:
+    """
+    Tokens spent on an agent conversation.
+
+    Uses the usage reported by the provider when available, and an estimate of
+    four characters per token otherwise.
+    """
+    messages = list(messages or [])
+    reported = [
+        message.usage_metadata["total_tokens"]
+        for message in messages
+        if isinstance(message, AIMessage) and message.usage_metadata
+    ]
+    if reported:
+        return sum(reported)
+    return sum(len(str(getattr(message, "content", ""))) for message in messages) // 4
+
+
+def edge_targets(edges) -> List[str]:
+    """Destinations of a node's edges, whether a list or a routing dict."""
+    return list(edges.values()) if isinstance(edges, dict) else list(edges)
+
+
+def compute_node_depths(graph_config: Dict) -> Dict[str, int]:
+    """Breadth-first distance of every node from the entry point."""
+    depths = {graph_config["entry_point"]: 0}
+    queue = deque([graph_config["entry_point"]])
+    while queue:
+        node = queue.popleft()
+        for target in edge_targets(graph_config["edges"].get(node, [])):
+            if target != END and target not in depths:
+                depths[target] = depths[node] + 1
+                queue.append(target)
+    return depths
+
+
+def forward_targets(graph_config: Dict, node: str, depths: Dict[str, int]) -> List[str]:
+    """Targets of `node` that move away from the entry point (not loop-backs)."""
+    return [
+        target
+        for target in edge_targets(graph_config["edges"].get(node, []))
+        if target != END and depths.get(target, 0) > depths.get(node, 0)
+    ]
+
+
+def find_parallel_chains(
+    graph_config: Dict,
+) -> List[Tuple[List[str], List[List[str]]]]:
+    """
+    Find linear chains of nodes that can be split into concurrent stages.
+
+    A chain follows nodes that have a single forward target, where that target
+    is only reachable from the previous node. Inside a chain, a node depends on
+    an earlier node when it reads a field the earlier node writes. Nodes are
+    grouped into stages by dependency level, so independent nodes share a stage.
+
+    Args:
+        graph_config: The graph configuration with `reads`/`writes` per node
+
+    Returns:
+        For each chain with at least one multi-node stage, the chain in
+        sequential order and its list of stages
+    """
+    nodes = graph_config["nodes"]
+    depths = compute_node_depths(graph_config)
+    incoming: Dict[str, set] = {name: set() for name in nodes}
+    for source, edges in graph_config["edges"].items():
+        for target in edge_targets(edges):
+            if target in incoming:
+                incoming[target].add(source)
+
+    def next_in_chain(node: str):
+        targets = forward_targets(graph_config, node, depths)
+        if len(targets) == 1 and incoming[targets[0]] == {node}:
+            return targets[0]
+        return None
+
+    extendable = {next_in_chain(node) for node in nodes} - {None}
+    chains = []
+    for head in nodes:
+        if head in extendable or head not in depths:
+            continue
+        chain = [head]
+        while (nxt := next_in_chain(chain[-1])) and nxt not in chain:
+            chain.append(nxt)
+
+        levels: Dict[str, int] = {}
+        for i, node in enumerate(chain):
+            # Without declared reads a node depends on everything before it
+            reads = nodes[node].get("reads")
+            levels[node] = max(
+                (
+                    levels[earlier] + 1
+                    for earlier in chain[:i]
+                    if reads is None
+                    or (set(reads) - {node})
+                    & set(nodes[earlier].get("writes", [earlier]) + ROUTING_FIELDS)
+                ),
+                default=0,
+            )
+        stages = [
+            [node for node in chain if levels[node] == level]
+            for level in range(max(levels.values()) + 1)
+        ]
+        if any(len(stage) > 1 for stage in stages):
+            chains.append((chain, stages))
+    return chains
+
+
+class ParallelStats:
+    """
+    Agent calls made by the parallel stages, per agent.
+
+    An agent grouped with an earlier agent of its chain runs before knowing
+    whether the chain reaches it: when an earlier agent routes out of the chain
+    (e.g. the Scoper to the Negotiator), its result is discarded. Discarded
+    calls and their tokens are counted, so the cost of the grouping is known.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "discarded": 0, "wasted_tokens": 0}
+        )
+
+    def record_calls(self, names: Iterable[str]):
+        with self._lock:
+            for name in names:
+                self._stats[name]["calls"] += 1
+
+    def record_discarded(self, name: str, result: Any):
+        tokens = 0
+        if not isinstance(result, BaseException):
+            tokens = estimate_tokens(result.get("messages"))
+        with self._lock:
+            self._stats[name]["discarded"] += 1
+            self._stats[name]["wasted_tokens"] += tokens
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Calls, discarded calls and wasted tokens, per agent."""
+        with self._lock:
+            stats = {name: dict(counts) for name, counts in self._stats.items()}
+        for counts in stats.values():
+            counts["discard_rate"] = (
+                counts["discarded"] / counts["calls"] if counts["calls"] else 0.0
+            )
+        return stats
+
+
+class ParallelStage:
+    """
+    Graph node running the agents of one stage of a chain concurrently.
+
+    Results are committed in the chain's sequential order, so the state after
+    the join is the one a sequential run would produce. A result whose turn has
+    not come yet (its predecessor runs in a later stage) is kept pending in the
+    state; results after an agent routing out of the chain are discarded, and
+    counted in `stats` when given.
+    """
+
+    def __init__(
+        self,
+        chain: List[str],
+        members: Dict[str, Callable],
+        writes: Dict[str, List[str]],
+        is_head: bool,
+        stats: Optional[ParallelStats] = None,
+    ):
+        self.chain = chain
+        self.members = members
+        self.writes = writes
+        self.is_head = is_head
+        self.stats = stats
+
+    def run(self, state: AgentState) -> Dict[str, Any]:
+        if self.stats is not None:
+            self.stats.record_calls(self.members)
+        if len(self.members) == 1:
+            results = {
+                name: _call(fn, dict(state)) for name, fn in self.members.items()
+            }
+        else:
+            with ContextThreadPoolExecutor(max_workers=len(self.members)) as executor:
+                futures = {
+                    name: executor.submit(_call, fn, dict(state))
+                    for name, fn in self.members.items()
+                }
+            results = {name: future.result() for name, future in futures.items()}
+        return self._join(state, results)
+
+    async def arun(self, state: AgentState) -> Dict[str, Any]:
+        if self.stats is not None:
+            self.stats.record_calls(self.members)
+        outputs = await asyncio.gather(
+            *(fn(dict(state)) for fn in self.members.values()), return_exceptions=True
+        )
+        return self._join(state, dict(zip(self.members, outputs)))
+
+    def _join(self, state: AgentState, results: Dict[str, Any]) -> Dict[str, Any]:
+        pending = {} if self.is_head else dict(state.get(PENDING_FIELD) or {})
+        pending.update(results)
+        update = {field: [] for field in MERGED_FIELDS}
+        update.update(
+            {
+                field: dict(state.get(field) or {})
+                for field in UPDATED_FIELDS + CLEARED_FIELDS
+            }
+        )
+
+        forward = self.chain[0] if self.is_head else state.get("forward")
+        while forward in pending:
+            result = pending.pop(forward)
+            if isinstance(result, BaseException):
+                raise result
+            for field in MERGED_FIELDS:
+                update[field].extend(result.get(field) or [])
+            for field in UPDATED_FIELDS:
+                update[field].update(result.get(field) or {})
+            for field in CLEARED_FIELDS:
+                for key, flag in (result.get(field) or {}).items():
+                    update[field][key] = update[field].get(key, flag) and flag
+            for field in self.writes[forward] + ROUTING_FIELDS:
+                update[field] = result.get(field)
+            forward = update["forward"]
+
+        if forward not in self.chain:
+            if self.stats is not None:
+                for name, result in pending.items():
+                    self.stats.record_discarded(name, result)
+            pending = {}
+        for name, result in pending.items():
+            if isinstance(result, BaseException):
+                raise result
+            pending[name] = {
+                field: result.get(field)
+                for field in self.writes[name]
+                + ROUTING_FIELDS
+                + MERGED_FIELDS
+                + UPDATED_FIELDS
+                + CLEARED_FIELDS
+            }
+        update[PENDING_FIELD] = pending
+        return update
+
+
+def _call(fn: Callable, state: AgentState):
+    try:
+        return fn(state)
+    except Exception as e:
+        return e
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain.chat_models import init_chat_model
+from langchain_core.language_models import BaseChatModel
+from langgraph.graph.graph import CompiledGraph
+from loguru import logger
+
+from .cache import credential_fingerprint
+from .graph import create_project_planning_graph
+
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+DEFAULT_MAX_ENTRIES = 8
+
+
+@dataclass
+class PoolEntry:
+    """A warm chat model client and the planning graph compiled on it."""
+
+    llm: BaseChatModel
+    graph: CompiledGraph
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class GraphPool:
+    """
+    Pool of compiled planning graphs and their chat model clients.
+
+    Entries are keyed by model name and credential fingerprint, so requests with
+    the same model and key reuse the agents, their compiled subgraphs and the
+    client's HTTP connection pool instead of rebuilding them. Entries unused for
+    longer than the idle timeout are evicted, as well as the least recently used
+    ones beyond the maximum number of entries.
+    """
+
+    def __init__(
+        self,
+        graph_kwargs: Optional[Dict[str, Any]] = None,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        create_llm: Callable[..., BaseChatModel] = init_chat_model,
+    ):
+        """
+        Initialize the pool.
+
+        Args:
+            graph_kwargs: Keyword arguments of `create_project_planning_graph`
+            idle_timeout: Seconds after which an unused entry is evicted
+            max_entries: Maximum number of pooled entries
+            create_llm: Factory of chat models from a model name and API key
+        """
+        self.graph_kwargs = graph_kwargs or {}
+        self.idle_timeout = idle_timeout
+        self.max_entries = max_entries
+        self.create_llm = create_llm
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], PoolEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self, model_name: str, api_key: Optional[str] = None
+    ) -> Tuple[BaseChatModel, CompiledGraph]:
+        """
+        Return the chat model and graph for a model, creating them if needed.
+
+        Args:
+            model_name: The name of the model to use
+            api_key: Optional API key for the model
+
+        Returns:
+            Tuple of the chat model and the compiled planning graph
+        """
+        key = (model_name, credential_fingerprint(api_key))
+        with self._lock:
+            self.evict_idle()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                entry.last_used = time.monotonic()
+                self._entries.move_to_end(key)
+                return entry.llm, entry.graph
+            self.misses += 1
+
+        # Build outside the lock so slow initializations do not block other models
+        model_kwargs = {"api_key": api_key} if api_key else {}
+        llm = self.create_llm(model_name, **model_kwargs)
+        graph_kwargs = dict(self.graph_kwargs)
+        if graph_kwargs.get("worker_queue") is not None:
+            # Workers create the model themselves, from its name
+            graph_kwargs["worker_model"] = model_name
+        # Nodes naming their own model get clients with the same credential
+        graph = create_project_planning_graph(
+            llm,
+            create_llm=self.create_llm,
+            model_kwargs=model_kwargs,
+            **graph_kwargs,
+        )
+        logger.info(f"Created pooled graph for model '{model_name}'")
+
+        with self._lock:
+            entry = self._entries.setdefault(key, PoolEntry(llm, graph))
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.info(f"Evicted pooled graph for model '{evicted[0]}'")
+            return entry.llm, entry.graph
+
+    def evict_idle(self):
+        """Drop the entries unused for longer than the idle timeout."""
+        deadline = time.monotonic() - self.idle_timeout
+        for key in [k for k, e in self._entries.items() if e.last_used < deadline]:
+            del self._entries[key]
+            logger.info(f"Evicted idle pooled graph for model '{key[0]}'")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss and size counters of the pool."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self)}
@@ -0,0 +1,318 @@
+import json
+import re
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from pydantic import ValidationError
+
+_FENCE_PATTERN = re.compile(r"```[a-zA-Z]*\s*")
+_COMMENT_PATTERN = re.compile(r"//[^\n]*|/\*.*?(\*/|$)", re.DOTALL)
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_LITERAL_PATTERN = re.compile(r"\b(True|False|None)\b")
+_TRAILING_COMMA_PATTERN = re.compile(r",(\s*[}\]])")
+_STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_CLOSERS = {"{": "}", "[": "]"}
+# Longest JSON fragment quoted in a patch request
+MAX_FRAGMENT_CHARS = 2000
+
+
+def _segments(text: str) -> List[Tuple[bool, str]]:
+    """Split JSON-like text into `(is_string, segment)` parts, quotes included."""
+    segments = []
+    start, in_string, escaped = 0, False, False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                segments.append((True, text[start : i + 1]))
+                start, in_string = i + 1, False
+        elif char == '"':
+            segments.append((False, text[start:i]))
+            start, in_string = i, True
+    segments.append((in_string, text[start:]))
+    return [segment for segment in segments if segment[1]]
+
+
+def _map_segments(
+    text: str,
+    code: Callable[[str], str] = lambda s: s,
+    string: Callable[[str], str] = lambda s: s,
+) -> str:
+    return "".join(
+        string(segment) if is_string else code(segment)
+        for is_string, segment in _segments(text)
+    )
+
+
+def _extract(text: str) -> str:
+    """Drop the prose and code fences around the JSON value."""
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return text
+    text = text[min(starts) :]
+    ends = [i for i in (text.rfind("}"), text.rfind("]")) if i >= 0]
+    # Text after the last closing bracket is kept when the output was truncated
+    if ends and _FENCE_PATTERN.search(text, max(ends)):
+        text = text[: max(ends) + 1]
+    return text.strip()
+
+
+def _remove_comments(text: str) -> str:
+    return _map_segments(text, code=lambda s: _COMMENT_PATTERN.sub("", s))
+
+
+def _double_quotes(text: str) -> str:
+    """Turn single-quoted strings into double-quoted ones."""
+    result, i = [], 0
+    in_double, escaped = False, False
+    while i < len(text):
+        char = text[i]
+        if in_double:
+            result.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_double = False
+        elif char == '"':
+            in_double = True
+            result.append(char)
+        elif char == "'":
+            end = i + 1
+            while end < len(text) and text[end] != "'":
+                end += 2 if text[end] == "\\" else 1
+            value = text[i + 1 : end].replace("\\'", "'")
+            result.append(json.dumps(value))
+            i = end
+        else:
+            result.append(char)
+        i += 1
+    return "".join(result)
+
+
+def _escape_control_characters(text: str) -> str:
+    def escape(segment: str) -> str:
+        for char, escaped in _STRING_ESCAPES.items():
+            segment = segment.replace(char, escaped)
+        return segment
+
+    return _map_segments(text, string=escape)
+
+
+def _python_literals(text: str) -> str:
+    return _map_segments(
+        text,
+        code=lambda s: _LITERAL_PATTERN.sub(lambda m: _LITERALS[m.group(1)], s),
+    )
+
+
+def _close(text: str) -> Tuple[str, int]:
+    """Close the open string and brackets of a text, with its last comma."""
+    stack, last_comma = [], -1
+    in_string, escaped = False, False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif stack and char == stack[-1]:
+            stack.pop()
+        elif char == ",":
+            last_comma = i
+    if in_string:
+        text = (text[:-1] if escaped else text) + '"'
+    if not stack:
+        return text, -1
+    text = text.rstrip().rstrip(",")
+    if text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(stack)), last_comma
+
+
+def _close_truncated(text: str) -> str:
+    """Close the string, brackets and key-value pair left open by a truncation."""
+    closed, last_comma = _close(text.rstrip())
+    # A truncated key or value that still does not parse is dropped
+    while _loads(_remove_trailing_commas(closed)) is None and last_comma > 0:
+        text = text[:last_comma]
+        closed, last_comma = _close(text)
+    return closed
+
+
+def _remove_trailing_commas(text: str) -> str:
+    return _map_segments(text, code=lambda s: _TRAILING_COMMA_PATTERN.sub(r"\1", s))
+
+
+# Fixes applied in turn until the text parses, by name
+FIXES: List[Tuple[str, Callable[[str], str]]] = [
+    ("extract", _extract),
+    ("comments", _remove_comments),
+    ("single_quotes", _double_quotes),
+    ("control_characters", _escape_control_characters),
+    ("python_literals", _python_literals),
+    ("truncation", _close_truncated),
+    ("trailing_commas", _remove_trailing_commas),
+]
+
+
+def _loads(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def is_well_formed(text: str) -> bool:
+    """Whether the JSON value of a text parses once its surroundings are dropped."""
+    return _loads(_extract(text)) is not None
+
+
+class JsonRepairer:
+    """
+    Deterministic repair of malformed JSON produced by a model.
+
+    Mechanical mistakes (trailing commas, brackets left open by a truncation,
+    single quotes, comments, raw newlines in strings, Python literals) are
+    fixed locally, so only outputs that still do not parse need another LLM
+    call. Counters record how often each fix took part in a successful repair.
+    """
+
+    def __init__(self, fixes: List[Tuple[str, Callable[[str], str]]] = FIXES):
+        """
+        Initialize the repairer.
+
+        Args:
+            fixes: Named fixes, applied in order
+        """
+        self.fixes = fixes
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def repair(self, text: str) -> Optional[Any]:
+        """
+        Repair the JSON value of a text.
+
+        Args:
+            text: The raw model output
+
+        Returns:
+            The parsed value, or None if the text could not be repaired
+        """
+        parsed = _loads(text)
+        if parsed is not None:
+            return parsed
+        applied = []
+        for name, fix in self.fixes:
+            fixed = fix(text)
+            if fixed == text:
+                continue
+            text = fixed
+            applied.append(name)
+            parsed = _loads(text)
+            if parsed is not None:
+                logger.debug(f"Repaired JSON with: {', '.join(applied)}")
+                self._record("repaired", applied)
+                return parsed
+        self._record("failed", applied)
+        return None
+
+    def _record(self, outcome: str, applied: List[str]):
+        with self._lock:
+            self._stats[outcome] += 1
+            if outcome == "repaired":
+                self._stats.update(applied)
+
+    def stats(self) -> Dict[str, int]:
+        """Number of repaired and failed outputs, and of repairs using each fix."""
+        with self._lock:
+            return dict(self._stats)
+
+
+# Repairer shared by the agents, whose counters cover the whole process
+json_repairer = JsonRepairer()
+
+
+def _get_path(data: Any, path: List[Any]) -> Any:
+    for key in path:
+        data = data[key]
+    return data
+
+
+def validation_error_fragments(
+    data: Any, error: ValidationError
+) -> List[Tuple[List[Any], Dict[str, Any], Any]]:
+    """
+    The validation errors of a JSON value, with the fragment holding each one.
+
+    Args:
+        data: The parsed JSON value that failed validation
+        error: The validation error of its model
+
+    Returns:
+        The path of each error, its details, and the object or list containing it
+    """
+    fragments = []
+    for details in error.errors(include_url=False):
+        path = list(details["loc"])
+        # The closest enclosing value present in the data, e.g. the object
+        # missing a required field
+        parent = path[:-1]
+        while parent:
+            try:
+                fragment = _get_path(data, parent)
+                break
+            except (KeyError, IndexError, TypeError):
+                parent = parent[:-1]
+        else:
+            fragment = data
+        fragments.append((path, details, fragment))
+    return fragments
+
+
+def apply_patch(data: Any, patch: List[Dict[str, Any]]) -> Tuple[Any, int]:
+    """
+    Replace values of a JSON value, in place.
+
+    Args:
+        data: The parsed JSON value
+        patch: Operations `{"path": [key or index, ...], "value": new_value}`;
+            the value is removed when `"remove": true`
+
+    Returns:
+        The patched value and the number of operations applied
+    """
+    applied = 0
+    for operation in patch:
+        path = operation.get("path") if isinstance(operation, dict) else None
+        if not isinstance(path, list):
+            continue
+        if not path:
+            if "value" in operation:
+                data, applied = operation["value"], applied + 1
+            continue
+        try:
+            parent = _get_path(data, path[:-1])
+            key = path[-1]
+            if operation.get("remove"):
+                del parent[key]
+            elif isinstance(parent, list) and key == len(parent):
+                parent.append(operation["value"])
+            else:
+                parent[key] = operation["value"]
+            applied += 1
+        except (KeyError, IndexError, TypeError):
+            logger.debug(f"Skipping patch of a missing path: {path}")
+    return data, applied
@@ -0,0 +1,103 @@
+from typing import Any, Dict, Iterable, Set
+
+from pydantic import BaseModel
+
+from .agents.base_agent import REPLAY_FIELD
+from .agents.config import AgentDtypes, AgentState
+from .cancellation import CANCELLED_FIELD
+from .deadline import DEADLINE_FIELD, DEGRADED_FIELD
+from .parallel import PENDING_FIELD, compute_node_depths
+from .speculation import SPECULATIVE_FIELD
+
+# Fields reset for the new run; the agent outputs are carried over
+RUN_FIELDS = ["messages", "routes", "forward", "backward", "loop_counts", "warn_errors"]
+
+
+def invalidated_nodes(graph_config: Dict, changed_fields: Iterable[str]) -> Set[str]:
+    """
+    Find the nodes whose output is out of date after some state fields changed.
+
+    A node is invalidated when it reads a changed field written by a node
+    closer to the entry point (or not written by any node, like `input`); reads
+    along loop-back edges do not count. The writes of an invalidated node are
+    changed in turn, so the invalidation follows the dependencies downstream.
+
+    Args:
+        graph_config: The graph configuration with `reads`/`writes` per node
+        changed_fields: The edited state fields
+
+    Returns:
+        The names of the nodes to run again
+    """
+    nodes = graph_config["nodes"]
+    depths = compute_node_depths(graph_config)
+    writer_depth = {
+        field: depths.get(name, 0)
+        for name, node_config in nodes.items()
+        for field in node_config.get("writes", [name])
+    }
+
+    invalidated: Set[str] = set()
+    changed = list(changed_fields)
+    while changed:
+        field = changed.pop()
+        for name, node_config in nodes.items():
+            writes = node_config.get("writes", [name])
+            if (
+                name not in invalidated
+                and field in node_config.get("reads", [])
+                and field not in writes
+                and depths.get(name, 0) > writer_depth.get(field, -1)
+            ):
+                invalidated.add(name)
+                changed.extend(writes)
+    return invalidated
+
+
+def _coerce_output(name: str, value: Any) -> Any:
+    """Rebuild an agent output loaded from JSON into its model class."""
+    model_class = getattr(AgentDtypes, name, None)
+    if model_class is None or value is None or isinstance(value, BaseModel):
+        return value
+    return model_class.model_validate(value)
+
+
+def build_replan_state(
+    graph_config: Dict,
+    state: Dict[str, Any],
+    edits: Dict[str, Any],
+    initial_state: Dict[str, Any],
+) -> AgentState:
+    """
+    Build the initial state of a run re-planning an edited state.
+
+    Agents that are not invalidated by the edits are marked for replay: when
+    the run reaches them, they reuse their stored output instead of calling
+    the LLM, once.
+
+    Args:
+        graph_config: The graph configuration with `reads`/`writes` per node
+        state: The stored final state of a previous run, as returned by the
+            graph or loaded from JSON
+        edits: New values of some state fields (e.g. an edited agent output)
+        initial_state: The initial state of a fresh run on the same input
+
+    Returns:
+        The initial state of the re-planning run
+    """
+    values = {name: _coerce_output(name, value) for name, value in state.items()}
+    values.update({name: _coerce_output(name, value) for name, value in edits.items()})
+    values.update({field: initial_state[field] for field in RUN_FIELDS})
+    values.pop(PENDING_FIELD, None)
+    values.pop(SPECULATIVE_FIELD, None)
+    values.pop(CANCELLED_FIELD, None)
+    values.pop(DEADLINE_FIELD, None)
+    values.pop(DEGRADED_FIELD, None)
+
+    stale = invalidated_nodes(graph_config, edits)
+    values[REPLAY_FIELD] = {
+        name: True
+        for name in graph_config["nodes"]
+        if name not in stale and values.get(name) is not None
+    }
+    return values
@@ -0,0 +1,158 @@
+import functools
+import json
+import os
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    RemoveMessage,
+    message_to_dict,
+    messages_from_dict,
+)
+
+from .agents.config import AgentState
+
+# Key of a spilled message's `additional_kwargs` holding the file it was moved to
+SPILLED_KEY = "spilled_to"
+
+
+def is_spilled(message: Any) -> bool:
+    """Whether a message is a stub left in the state by a spilled message."""
+    return isinstance(message, BaseMessage) and SPILLED_KEY in message.additional_kwargs
+
+
+def is_retention_marker(message: Any) -> bool:
+    """Whether a message only records a removal or a spill, not new content."""
+    return isinstance(message, RemoveMessage) or is_spilled(message)
+
+
+def load_spilled(message: BaseMessage) -> BaseMessage:
+    """
+    Load the full content of a spilled message back from disk.
+
+    Args:
+        message: A message of the state, spilled or not
+
+    Returns:
+        The original message, or the message itself when it was not spilled
+    """
+    if not is_spilled(message):
+        return message
+    with open(message.additional_kwargs[SPILLED_KEY], "r") as f:
+        return messages_from_dict([json.load(f)])[0]
+
+
+class MessageRetention:
+    """
+    Bound the messages a run keeps in its state.
+
+    Every agent appends its whole conversation to `messages`, and checkpoints
+    snapshot the state after each step, so long or looping runs grow without
+    limit. The policy is applied to the update of each graph node: with
+    `final_only` only the final AI answers are kept, and with `max_messages`
+    older messages are removed from the state, or spilled to `spill_dir`
+    leaving a small stub that references the file they were written to.
+    """
+
+    def __init__(
+        self,
+        max_messages: Optional[int] = None,
+        final_only: bool = False,
+        spill_dir: Optional[str] = None,
+    ):
+        """
+        Initialize the policy.
+
+        Args:
+            max_messages: Number of most recent messages kept with their
+                content; unbounded when not set
+            final_only: Whether to keep only the final AI message of each agent,
+                dropping its prompts
+            spill_dir: Directory older messages are written to instead of being
+                removed from the state
+        """
+        if max_messages is not None and max_messages < 0:
+            raise ValueError("max_messages must not be negative")
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.max_messages = max_messages
+        self.final_only = final_only
+        self.spill_dir = spill_dir
+
+    def wrap(self, fn: Callable) -> Callable:
+        """Apply the policy to the updates of a synchronous node function."""
+
+        @functools.wraps(fn)
+        def run(state: AgentState) -> Dict[str, Any]:
+            # Agents replace the messages of the state they receive
+            existing = state.get("messages") or []
+            return self.apply(existing, fn(state))
+
+        return run
+
+    def awrap(self, fn: Callable) -> Callable:
+        """Apply the policy to the updates of an async node function."""
+
+        @functools.wraps(fn)
+        async def arun(state: AgentState) -> Dict[str, Any]:
+            existing = state.get("messages") or []
+            return self.apply(existing, await fn(state))
+
+        return arun
+
+    def apply(
+        self, existing: List[BaseMessage], update: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Restrict the messages of a node update to the ones the policy keeps.
+
+        Args:
+            existing: The messages of the state before the node ran
+            update: The update returned by the node, changed in place
+
+        Returns:
+            The update, whose messages may remove or spill existing messages
+        """
+        messages = list(update.get("messages") or [])
+        if self.final_only:
+            messages = [
+                message
+                for message in messages
+                if isinstance(message, AIMessage) and not message.tool_calls
+            ]
+
+        if self.max_messages is not None:
+            kept = [message for message in existing if not is_spilled(message)]
+            excess = len(kept) + len(messages) - self.max_messages
+            if excess > 0:
+                evicted_existing = kept[:excess]
+                evicted_new = messages[: max(0, excess - len(kept))]
+                messages = messages[len(evicted_new) :]
+                evicted = [self._evict(message) for message in evicted_existing]
+                if self.spill_dir:
+                    evicted += [self._evict(message) for message in evicted_new]
+                messages = evicted + messages
+
+        update["messages"] = messages
+        return update
+
+    def _evict(self, message: BaseMessage) -> BaseMessage:
+        """Removal, or spilled stub, of a message of the state."""
+        if message.id is None:
+            message.id = str(uuid.uuid4())
+        if not self.spill_dir:
+            return RemoveMessage(id=message.id)
+
+        path = os.path.join(self.spill_dir, f"{message.id}.json")
+        with open(path, "w") as f:
+            json.dump(message_to_dict(message), f)
+        # A message with the same id replaces the original in the state
+        return message.model_copy(
+            update={
+                "content": "",
+                "additional_kwargs": {SPILLED_KEY: path},
+                "response_metadata": {},
+            }
+        )
@@ -0,0 +1,23 @@
+from typing import Any, Dict
+
+from langchain_core.messages import BaseMessage, messages_to_dict
+from pydantic import BaseModel
+
+from .agents.config import AgentState
+
+
+def _to_jsonable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, list) and value and isinstance(value[0], BaseMessage):
+        return messages_to_dict(value)
+    if isinstance(value, dict):
+        return {k: _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_jsonable(v) for v in value]
+    return value
+
+
+def state_to_dict(state: AgentState) -> Dict[str, Any]:
+    """Convert an AgentState into plain JSON-serializable data."""
+    return {key: _to_jsonable(value) for key, value in state.items()}
@@ -0,0 +1,304 @@
+import asyncio
+import functools
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from loguru import logger
+
+from .agents.config import AgentState
+from .parallel import (
+    CLEARED_FIELDS,
+    MERGED_FIELDS,
+    ROUTING_FIELDS,
+    UPDATED_FIELDS,
+    compute_node_depths,
+    edge_targets,
+    estimate_tokens,
+    forward_targets,
+)
+
+# State field holding the speculative result of the next node, once committed
+SPECULATIVE_FIELD = "speculative"
+
+
+class Speculation:
+    """
+    Opt-in speculative execution of the likely next agent.
+
+    While an agent runs, the successor it most often routed to so far (its
+    forward target until routes are observed) starts on a snapshot of the
+    state. Only successors that do not read the agent's writes are eligible,
+    per the `reads`/`writes` of each node in the graph configuration. When the
+    agent routes to the successor and the fields the successor reads did not
+    change, its result is committed and its node completes without calling the
+    LLM; otherwise the result is discarded. Hits, misses and the tokens of
+    discarded runs are recorded per edge.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Counter] = defaultdict(Counter)
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"started": 0, "hits": 0, "misses": 0, "wasted_tokens": 0}
+        )
+
+    def wrap_nodes(
+        self,
+        graph_config: Dict,
+        node_functions: Dict[str, Callable],
+        excluded: Iterable[str] = (),
+        use_async: bool = False,
+    ) -> Dict[str, Callable]:
+        """
+        Wrap the node functions of a graph with speculative execution.
+
+        Args:
+            graph_config: The graph configuration with `reads`/`writes` per node
+            node_functions: The function of each node
+            excluded: Nodes run by a parallel stage, left unchanged
+            use_async: Whether the node functions are coroutines
+
+        Returns:
+            The node functions, wrapped where speculation applies
+        """
+        nodes = graph_config["nodes"]
+        depths = compute_node_depths(graph_config)
+        excluded = set(excluded)
+        writes = {name: nodes[name].get("writes", [name]) for name in nodes}
+
+        def eligible(name: str, target: str) -> bool:
+            reads = nodes.get(target, {}).get("reads")
+            return (
+                target in node_functions
+                and target not in excluded
+                and reads is not None
+                and not set(reads) & set(writes[name] + ROUTING_FIELDS)
+            )
+
+        candidates = {
+            name: [
+                target
+                for target in edge_targets(graph_config["edges"].get(name, []))
+                if eligible(name, target)
+            ]
+            for name in node_functions
+            if name not in excluded
+        }
+        wrapped = dict(node_functions)
+        for name, targets in candidates.items():
+            if not targets:
+                continue
+            forward = forward_targets(graph_config, name, depths)
+            wrapped[name] = (self.awrap if use_async else self.wrap)(
+                name,
+                node_functions[name],
+                {target: node_functions[target] for target in targets},
+                {target: nodes[target]["reads"] for target in targets},
+                {target: writes[target] for target in targets},
+                forward[0] if forward else None,
+            )
+        for target in {target for targets in candidates.values() for target in targets}:
+            wrapped[target] = self.wrap_target(target, wrapped[target], use_async)
+        return wrapped
+
+    def predict(self, name: str, targets: List[str], default: Optional[str]) -> str:
+        """The successor `name` most often routed to, or its forward target."""
+        with self._lock:
+            counts = self._routes[name]
+            return max(targets, key=lambda t: (counts[t], t == default))
+
+    def record_route(self, name: str, target: Optional[str]):
+        with self._lock:
+            self._routes[name][target] += 1
+
+    def _record(self, edge: str, counter: str):
+        with self._lock:
+            self._stats[edge][counter] += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Started, hit and missed speculations, and wasted tokens, per edge."""
+        with self._lock:
+            stats = {edge: dict(counts) for edge, counts in self._stats.items()}
+        for counts in stats.values():
+            decided = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = counts["hits"] / decided if decided else 0.0
+        return stats
+
+    def wrap(
+        self,
+        name: str,
+        fn: Callable,
+        targets: Dict[str, Callable],
+        reads: Dict[str, List[str]],
+        writes: Dict[str, List[str]],
+        default: Optional[str],
+    ) -> Callable:
+        """Speculatively start the likely successor of a synchronous node."""
+
+        @functools.wraps(fn)
+        def run(state: AgentState) -> AgentState:
+            target = self.predict(name, list(targets), default)
+            edge = f"{name}->{target}"
+            snapshot = dict(state)
+            executor = ContextThreadPoolExecutor(max_workers=1)
+            future = executor.submit(targets[target], dict(snapshot))
+            executor.shutdown(wait=False)
+            self._record(edge, "started")
+            try:
+                result = fn(state)
+            except BaseException:
+                self._discard(edge, future)
+                raise
+
+            self.record_route(name, result.get("forward"))
+            if not self._is_valid(target, reads[target], snapshot, result):
+                self._discard(edge, future)
+                return result
+            try:
+                speculative = future.result()
+            except Exception as e:
+                logger.warning(f"Speculative run of {target} failed: {e}")
+                self._record(edge, "misses")
+                return result
+            return self._commit(
+                edge, target, writes[target], snapshot, result, speculative
+            )
+
+        return run
+
+    def awrap(
+        self,
+        name: str,
+        fn: Callable,
+        targets: Dict[str, Callable],
+        reads: Dict[str, List[str]],
+        writes: Dict[str, List[str]],
+        default: Optional[str],
+    ) -> Callable:
+        """Speculatively start the likely successor of an async node."""
+
+        @functools.wraps(fn)
+        async def arun(state: AgentState) -> AgentState:
+            target = self.predict(name, list(targets), default)
+            edge = f"{name}->{target}"
+            snapshot = dict(state)
+            task = asyncio.ensure_future(targets[target](dict(snapshot)))
+            self._record(edge, "started")
+            try:
+                result = await fn(state)
+            except BaseException:
+                self._adiscard(edge, task)
+                raise
+
+            self.record_route(name, result.get("forward"))
+            if not self._is_valid(target, reads[target], snapshot, result):
+                self._adiscard(edge, task)
+                return result
+            try:
+                speculative = await task
+            except Exception as e:
+                logger.warning(f"Speculative run of {target} failed: {e}")
+                self._record(edge, "misses")
+                return result
+            return self._commit(
+                edge, target, writes[target], snapshot, result, speculative
+            )
+
+        return arun
+
+    def wrap_target(self, name: str, fn: Callable, use_async: bool) -> Callable:
+        """Complete a node with its committed speculative result, if any."""
+
+        def committed(state: AgentState) -> Optional[Dict[str, Any]]:
+            entry = (state.get(SPECULATIVE_FIELD) or {}).get(name)
+            if entry is None:
+                return None
+            logger.info(f"Using speculative output: {name}")
+            update = {field: entry[field] for field in entry}
+            for field in UPDATED_FIELDS:
+                update[field] = {**(state.get(field) or {}), **entry[field]}
+            for field in CLEARED_FIELDS:
+                flags = dict(state.get(field) or {})
+                for key, flag in entry[field].items():
+                    flags[key] = flags.get(key, flag) and flag
+                update[field] = flags
+            update[SPECULATIVE_FIELD] = {}
+            return update
+
+        if use_async:
+
+            @functools.wraps(fn)
+            async def arun(state: AgentState) -> Dict[str, Any]:
+                update = committed(state)
+                return update if update is not None else await fn(state)
+
+            return arun
+
+        @functools.wraps(fn)
+        def run(state: AgentState) -> Dict[str, Any]:
+            update = committed(state)
+            return update if update is not None else fn(state)
+
+        return run
+
+    @staticmethod
+    def _is_valid(
+        target: str, reads: List[str], snapshot: Dict[str, Any], result: Dict[str, Any]
+    ) -> bool:
+        """Whether the node routed to `target` without changing what it reads."""
+        if result.get("forward") != target:
+            return False
+        for field in reads:
+            before, after = snapshot.get(field), result.get(field)
+            if after is not before and after != before:
+                return False
+        return True
+
+    def _commit(
+        self,
+        edge: str,
+        target: str,
+        writes: List[str],
+        snapshot: Dict[str, Any],
+        result: Dict[str, Any],
+        speculative: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Store the speculative result in the state, for the next node."""
+        entry = {
+            field: speculative.get(field)
+            for field in writes + ROUTING_FIELDS + MERGED_FIELDS
+        }
+        # Only the entries the speculative run changed, not its stale copies
+        for field in UPDATED_FIELDS + CLEARED_FIELDS:
+            before = snapshot.get(field) or {}
+            entry[field] = {
+                key: value
+                for key, value in (speculative.get(field) or {}).items()
+                if before.get(key) != value
+            }
+        result[SPECULATIVE_FIELD] = {target: entry}
+        self._record(edge, "hits")
+        return result
+
+    def _adiscard(self, edge: str, task: asyncio.Future):
+        """Discard a speculative coroutine, stopping its LLM call if still running."""
+        self._record(edge, "misses")
+        if task.done():
+            self._add_waste(edge, task)
+        else:
+            task.cancel()
+
+    def _discard(self, edge: str, future: Future):
+        """Discard a speculative thread, counting its tokens once it finished."""
+        self._record(edge, "misses")
+        future.add_done_callback(functools.partial(self._add_waste, edge))
+
+    def _add_waste(self, edge: str, future: Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        tokens = estimate_tokens(future.result().get("messages"))
+        with self._lock:
+            self._stats[edge]["wasted_tokens"] += tokens
@@ -0,0 +1,210 @@
+import json
+import typing
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.config import get_stream_writer
+from loguru import logger
+from pydantic import BaseModel, ValidationError
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class StructureError(ValueError):
+    """Streamed agent output that can no longer form a valid JSON object."""
+
+
+def list_item_types(model_class: Type[BaseModel]) -> Dict[str, Type[BaseModel]]:
+    """
+    Fields of a model holding a list of models, with the type of their items.
+
+    Args:
+        model_class: The pydantic model of an agent output
+
+    Returns:
+        The item model of each list field, e.g. `{"tasks": Task}` for a `TaskPlan`
+    """
+    item_types = {}
+    for name, field in model_class.model_fields.items():
+        annotation = field.annotation
+        # Optional[List[X]] is Union[List[X], None]
+        if typing.get_origin(annotation) is typing.Union:
+            annotation = next(
+                (arg for arg in typing.get_args(annotation) if arg is not type(None)),
+                annotation,
+            )
+        if typing.get_origin(annotation) is not list:
+            continue
+        (item_type,) = typing.get_args(annotation) or (None,)
+        if isinstance(item_type, type) and issubclass(item_type, BaseModel):
+            item_types[name] = item_type
+    return item_types
+
+
+class IncrementalJsonParser:
+    """
+    Parser of a JSON object arriving in chunks, emitting list items once complete.
+
+    Only the structure is tracked while the text streams: strings, brackets
+    and the keys of the top-level object. Each element of a list held by a
+    top-level key is decoded as soon as its closing bracket arrives. Text
+    before the opening brace (prose, a code fence) and after the closing one
+    is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self._position = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume a chunk of the text.
+
+        Args:
+            chunk: The next tokens of the output
+
+        Returns:
+            The `(key, item)` pairs of the list items completed by the chunk
+
+        Raises:
+            StructureError: If a closing bracket does not match the open one
+        """
+        self.text += chunk
+        items = []
+        while self._position < len(self.text) and not self.done:
+            item = self._consume(self.text[self._position])
+            if item is not None:
+                items.append(item)
+            self._position += 1
+        return items
+
+    def _consume(self, char: str) -> Optional[Tuple[str, Any]]:
+        position = self._position
+        if not self._stack:
+            if char == "{":
+                self._stack.append("}")
+            return None
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+                if len(self._stack) == 1:
+                    self._last_string = self.text[self._string_start + 1 : position]
+            return None
+
+        if char == '"':
+            self._in_string = True
+            self._string_start = position
+        elif char == ":" and len(self._stack) == 1:
+            self._key = self._last_string
+        elif char in _CLOSERS:
+            if len(self._stack) == 2 and self._stack[-1] == "]":
+                self._item_start = position
+            self._stack.append(_CLOSERS[char])
+        elif char in _CLOSERS.values():
+            if char != self._stack[-1]:
+                raise StructureError(
+                    f"Unexpected '{char}' at {position}, expected '{self._stack[-1]}'"
+                )
+            self._stack.pop()
+            if not self._stack:
+                self.done = True
+            elif len(self._stack) == 2 and self._item_start is not None:
+                text = self.text[self._item_start : position + 1]
+                self._item_start = None
+                try:
+                    return self._key, json.loads(text)
+                except ValueError:
+                    logger.debug(f"Skipping malformed item of {self._key}: {text}")
+        return None
+
+
+class ItemParser:
+    """Incremental parser emitting the completed items of an agent output model."""
+
+    def __init__(self, model_class: Type[BaseModel]):
+        """
+        Initialize the parser.
+
+        Args:
+            model_class: The pydantic model of the agent output
+        """
+        self.item_types = list_item_types(model_class)
+        self.json_parser = IncrementalJsonParser()
+
+    def feed(self, chunk: str) -> List[Tuple[str, BaseModel]]:
+        """
+        Consume a chunk of the output.
+
+        Returns:
+            The `(field, item)` pairs completed by the chunk, e.g. `("tasks", Task)`
+        """
+        items = []
+        for field, value in self.json_parser.feed(chunk):
+            item_type = self.item_types.get(field)
+            if item_type is None:
+                continue
+            try:
+                items.append((field, item_type.model_validate(value, strict=False)))
+            except ValidationError as e:
+                logger.debug(f"Skipping invalid item of {field}: {e}")
+        return items
+
+
+class ItemStreamHandler(BaseCallbackHandler):
+    """
+    Callback handler parsing the tokens of an agent's LLM calls as they arrive.
+
+    Completed list items are passed to `on_item`; a broken structure aborts the
+    call with a `StructureError`, so it can be retried before the end of the
+    generation.
+    """
+
+    raise_error = True
+    run_inline = True
+
+    def __init__(
+        self,
+        model_class: Type[BaseModel],
+        on_item: Optional[Callable[[str, BaseModel], Any]] = None,
+    ):
+        """
+        Initialize the handler.
+
+        Args:
+            model_class: The pydantic model of the agent output
+            on_item: Called with the field and the item of each completed item
+        """
+        self.model_class = model_class
+        self.on_item = on_item
+        self.parser = ItemParser(model_class)
+
+    def on_chat_model_start(self, *args, **kwargs):
+        self.parser = ItemParser(self.model_class)
+
+    def on_llm_start(self, *args, **kwargs):
+        self.parser = ItemParser(self.model_class)
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        for field, item in self.parser.feed(token):
+            if self.on_item is not None:
+                self.on_item(field, item)
+
+
+def stream_writer() -> Callable[[Any], None]:
+    """Writer of the custom events of the running graph, if any."""
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda _: None
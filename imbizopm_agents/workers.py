@@ -0,0 +1,556 @@
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain.chat_models import init_chat_model
+from langchain_core.language_models import BaseChatModel
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from loguru import logger
+
+from .agents.config import AgentState
+from .cache import ResultCache, credential_fingerprint
+from .capabilities import CapabilityProbe
+from .deadline import DeadlinePolicy
+from .hedging import Hedging
+
+DEFAULT_QUEUE_PATH = os.path.join(".imbizopm_workers", "tasks.sqlite")
+DEFAULT_POLL_INTERVAL = 0.05
+# Seconds after which a task claimed by a worker that died is handed out again
+DEFAULT_LEASE_TIMEOUT = 15 * 60
+# Seconds after which a task not updated, e.g. of an abandoned run, is deleted
+DEFAULT_TASK_TTL = 24 * 60 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    node TEXT NOT NULL,
+    model TEXT,
+    options TEXT NOT NULL,
+    state_type TEXT NOT NULL,
+    state BLOB NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    worker TEXT,
+    updated REAL NOT NULL
+)
+"""
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+class WorkerError(RuntimeError):
+    """A graph node failed in a worker process."""
+
+
+class WorkerQueue:
+    """
+    SQLite-backed queue dispatching graph nodes to worker processes.
+
+    The orchestrating process submits the state of each node execution and
+    waits for the state returned by the agent; workers claim pending tasks,
+    run the agent and store its result in the same row. States are serialized
+    like checkpoints. A task claimed by a worker that stopped responding is
+    handed out again after the lease timeout. The task of a cancelled node is
+    deleted, and tasks not updated within the TTL (whose run was abandoned)
+    are purged, so the queue file does not grow with the runs.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_QUEUE_PATH,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        lease_timeout: float = DEFAULT_LEASE_TIMEOUT,
+        task_ttl: Optional[float] = DEFAULT_TASK_TTL,
+    ):
+        """
+        Initialize the queue.
+
+        Args:
+            path: SQLite file shared by the orchestrator and the workers
+            poll_interval: Seconds between two checks for a task or a result
+            lease_timeout: Seconds after which a running task is handed out again
+            task_ttl: Seconds after which a task not updated is deleted, kept
+                if None
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self.task_ttl = task_ttl
+        self.serde = JsonPlusSerializer()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(_SCHEMA)
+
+    def submit(
+        self,
+        node: str,
+        state: AgentState,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """Queue the execution of a node on a state, returning the task id."""
+        state_type, data = self.serde.dumps_typed(dict(state))
+        self.purge()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO tasks (node, model, options, state_type, state, status,"
+                " updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    node,
+                    model,
+                    json.dumps(options or {}),
+                    state_type,
+                    data,
+                    PENDING,
+                    time.time(),
+                ),
+            )
+            return cursor.lastrowid
+
+    def claim(
+        self, worker_id: str
+    ) -> Optional[Tuple[int, str, Optional[str], Dict[str, Any], AgentState]]:
+        """
+        Claim the oldest pending task, or one whose lease expired.
+
+        Args:
+            worker_id: Identifier of the claiming worker
+
+        Returns:
+            The task id, node, model, options and state, or None if idle
+        """
+        expired = time.time() - self.lease_timeout
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, node, model, options, state_type, state FROM tasks"
+                    " WHERE status = ? OR (status = ? AND updated < ?)"
+                    " ORDER BY id LIMIT 1",
+                    (PENDING, RUNNING, expired),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE tasks SET status = ?, worker = ?, updated = ?"
+                        " WHERE id = ?",
+                        (RUNNING, worker_id, time.time(), row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        task_id, node, model, options, state_type, data = row
+        state = self.serde.loads_typed((state_type, data))
+        return task_id, node, model, json.loads(options), state
+
+    def complete(self, task_id: int, state: AgentState):
+        """Store the state returned by the node of a task."""
+        self._finish(task_id, DONE, self.serde.dumps_typed(dict(state)), None)
+
+    def fail(self, task_id: int, error: str):
+        """Record the error raised by the node of a task."""
+        self._finish(task_id, FAILED, ("null", b""), error)
+
+    def _finish(self, task_id: int, status: str, result: Tuple[str, bytes], error):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, state_type = ?, state = ?, error = ?,"
+                " updated = ? WHERE id = ?",
+                (status, result[0], result[1], error, time.time(), task_id),
+            )
+
+    def cancel(self, task_id: int):
+        """Delete a task whose result is no longer awaited."""
+        with self._lock:
+            self._conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def purge(self) -> int:
+        """Delete the tasks not updated within the TTL, returning their number."""
+        if self.task_ttl is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM tasks WHERE updated < ?", (time.time() - self.task_ttl,)
+            )
+        if cursor.rowcount:
+            logger.info(f"Purged {cursor.rowcount} expired tasks")
+        return cursor.rowcount
+
+    def poll(self, task_id: int) -> Optional[AgentState]:
+        """
+        Return the result of a task once finished, removing the task.
+
+        Raises:
+            WorkerError: If the node failed in the worker, or its task was
+                deleted
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT node, status, state_type, state, error FROM tasks"
+                " WHERE id = ?",
+                (task_id,),
+            ).fetchone()
+            if row is None:
+                raise WorkerError(f"Task {task_id} was cancelled or expired")
+            if row[1] not in (DONE, FAILED):
+                return None
+            self._conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+        node, status, state_type, data, error = row
+        if status == FAILED:
+            raise WorkerError(f"{node} failed in a worker: {error}")
+        return self.serde.loads_typed((state_type, data))
+
+    def wait(self, task_id: int) -> AgentState:
+        """Block until a task finished and return its result."""
+        try:
+            while (result := self.poll(task_id)) is None:
+                time.sleep(self.poll_interval)
+        except BaseException:
+            self.cancel(task_id)
+            raise
+        return result
+
+    async def await_result(self, task_id: int) -> AgentState:
+        """Async counterpart of `wait`, deleting the task if cancelled."""
+        try:
+            # Polled in a thread, so the locked query does not block the loop
+            while (result := await asyncio.to_thread(self.poll, task_id)) is None:
+                await asyncio.sleep(self.poll_interval)
+        except BaseException:
+            await asyncio.to_thread(self.cancel, task_id)
+            raise
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Number of tasks per status."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def node_functions(
+        self,
+        graph_config: Dict,
+        model: Optional[str] = None,
+        use_structured_output: bool = True,
+        use_async: bool = False,
+        model_kwargs: Optional[Dict[str, Any]] = None,
+        cache: Optional[ResultCache] = None,
+        hedging: Optional[Hedging] = None,
+        deadline_policy: Optional[DeadlinePolicy] = None,
+        capability_probe: Optional[CapabilityProbe] = None,
+    ) -> Dict[str, Callable]:
+        """
+        Node functions executing each node of a graph in the workers.
+
+        The options of the agents are sent along with each task. The API key
+        is only referenced by its fingerprint: the workers must hold the key
+        themselves (see `run_worker`).
+
+        Args:
+            graph_config: The graph configuration, sent to the workers so
+                they create the same agents, node models and loop limits
+            model: Model name the workers create the default model from
+            use_structured_output: Whether the agents request structured output
+            use_async: Whether to return coroutines
+            model_kwargs: Keyword arguments of the models, e.g. the API key
+            cache: Optional cache of agent outputs, opened by the workers
+            hedging: Not supported, its latency history and secondary model
+                live in this process
+            deadline_policy: Optional policy degrading the nodes of late runs,
+                recreated in the workers from its settings
+            capability_probe: Optional probe of the structured output modes,
+                sharing its file with the workers
+
+        Returns:
+            The function of each node, taking and returning the state
+
+        Raises:
+            ValueError: If an option cannot be forwarded to the workers
+        """
+        options = worker_options(
+            graph_config,
+            use_structured_output,
+            model_kwargs,
+            cache,
+            hedging,
+            deadline_policy,
+            capability_probe,
+        )
+
+        def dispatch(node: str) -> Callable:
+            if use_async:
+
+                async def arun(state: AgentState) -> AgentState:
+                    task_id = await asyncio.to_thread(
+                        self.submit, node, state, model, options
+                    )
+                    return await self.await_result(task_id)
+
+                return arun
+
+            def run(state: AgentState) -> AgentState:
+                return self.wait(self.submit(node, state, model, options))
+
+            return run
+
+        return {node: dispatch(node) for node in graph_config["nodes"]}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def dump_graph_config(graph_config: Dict) -> Dict[str, Any]:
+    """
+    JSON form of a graph configuration, naming each agent class by import path.
+
+    Raises:
+        ValueError: If the configuration holds other values than JSON
+    """
+    nodes = {}
+    for name, node_config in graph_config["nodes"].items():
+        nodes[name] = dict(node_config)
+        agent_class = node_config.get("agent_class")
+        if isinstance(agent_class, type):
+            nodes[name][
+                "agent_class"
+            ] = f"{agent_class.__module__}:{agent_class.__qualname__}"
+    try:
+        return json.loads(json.dumps({**graph_config, "nodes": nodes}))
+    except TypeError as e:
+        raise ValueError(f"The graph configuration cannot be sent to the workers: {e}")
+
+
+def load_graph_config(data: Dict[str, Any]) -> Dict:
+    """Graph configuration from its `dump_graph_config` form."""
+    nodes = {}
+    for name, node_config in data["nodes"].items():
+        nodes[name] = dict(node_config)
+        if "agent_class" not in node_config:
+            continue
+        module, qualname = node_config["agent_class"].split(":")
+        agent_class = importlib.import_module(module)
+        for attribute in qualname.split("."):
+            agent_class = getattr(agent_class, attribute)
+        nodes[name]["agent_class"] = agent_class
+    return {**data, "nodes": nodes}
+
+
+def worker_options(
+    graph_config: Optional[Dict] = None,
+    use_structured_output: bool = True,
+    model_kwargs: Optional[Dict[str, Any]] = None,
+    cache: Optional[ResultCache] = None,
+    hedging: Optional[Hedging] = None,
+    deadline_policy: Optional[DeadlinePolicy] = None,
+    capability_probe: Optional[CapabilityProbe] = None,
+) -> Dict[str, Any]:
+    """
+    JSON options of the tasks, from which the workers recreate the agents.
+
+    Raises:
+        ValueError: If an option cannot be forwarded to the workers
+    """
+    if hedging is not None:
+        raise ValueError("Hedging cannot be used with worker processes")
+    model_kwargs = dict(model_kwargs or {})
+    options: Dict[str, Any] = {"use_structured_output": use_structured_output}
+    if graph_config is not None:
+        options["graph_config"] = dump_graph_config(graph_config)
+    api_key = model_kwargs.pop("api_key", None)
+    if api_key:
+        options["credential"] = credential_fingerprint(api_key)
+    if model_kwargs:
+        try:
+            json.dumps(model_kwargs)
+        except TypeError as e:
+            raise ValueError(f"Model options cannot be sent to the workers: {e}")
+        options["model_kwargs"] = model_kwargs
+    if cache is not None:
+        options["cache"] = {
+            "path": cache.path,
+            "max_size_bytes": cache.max_size_bytes,
+        }
+    if deadline_policy is not None:
+        options["deadline_policy"] = {
+            "fallback_model": deadline_policy.fallback_model,
+            "default_estimate": deadline_policy.default_estimate,
+            "smoothing": deadline_policy.smoothing,
+        }
+    if capability_probe is not None:
+        options["capability_probe"] = {
+            "path": capability_probe.path,
+            "samples": capability_probe.samples,
+        }
+    return options
+
+
+def _worker_graph_kwargs(
+    options: Dict[str, Any],
+    model_kwargs: Dict[str, Any],
+    api_keys: Dict[str, str],
+    resources: Dict[Tuple[str, str], Any],
+) -> Dict[str, Any]:
+    """Keyword arguments of `create_node_functions` from the options of a task."""
+    model_kwargs = {**model_kwargs, **options.get("model_kwargs", {})}
+    credential = options.get("credential")
+    if credential:
+        if credential not in api_keys:
+            raise WorkerError(
+                "The worker has no API key matching the credential of the task;"
+                " start it with that key"
+            )
+        model_kwargs["api_key"] = api_keys[credential]
+
+    def shared(name: str, factory: Callable[..., Any]) -> Any:
+        # Opened once per worker, like the agents using them
+        if name not in options:
+            return None
+        key = (name, json.dumps(options[name], sort_keys=True))
+        if key not in resources:
+            resources[key] = factory(**options[name])
+        return resources[key]
+
+    return {
+        "use_structured_output": options.get("use_structured_output", True),
+        "model_kwargs": model_kwargs,
+        "cache": shared("cache", ResultCache),
+        "deadline_policy": shared("deadline_policy", DeadlinePolicy),
+        "capability_probe": shared("capability_probe", CapabilityProbe),
+    }
+
+
+def run_worker(
+    queue_path: str = DEFAULT_QUEUE_PATH,
+    default_model: Optional[str] = None,
+    graph_config: Optional[Dict] = None,
+    create_llm: Callable[..., BaseChatModel] = init_chat_model,
+    model_kwargs: Optional[Dict[str, Any]] = None,
+    stop_event: Optional[Any] = None,
+    worker_id: Optional[str] = None,
+    api_keys: Sequence[str] = (),
+):
+    """
+    Run agent nodes claimed from a worker queue until stopped.
+
+    The agents of each model are created on first use and kept for the next
+    tasks, so their clients and compiled subgraphs stay warm.
+
+    Args:
+        queue_path: SQLite file of the worker queue
+        default_model: Model of the tasks that do not name one
+        graph_config: The graph configuration of the tasks that do not send
+            their own
+        create_llm: Factory of chat models from a model name
+        model_kwargs: Keyword arguments of `create_llm`, e.g. the API key
+        stop_event: Event stopping the worker once set
+        worker_id: Identifier of the worker, generated if not provided
+        api_keys: API keys the tasks may reference, besides the one of
+            `model_kwargs`; a task referencing another key fails
+    """
+    # Imported here: the graph module imports this one
+    from .graph import DEFAULT_GRAPH_CONFIG, create_node_functions
+
+    graph_config = graph_config or DEFAULT_GRAPH_CONFIG
+    model_kwargs = model_kwargs or {}
+    worker_id = worker_id or f"worker-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    queue = WorkerQueue(queue_path)
+    keys = [model_kwargs.get("api_key"), *api_keys]
+    keys_by_credential = {credential_fingerprint(k): k for k in keys if k}
+    agents: Dict[Tuple[str, str], Dict[str, Callable]] = {}
+    resources: Dict[Tuple[str, str], Any] = {}
+    logger.info(f"Worker {worker_id} waiting for tasks on {queue_path}")
+
+    while stop_event is None or not stop_event.is_set():
+        task = queue.claim(worker_id)
+        if task is None:
+            time.sleep(queue.poll_interval)
+            continue
+        task_id, node, model, options, state = task
+        model = model or default_model
+        key = (model, json.dumps(options, sort_keys=True))
+        try:
+            if key not in agents:
+                graph_kwargs = _worker_graph_kwargs(
+                    options, model_kwargs, keys_by_credential, resources
+                )
+                task_graph_config = graph_config
+                if "graph_config" in options:
+                    task_graph_config = load_graph_config(options["graph_config"])
+                agents[key] = create_node_functions(
+                    create_llm(model, **graph_kwargs["model_kwargs"]),
+                    task_graph_config,
+                    create_llm=create_llm,
+                    **graph_kwargs,
+                )
+            queue.complete(task_id, agents[key][node](state))
+        except Exception as e:
+            logger.exception(f"Task {task_id} ({node}) failed")
+            queue.fail(task_id, f"{type(e).__name__}: {e}")
+    queue.close()
+
+
+class WorkerPool:
+    """Local worker processes serving a worker queue."""
+
+    def __init__(self, processes: int = 2, **worker_kwargs):
+        """
+        Initialize the pool.
+
+        Args:
+            processes: Number of worker processes
+            worker_kwargs: Keyword arguments of `run_worker`
+        """
+        self.processes = processes
+        self.worker_kwargs = worker_kwargs
+        # Spawned: forking a process running threads can deadlock the child
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = self._context.Event()
+        self._workers: List[multiprocessing.Process] = []
+
+    def start(self) -> "WorkerPool":
+        for _ in range(self.processes):
+            process = self._context.Process(
+                target=run_worker,
+                kwargs={**self.worker_kwargs, "stop_event": self._stop_event},
+                daemon=True,
+            )
+            process.start()
+            self._workers.append(process)
+        return self
+
+    def join(self):
+        for process in self._workers:
+            process.join()
+
+    def close(self, timeout: float = 10):
+        """Stop the workers once their current task finished."""
+        self._stop_event.set()
+        for process in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
+
+    def __enter__(self) -> "WorkerPool":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
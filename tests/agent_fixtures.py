@@ -0,0 +1,78 @@
+"""
+Shared fixtures for the agent graph tests.
+"""
+
+import asyncio
+import json
+import re
+from typing import Any, Dict, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from imbizopm_agents import dtypes
+
+# Valid example output for each agent, keyed by the name used in its prompt
+AGENT_EXAMPLES = {
+    "Clarifier": dtypes.ProjectPlan.example(),
+    "Planner": dtypes.ProjectPlanOutput.example()["not_too_vague_project"],
+    "Scoper": dtypes.ScopeDefinition.example()["manageable_scope"],
+    "Taskifier": dtypes.TaskPlan.example()["complete_plan"],
+    "Timeline": dtypes.ProjectTimeline.example(),
+    "Risk": dtypes.FeasibilityAssessment.example()["feasible_assessment_example"],
+    "Validator": dtypes.PlanValidation.example()["validated"],
+    "PM Adapter": dtypes.ProjectSummary.example(),
+    "Negotiator": dtypes.ConflictResolution.example(),
+}
+
+
+def find_agent(messages) -> str:
+    """Return the agent name announced in the prompt messages."""
+    text = "\n".join(str(m.content) for m in messages)
+    match = re.search(r"You are the \**([A-Za-z ]+?) Agent", text)
+    return match.group(1) if match else ""
+
+
+class FakeAgentChatModel(BaseChatModel):
+    """Chat model answering every agent prompt with that agent's example JSON."""
+
+    model_name: str = "fake-agent-model"
+    delay: float = 0.0
+    calls: List[str] = []
+    # Outputs replacing the AGENT_EXAMPLES entry of an agent
+    examples: Dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-agent"
+
+    def _respond(self, messages) -> str:
+        agent = find_agent(messages)
+        self.calls.append(agent)
+        body = json.dumps(self.examples.get(agent, AGENT_EXAMPLES.get(agent, {})))
+        return f"Here is the output:\n```json\n{body}\n```"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(content=self._respond(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        message = AIMessage(content=self._respond(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._respond(messages)
+        for i in range(0, len(text), 32):
+            chunk = ChatGenerationChunk(
+                message=AIMessageChunk(content=text[i : i + 32])
+            )
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def create_fake_llm(model_name: str, **kwargs) -> FakeAgentChatModel:
+    """Chat model factory, importable by worker processes."""
+    return FakeAgentChatModel(model_name=model_name, calls=[])
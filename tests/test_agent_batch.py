@@ -0,0 +1,114 @@
+"""
+Tests for batch planning over many project ideas.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from imbizopm_agents import create_project_planning_graph
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.batch import (
+    BatchResult,
+    arun_planning_batch,
+    load_ideas,
+    summarize_batch,
+)
+
+from .agent_fixtures import FakeAgentChatModel, find_agent
+
+
+class TestPlanningBatch(unittest.TestCase):
+    """Test cases for planning a batch of ideas."""
+
+    def run_batch(self, llm, ideas, concurrency):
+        graph = create_project_planning_graph(
+            llm, use_checkpointing=False, use_structured_output=False, use_async=True
+        )
+
+        async def collect():
+            return [
+                result
+                async for result in arun_planning_batch(
+                    graph, ideas, concurrency=concurrency
+                )
+            ]
+
+        return asyncio.run(collect())
+
+    def test_plans_every_idea(self):
+        """Test each idea yields a record with its final state."""
+        llm = FakeAgentChatModel(calls=[])
+        ideas = [(str(i), f"Idea {i}") for i in range(5)]
+        results = self.run_batch(llm, ideas, concurrency=2)
+
+        self.assertEqual(sorted(r.idea_id for r in results), ["0", "1", "2", "3", "4"])
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual(result.state["backward"], AgentRoute.PMAdapterAgent)
+            record = json.loads(json.dumps(result.to_record()))
+            self.assertEqual(record["state"]["input"], f"Idea {result.idea_id}")
+
+    def test_bounds_concurrency(self):
+        """Test no more than `concurrency` runs are in flight at once."""
+        in_flight = {"now": 0, "max": 0}
+
+        class TrackingChatModel(FakeAgentChatModel):
+            async def _agenerate(self, messages, stop=None, run_manager=None, **kw):
+                if find_agent(messages) == "Clarifier":
+                    in_flight["now"] += 1
+                    in_flight["max"] = max(in_flight["max"], in_flight["now"])
+                result = await super()._agenerate(messages, stop, run_manager, **kw)
+                if find_agent(messages) == "PM Adapter":
+                    in_flight["now"] -= 1
+                return result
+
+        ideas = [(str(i), f"Idea {i}") for i in range(6)]
+        self.run_batch(TrackingChatModel(calls=[], delay=0.01), ideas, concurrency=2)
+        self.assertEqual(in_flight["max"], 2)
+
+    def test_failed_run_does_not_stop_batch(self):
+        """Test a failing idea is reported while the others complete."""
+
+        class FailingChatModel(FakeAgentChatModel):
+            def _respond(self, messages):
+                if "Broken" in str(messages[-1].content):
+                    raise RuntimeError("Provider unavailable")
+                return super()._respond(messages)
+
+        results = self.run_batch(
+            FailingChatModel(calls=[]), [("a", "Broken idea"), ("b", "Idea")], 2
+        )
+        by_id = {result.idea_id: result for result in results}
+        self.assertEqual(by_id["a"].to_record()["error"], "Provider unavailable")
+        self.assertIsNone(by_id["b"].error)
+
+    def test_load_ideas(self):
+        """Test ideas are read from strings or objects, numbered by line."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "ideas.jsonl")
+            with open(path, "w") as f:
+                f.write('"Bakery website"\n\n')
+                f.write('{"id": "gym", "idea": "Fitness app"}\n')
+                f.write('{"input": "Chat bot"}\n')
+            self.assertEqual(
+                load_ideas(path),
+                [("1", "Bakery website"), ("gym", "Fitness app"), ("4", "Chat bot")],
+            )
+
+    def test_summarize_batch(self):
+        """Test throughput and latency percentiles of a batch."""
+        results = [BatchResult(str(i), f"batch-{i}", float(i)) for i in range(1, 11)]
+        results[0].error = "failed"
+        summary = summarize_batch(results, wall_time=30.0)
+        self.assertEqual(summary["runs"], 10)
+        self.assertEqual(summary["failed"], 1)
+        self.assertEqual(summary["runs_per_minute"], 20.0)
+        self.assertEqual(summary["latency_p50"], 6.0)
+        self.assertEqual(summary["latency_max"], 10.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Tests for the agent result cache.
+"""
+
+import os
+import tempfile
+import unittest
+
+from imbizopm_agents import (
+    ResultCache,
+    create_project_planning_graph,
+    run_project_planning_graph,
+)
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.dtypes import ProjectPlan
+
+from .agent_fixtures import FakeAgentChatModel
+
+
+class TestResultCache(unittest.TestCase):
+    """Test cases for the content-addressed result cache."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite")
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.tmpdir.cleanup()
+
+    def test_hit_and_miss_counters(self):
+        """Test lookups are counted per agent."""
+        cache = ResultCache(self.path)
+        key = ResultCache.make_key("ClarifierAgent", "v1", "model", "input")
+        value = ProjectPlan(**ProjectPlan.example())
+
+        self.assertIsNone(cache.get("ClarifierAgent", key, ProjectPlan))
+        cache.put("ClarifierAgent", key, value)
+        self.assertEqual(cache.get("ClarifierAgent", key, ProjectPlan), value)
+        self.assertEqual(cache.stats(), {"ClarifierAgent": {"hits": 1, "misses": 1}})
+
+    def test_key_depends_on_every_part(self):
+        """Test a different prompt version or model gives a different key."""
+        key = ResultCache.make_key("ClarifierAgent", "v1", "model", "input")
+        self.assertNotEqual(
+            key, ResultCache.make_key("ClarifierAgent", "v2", "model", "input")
+        )
+        self.assertNotEqual(
+            key, ResultCache.make_key("ClarifierAgent", "v1", "other", "input")
+        )
+
+    def test_lru_eviction(self):
+        """Test the least recently used entries are evicted beyond the size bound."""
+        value = ProjectPlan(**ProjectPlan.example())
+        cache = ResultCache(
+            self.path, max_size_bytes=2 * len(value.model_dump_json()) + 1
+        )
+        cache.put("ClarifierAgent", "a", value)
+        cache.put("ClarifierAgent", "b", value)
+        cache.get("ClarifierAgent", "a", ProjectPlan)
+        cache.put("ClarifierAgent", "c", value)
+
+        self.assertIsNotNone(cache.get("ClarifierAgent", "a", ProjectPlan))
+        self.assertIsNone(cache.get("ClarifierAgent", "b", ProjectPlan))
+        self.assertIsNotNone(cache.get("ClarifierAgent", "c", ProjectPlan))
+        self.assertLessEqual(cache.size_bytes(), cache.max_size_bytes)
+
+    def test_graph_run_reuses_cached_outputs(self):
+        """Test a repeated run does not call the LLM and produces the same plan."""
+        cache = ResultCache(self.path)
+        results = []
+        for _ in range(2):
+            llm = FakeAgentChatModel(calls=[])
+            graph = create_project_planning_graph(
+                llm, use_structured_output=False, cache=cache
+            )
+            events = list(
+                run_project_planning_graph(
+                    graph, "Bakery website", recursion_limit=30, print_results=False
+                )
+            )
+            results.append((llm.calls, events[-1][AgentRoute.PMAdapterAgent]))
+
+        self.assertTrue(results[0][0])
+        self.assertEqual(results[1][0], [])
+        self.assertEqual(results[0][1], results[1][1])
+        self.assertEqual(cache.stats()["PMAdapterAgent"], {"hits": 1, "misses": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
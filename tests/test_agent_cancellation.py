@@ -0,0 +1,125 @@
+"""
+Tests for cancelling planning runs in flight.
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from imbizopm_agents import (
+    arun_project_planning_graph,
+    create_project_planning_graph,
+    resume_project_planning_graph,
+    run_project_planning_graph,
+)
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.cancellation import (
+    CANCELLED_FIELD,
+    CancellationToken,
+    RunCancelled,
+    RunRegistry,
+)
+
+from .agent_fixtures import FakeAgentChatModel, find_agent
+
+
+class CancellingModel(FakeAgentChatModel):
+    """Chat model cancelling its run while streaming the Planner output."""
+
+    token: CancellationToken = None
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for i, chunk in enumerate(super()._stream(messages, stop, run_manager)):
+            if find_agent(messages) == "Planner" and i == 2:
+                self.token.cancel("Stopped by the user")
+            yield chunk
+
+
+class HangingModel(FakeAgentChatModel):
+    """Chat model whose Planner request never answers."""
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if find_agent(messages) == "Planner":
+            await asyncio.sleep(30)
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+class TestCancellation(unittest.TestCase):
+    """Test cases for cooperative cancellation of runs."""
+
+    def test_cancel_aborts_streaming_call(self):
+        """Test a cancelled run stops mid-agent, is marked and can be resumed."""
+        token = CancellationToken()
+        llm = CancellingModel(calls=[], token=token)
+        graph = create_project_planning_graph(llm, use_structured_output=False)
+
+        events = []
+        with self.assertRaises(RunCancelled):
+            for event in run_project_planning_graph(
+                graph,
+                "Bakery website",
+                thread_id="run-1",
+                recursion_limit=30,
+                print_results=False,
+                stream_tokens=True,
+                cancellation=token,
+            ):
+                events.append(event)
+
+        self.assertEqual(llm.calls, ["Clarifier", "Planner"])
+        snapshot = graph.get_state({"configurable": {"thread_id": "run-1"}})
+        self.assertEqual(snapshot.values[CANCELLED_FIELD], "Stopped by the user")
+        self.assertEqual(snapshot.next, ("PlannerAgentNode",))
+
+        final_state = list(
+            resume_project_planning_graph(
+                graph, "run-1", recursion_limit=30, print_results=False
+            )
+        )[-1]
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertIsNone(final_state.get(CANCELLED_FIELD))
+
+    def test_async_cancel_interrupts_pending_request(self):
+        """Test cancelling an async run interrupts the request in flight."""
+        token = CancellationToken()
+        graph = create_project_planning_graph(
+            HangingModel(calls=[]), use_structured_output=False, use_async=True
+        )
+
+        async def run():
+            async for _ in arun_project_planning_graph(
+                graph,
+                "Bakery website",
+                thread_id="run-1",
+                recursion_limit=30,
+                print_results=False,
+                cancellation=token,
+            ):
+                pass
+
+        # Cancelled from another thread, as from a UI callback
+        threading.Timer(0.2, token.cancel).start()
+        start = time.perf_counter()
+        with self.assertRaises(RunCancelled):
+            asyncio.run(run())
+
+        self.assertLess(time.perf_counter() - start, 5)
+        snapshot = graph.get_state({"configurable": {"thread_id": "run-1"}})
+        self.assertEqual(snapshot.values[CANCELLED_FIELD], "Cancelled")
+
+    def test_registry_cancels_by_run_id(self):
+        """Test runs are cancelled by ID while in flight only."""
+        registry = RunRegistry()
+        token = registry.register("run-1")
+        self.assertEqual(registry.active(), ["run-1"])
+        self.assertFalse(registry.cancel("run-2"))
+        self.assertTrue(registry.cancel("run-1"))
+        self.assertTrue(token.cancelled)
+
+        registry.release("run-1")
+        self.assertFalse(registry.cancel("run-1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
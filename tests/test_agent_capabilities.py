@@ -0,0 +1,236 @@
+"""
+Tests for probing the structured output modes of each model.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from imbizopm_agents import create_project_planning_graph, run_project_planning_graph
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.agents.taskifier_agent import TaskifierAgent
+from imbizopm_agents.cache import get_model_id
+from imbizopm_agents.capabilities import (
+    FUNCTION_CALLING,
+    JSON_MODE,
+    JSON_SCHEMA,
+    TEXT,
+    CapabilityProbe,
+)
+from imbizopm_agents.dtypes import TaskPlan
+
+from .agent_fixtures import AGENT_EXAMPLES, FakeAgentChatModel, find_agent
+
+
+class ToolCallingModel(FakeAgentChatModel):
+    """Chat model answering with a call of the bound schema, its only mode."""
+
+    tool_name: str = ""
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tool_name": tools[0].__name__})
+
+    def with_structured_output(self, schema, *, method=None, **kwargs):
+        if method not in (None, FUNCTION_CALLING):
+            raise NotImplementedError(method)
+        return super().with_structured_output(schema, **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(self.tool_name)
+        args = AGENT_EXAMPLES.get(find_agent(messages), {})
+        if self.tool_name == "_ProbeAnswer":
+            args = {"answer": 42}
+        message = AIMessage(
+            content="",
+            tool_calls=[{"name": self.tool_name, "args": args, "id": "call-1"}],
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class MalformedToolCallModel(ToolCallingModel):
+    """Chat model answering agents with tool call arguments that do not parse."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.tool_name == "_ProbeAnswer":
+            return super()._generate(messages, stop, run_manager, **kwargs)
+        self.calls.append(self.tool_name)
+        args = json.dumps(AGENT_EXAMPLES[find_agent(messages)])[:-1] + ",}"
+        message = AIMessage(
+            content="",
+            invalid_tool_calls=[
+                {"name": self.tool_name, "args": args, "id": "call-1", "error": None}
+            ],
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class UnreachableModel(FakeAgentChatModel):
+    """Chat model whose requests all fail."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise ConnectionError("Model unreachable")
+
+
+class TestCapabilityProbe(unittest.TestCase):
+    """Test cases for choosing the structured output mode of each model."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "capabilities.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_probe_picks_supported_mode(self):
+        """Test the only working mode is chosen and the result stored on disk."""
+        llm = ToolCallingModel(calls=[])
+        probe = CapabilityProbe(self.path)
+
+        self.assertEqual(probe.capabilities(llm), [FUNCTION_CALLING, TEXT])
+        self.assertEqual(probe.best_mode(llm), FUNCTION_CALLING)
+        self.assertEqual(llm.calls, ["_ProbeAnswer"])
+        with open(self.path) as f:
+            self.assertIn("ToolCallingModel:fake-agent-model", json.load(f))
+
+        # Known models are not probed again, even by a new probe
+        llm.calls.clear()
+        self.assertEqual(CapabilityProbe(self.path).best_mode(llm), FUNCTION_CALLING)
+        self.assertEqual(llm.calls, [])
+
+    def test_model_without_structured_output_uses_text(self):
+        """Test models supporting no structured output answer in text."""
+        probe = CapabilityProbe(self.path)
+        self.assertEqual(probe.best_mode(FakeAgentChatModel(calls=[])), TEXT)
+        self.assertEqual(
+            probe.structured_output_kwargs(FakeAgentChatModel(calls=[])),
+            {"use_structured_output": False},
+        )
+
+    def test_unreachable_model_is_not_stored(self):
+        """Test failed requests do not record the model as unsupported."""
+        probe = CapabilityProbe(self.path)
+        self.assertEqual(probe.best_mode(UnreachableModel(calls=[])), TEXT)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_best_mode_ranking(self):
+        """Test modes are ranked by failure rate, then tokens per probe call."""
+        llm = FakeAgentChatModel(calls=[])
+        result = {"calls": 1, "failures": 0, "errors": 0}
+        with open(self.path, "w") as f:
+            json.dump(
+                {
+                    get_model_id(llm): {
+                        JSON_SCHEMA: {**result, "tokens": 90},
+                        FUNCTION_CALLING: {**result, "tokens": 60},
+                        JSON_MODE: {**result, "failures": 1, "tokens": 10},
+                    }
+                },
+                f,
+            )
+        probe = CapabilityProbe(self.path)
+        self.assertEqual(probe.best_mode(llm), FUNCTION_CALLING)
+
+        # Failing agent calls demote the mode
+        probe.record(llm, FUNCTION_CALLING, failed=True)
+        probe.record(llm, JSON_SCHEMA, failed=False)
+        self.assertEqual(probe.best_mode(llm), JSON_SCHEMA)
+        probe.flush()
+        with open(self.path) as f:
+            stored = json.load(f)[get_model_id(llm)][FUNCTION_CALLING]
+        self.assertEqual((stored["agent_calls"], stored["agent_failures"]), (1, 1))
+
+    def test_unreadable_file_is_probed_again(self):
+        """Test a corrupt results file is ignored rather than raising."""
+        with open(self.path, "w") as f:
+            f.write('{"ToolCallingModel:fake-agent-model": {')
+        llm = ToolCallingModel(calls=[])
+
+        self.assertEqual(CapabilityProbe(self.path).best_mode(llm), FUNCTION_CALLING)
+        self.assertEqual(llm.calls, ["_ProbeAnswer"])
+        with open(self.path) as f:
+            self.assertIn(get_model_id(llm), json.load(f))
+
+    def test_records_are_saved_in_batches(self):
+        """Test agent outcomes are saved every few records, merged atomically."""
+        llm = ToolCallingModel(calls=[])
+        probe = CapabilityProbe(self.path, save_every=3)
+        probe.best_mode(llm)
+        # Another process sharing the file probes a second model
+        other = CapabilityProbe(self.path)
+        other.best_mode(FakeAgentChatModel(calls=[]))
+        mtime = os.stat(self.path).st_mtime_ns
+
+        probe.record(llm, FUNCTION_CALLING, failed=True)
+        probe.record(llm, FUNCTION_CALLING, failed=False)
+        self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+        probe.record(llm, FUNCTION_CALLING, failed=False)
+
+        with open(self.path) as f:
+            stored = json.load(f)
+        self.assertIn(get_model_id(FakeAgentChatModel(calls=[])), stored)
+        result = stored[get_model_id(llm)][FUNCTION_CALLING]
+        self.assertEqual((result["agent_calls"], result["agent_failures"]), (3, 1))
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["capabilities.json"])
+
+        # Flushing saves the remaining records without counting them twice
+        probe.record(llm, FUNCTION_CALLING, failed=True)
+        probe.flush()
+        probe.flush()
+        with open(self.path) as f:
+            result = json.load(f)[get_model_id(llm)][FUNCTION_CALLING]
+        self.assertEqual((result["agent_calls"], result["agent_failures"]), (4, 2))
+
+    def test_unparsed_structured_output_falls_back_to_text(self):
+        """Test an answer not matching the schema is repaired and recorded."""
+        llm = MalformedToolCallModel(calls=[])
+        probe = CapabilityProbe(self.path)
+        agent = TaskifierAgent(
+            llm, capability_probe=probe, **probe.structured_output_kwargs(llm)
+        )
+
+        _, parsed_content = agent._generate("Bakery website")
+
+        self.assertIsInstance(parsed_content, TaskPlan)
+        self.assertEqual(
+            parsed_content.model_dump(),
+            TaskPlan.model_validate(AGENT_EXAMPLES["Taskifier"]).model_dump(),
+        )
+        self.assertEqual(probe.results(llm)[FUNCTION_CALLING]["agent_failures"], 1)
+
+    def test_agents_use_probed_mode(self):
+        """Test the agents of a graph request the probed structured output."""
+        llm = ToolCallingModel(calls=[])
+        graph = create_project_planning_graph(
+            llm,
+            use_structured_output=False,
+            capability_probe=CapabilityProbe(self.path),
+        )
+        llm.calls.clear()
+        final_state = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )[-1]
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(
+            final_state[AgentRoute.TaskifierAgent].model_dump(),
+            type(final_state[AgentRoute.TaskifierAgent])
+            .model_validate(AGENT_EXAMPLES["Taskifier"])
+            .model_dump(),
+        )
+        # One call per agent, each returning the output model of the agent
+        self.assertEqual(len(llm.calls), len(set(llm.calls)))
+        self.assertIn("TaskPlan", llm.calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
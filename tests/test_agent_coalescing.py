@@ -0,0 +1,185 @@
+"""
+Tests for coalescing identical concurrent planning runs.
+"""
+
+import threading
+import unittest
+
+from imbizopm_agents import create_project_planning_graph, run_project_planning_graph
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.coalescing import RunCoalescer
+
+from .agent_fixtures import FakeAgentChatModel
+
+
+class TestRunCoalescer(unittest.TestCase):
+    """Test cases for attaching identical submissions to the run in flight."""
+
+    def test_key_normalizes_input(self):
+        """Test submissions differing only by spacing and case share a key."""
+        key = RunCoalescer.make_key("Bakery  website ", "model", {"nodes": {}})
+        self.assertEqual(
+            key, RunCoalescer.make_key(" bakery website", "model", {"nodes": {}})
+        )
+        self.assertNotEqual(
+            key, RunCoalescer.make_key("Bakery website", "other-model", {"nodes": {}})
+        )
+        self.assertNotEqual(key, RunCoalescer.make_key("Bakery website", "model", {}))
+
+    def test_concurrent_submissions_share_one_run(self):
+        """Test a submission made while a run is in flight receives all its events."""
+        coalescer = RunCoalescer()
+        release = threading.Event()
+        starts = []
+
+        def start():
+            starts.append(1)
+            yield "first"
+            release.wait(5)
+            yield "second"
+
+        leader = coalescer.join("key", start, run_id="run-1")
+        follower = coalescer.join("key", start, run_id="run-2")
+        self.assertIs(follower, leader)
+        self.assertEqual(follower.run_id, "run-1")
+
+        results = []
+        readers = [
+            threading.Thread(target=lambda f=f: results.append(list(f)))
+            for f in (leader, follower)
+        ]
+        for reader in readers:
+            reader.start()
+        release.set()
+        for reader in readers:
+            reader.join(5)
+
+        self.assertEqual(results, [["first", "second"], ["first", "second"]])
+        self.assertEqual(len(starts), 1)
+        self.assertEqual(
+            coalescer.stats(), {"started": 1, "coalesced": 1, "in_flight": 0}
+        )
+
+        # The key is released once the run finished
+        self.assertEqual(
+            list(coalescer.join("key", start, run_id="run-3")), ["first", "second"]
+        )
+        self.assertEqual(len(starts), 2)
+
+    def test_error_reaches_every_subscriber(self):
+        """Test a failed run raises its error to every attached submission."""
+        coalescer = RunCoalescer()
+        release = threading.Event()
+
+        def start():
+            release.wait(5)
+            yield "first"
+            raise ValueError("Failed to parse output again")
+
+        flights = [coalescer.join("key", start) for _ in range(2)]
+        release.set()
+        for flight in flights:
+            with self.assertRaises(ValueError):
+                list(flight)
+
+    def test_abandoned_run_is_released(self):
+        """Test a run is cancelled once every submission stopped following it."""
+        coalescer = RunCoalescer()
+        abandoned = threading.Event()
+        release = threading.Event()
+
+        def start():
+            yield "first"
+            release.wait(5)
+            yield "second"
+
+        flights = [
+            coalescer.join("key", start, on_abandoned=abandoned.set) for _ in range(2)
+        ]
+        iterators = [iter(flight) for flight in flights]
+        for iterator in iterators:
+            self.assertEqual(next(iterator), "first")
+
+        iterators[0].close()
+        self.assertFalse(abandoned.is_set())
+        iterators[1].close()
+        self.assertTrue(abandoned.is_set())
+        # A new submission does not join the abandoned run
+        self.assertIsNot(coalescer.join("key", start), flights[0])
+        release.set()
+
+    def test_graph_run_is_shared(self):
+        """Test identical planning submissions call the agents once."""
+        llm = FakeAgentChatModel(calls=[])
+        graph = create_project_planning_graph(llm, use_structured_output=False)
+        coalescer = RunCoalescer()
+        key = RunCoalescer.make_key("Bakery website", "fake-agent-model")
+
+        def start():
+            return run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+
+        flights = [coalescer.join(key, start) for _ in range(3)]
+        final_states = [list(flight)[-1] for flight in flights]
+
+        for final_state in final_states:
+            self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(llm.calls.count("Taskifier"), 1)
+
+    def test_abandoned_run_is_not_joined(self):
+        """Test a submission after every subscriber left starts a new run."""
+        abandoned = []
+        coalescer = RunCoalescer()
+        release = threading.Event()
+
+        def start():
+            yield "first"
+            release.wait(5)
+            yield "second"
+
+        flight = coalescer.join(
+            "key", start, run_id="run-1", on_abandoned=lambda: abandoned.append(1)
+        )
+        events = iter(flight)
+        self.assertEqual(next(events), "first")
+        events.close()
+        self.assertTrue(flight.cancelling)
+        self.assertEqual(abandoned, [1])
+
+        # A subscriber attaching while the abandon runs is refused
+        with coalescer._lock:
+            self.assertFalse(flight._join())
+        other = coalescer.join("key", start, run_id="run-2")
+        self.assertIsNot(other, flight)
+        self.assertEqual(flight.subscribers, 0)
+        release.set()
+        self.assertEqual(list(other), ["first", "second"])
+
+    def test_replay_buffer_is_bounded(self):
+        """Test late subscribers replay a bounded window, transient events first out."""
+        coalescer = RunCoalescer(
+            max_events=8, is_transient=lambda event: event[0] == "token"
+        )
+        release = threading.Event()
+        events = [("update", 0)] + [("token", i) for i in range(20)] + [("update", 1)]
+
+        def start():
+            yield from events
+            release.wait(5)
+
+        flight = coalescer.join("key", start)
+        while flight._sequence < len(events):
+            threading.Event().wait(0.01)
+        late = coalescer.join("key", start)
+        release.set()
+        replayed = list(late)
+
+        self.assertLessEqual(len(flight._events), 8)
+        self.assertEqual(replayed[0], ("update", 0))
+        self.assertEqual(replayed[-1], ("update", 1))
+        self.assertEqual(flight.dropped_events, len(events) - len(flight._events))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Tests for degrading the agents of runs falling behind their deadline.
+"""
+
+import unittest
+
+from imbizopm_agents import (
+    DEFAULT_GRAPH_CONFIG,
+    create_project_planning_graph,
+    dtypes,
+    run_project_planning_graph,
+)
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.deadline import DEADLINE_FIELD, DEGRADED_FIELD, DeadlinePolicy
+
+from .agent_fixtures import FakeAgentChatModel
+
+
+class TestDeadlinePolicy(unittest.TestCase):
+    """Test cases for keeping runs within their time budget."""
+
+    def setUp(self):
+        self.llm = FakeAgentChatModel(calls=[])
+        self.fallback_llm = FakeAgentChatModel(model_name="fast-model", calls=[])
+        self.created = []
+
+    def create_llm(self, model_name, **kwargs):
+        self.created.append(model_name)
+        return self.fallback_llm
+
+    def run_graph(self, policy, deadline):
+        graph = create_project_planning_graph(
+            self.llm,
+            use_structured_output=False,
+            create_llm=self.create_llm,
+            deadline_policy=policy,
+        )
+        return list(
+            run_project_planning_graph(
+                graph,
+                "Bakery website",
+                recursion_limit=30,
+                print_results=False,
+                deadline=deadline,
+            )
+        )[-1]
+
+    def test_expected_remaining_follows_shortest_path(self):
+        """Test the remaining time is estimated along the shortest path to the end."""
+        policy = DeadlinePolicy(default_estimate=10)
+        policy.wrap_nodes(DEFAULT_GRAPH_CONFIG, {}, {})
+        self.assertEqual(policy.expected_remaining(AgentRoute.PMAdapterAgent), 10)
+        self.assertEqual(policy.expected_remaining(AgentRoute.ValidatorAgent), 20)
+
+        policy.observe(AgentRoute.PMAdapterAgent, 2)
+        self.assertEqual(policy.expected_remaining(AgentRoute.ValidatorAgent), 12)
+        self.assertIsNone(policy.check(AgentRoute.ValidatorAgent, {}))
+        self.assertIsNotNone(
+            policy.check(AgentRoute.ValidatorAgent, {DEADLINE_FIELD: 0.0})
+        )
+
+    def test_run_within_budget_is_not_degraded(self):
+        """Test a run ahead of its deadline uses the configured models."""
+        policy = DeadlinePolicy(fallback_model="fast-model")
+        final_state = self.run_graph(policy, deadline=3600)
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertFalse(final_state.get(DEGRADED_FIELD))
+        self.assertEqual(self.created, ["fast-model"])
+        self.assertEqual(self.fallback_llm.calls, [])
+        self.assertIn(AgentRoute.TaskifierAgent, policy.stats())
+
+    def test_late_run_uses_fallback_model(self):
+        """Test the nodes of a late run switch to the fallback model."""
+        policy = DeadlinePolicy(fallback_model="fast-model", default_estimate=60)
+        final_state = self.run_graph(policy, deadline=1)
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(self.llm.calls, [])
+        self.assertIn("Taskifier", self.fallback_llm.calls)
+        self.assertIn("fallback model", final_state[DEGRADED_FIELD]["TaskifierAgent"])
+
+    def test_late_run_skips_loop_backs(self):
+        """Test a late node without a fallback model moves forward in one pass."""
+        self.llm.examples = {
+            "Validator": dtypes.PlanValidation.example()["not_validated"]
+        }
+        final_state = self.run_graph(DeadlinePolicy(default_estimate=60), deadline=1)
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(self.llm.calls.count("Validator"), 1)
+        self.assertIn(
+            "ValidatorAgent -> PMAdapterAgent instead of PlannerAgent",
+            final_state[DEGRADED_FIELD]["ValidatorAgent"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
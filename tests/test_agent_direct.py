@@ -0,0 +1,84 @@
+"""
+Tests for the direct model calls of tool-less agents.
+"""
+
+import unittest
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+from langgraph.graph.graph import CompiledGraph
+
+from imbizopm_agents.agents.clarifier_agent import ClarifierAgent
+from imbizopm_agents.dtypes import ProjectPlan
+
+from .agent_fixtures import AGENT_EXAMPLES, FakeAgentChatModel, find_agent
+
+
+class ToolCallingModel(FakeAgentChatModel):
+    """Chat model answering with a call of the output schema as a tool."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(find_agent(messages))
+        message = AIMessage(
+            content="",
+            tool_calls=[
+                {
+                    "name": ProjectPlan.__name__,
+                    "args": AGENT_EXAMPLES["Clarifier"],
+                    "id": "call-1",
+                }
+            ],
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+@tool
+def search(query: str) -> str:
+    """Search the web."""
+    return query
+
+
+class TestDirectAgent(unittest.TestCase):
+    """Test cases for agents calling the model without a React agent."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.llm = FakeAgentChatModel(calls=[])
+        self.agent = ClarifierAgent(self.llm)
+        self.inputs = {"messages": self.agent._format_input("Bakery website")}
+
+    def test_same_output_as_react_agent(self):
+        """Test the direct call returns the messages of the React agent."""
+        direct_output = self.agent.agent.invoke(self.inputs)
+        react_output = self.agent._create_react_agent(self.llm).invoke(self.inputs)
+
+        self.assertNotIsInstance(self.agent.agent, CompiledGraph)
+        self.assertEqual(
+            [(m.type, m.content) for m in direct_output["messages"]],
+            [(m.type, m.content) for m in react_output["messages"]],
+        )
+        self.assertEqual(self.llm.calls, ["Clarifier", "Clarifier"])
+
+    def test_structured_output_single_call(self):
+        """Test structured outputs come from the single model call."""
+        llm = ToolCallingModel(calls=[])
+        agent = ClarifierAgent(llm, use_structured_output=True)
+
+        output = agent.agent.invoke({"messages": agent._format_input("Bakery website")})
+
+        self.assertIsInstance(output["structured_response"], ProjectPlan)
+        self.assertEqual(llm.calls, ["Clarifier"])
+        self.assertIsInstance(output["messages"][-1], AIMessage)
+
+    def test_agent_with_tools_uses_react_agent(self):
+        """Test agents given tools keep the React agent calling them."""
+        agent = ClarifierAgent(ToolCallingModel(calls=[]), tools=[search])
+        self.assertIsInstance(agent.agent, CompiledGraph)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Tests for fast draft plans refined in the background.
+"""
+
+import unittest
+
+from imbizopm_agents import create_project_planning_graph, run_project_planning_graph
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.draft import (
+    DRAFT_EVENT,
+    draft_graph_config,
+    refine_in_background,
+    refine_project_planning_graph,
+    run_draft_planning_graph,
+)
+from imbizopm_agents.events import UPDATES_EVENT
+
+from .agent_fixtures import FakeAgentChatModel
+
+DRAFT_CALLS = ["Clarifier", "Planner", "Taskifier", "Timeline", "PM Adapter"]
+REFINEMENT_CALLS = ["Scoper", "Risk", "Validator", "PM Adapter"]
+
+
+class TestDraftPlanning(unittest.TestCase):
+    """Test cases for draft runs and their refinement."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.llm = FakeAgentChatModel(calls=[])
+        self.graph = create_project_planning_graph(
+            self.llm, use_structured_output=False
+        )
+        self.draft_graph = create_project_planning_graph(
+            self.llm, graph_config=draft_graph_config(), use_structured_output=False
+        )
+
+    def run_draft(self):
+        return list(
+            run_project_planning_graph(
+                self.draft_graph,
+                "Bakery website",
+                thread_id="draft",
+                recursion_limit=30,
+                print_results=False,
+            )
+        )[-1]
+
+    def test_draft_runs_agents_once(self):
+        """Test the draft graph runs its agents once, in order."""
+        draft_state = self.run_draft()
+
+        self.assertEqual(self.llm.calls, DRAFT_CALLS)
+        self.assertIsNotNone(draft_state[AgentRoute.PMAdapterAgent])
+        self.assertIsNone(draft_state.get(AgentRoute.RiskAgent))
+
+    def test_refinement_reuses_draft(self):
+        """Test the refinement only runs the skipped agents and their readers."""
+        draft_state = self.run_draft()
+        self.llm.calls.clear()
+
+        final_state = list(
+            refine_project_planning_graph(
+                self.graph, draft_state, thread_id="refined", print_results=False
+            )
+        )[-1]
+
+        self.assertEqual(self.llm.calls, REFINEMENT_CALLS)
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertIsNotNone(final_state[AgentRoute.RiskAgent])
+
+    def test_refine_in_background(self):
+        """Test the background refinement resolves its future and callback."""
+        draft_state = self.run_draft()
+        refined_states = []
+
+        future = refine_in_background(
+            self.graph, draft_state, on_refined=refined_states.append, thread_id="bg"
+        )
+        final_state = future.result(timeout=30)
+
+        self.assertIsNotNone(final_state[AgentRoute.ValidatorAgent])
+        self.assertEqual(refined_states, [final_state])
+
+    def test_draft_event_precedes_refinement(self):
+        """Test the draft state is emitted between the draft and refinement runs."""
+        events = list(
+            run_draft_planning_graph(
+                self.graph,
+                self.draft_graph,
+                "Bakery website",
+                thread_id="run",
+                print_results=False,
+                stream_updates=True,
+            )
+        )
+        kinds = [kind for kind, _ in events]
+
+        self.assertEqual(kinds.count(DRAFT_EVENT), 1)
+        draft_state = events[kinds.index(DRAFT_EVENT)][1]
+        self.assertIsNotNone(draft_state[AgentRoute.TimelineAgent])
+        refined_nodes = [
+            data[0]
+            for kind, data in events[kinds.index(DRAFT_EVENT) :]
+            if kind == UPDATES_EVENT
+        ]
+        self.assertIn(AgentRoute.RiskAgent, refined_nodes)
+        self.assertEqual(self.llm.calls, DRAFT_CALLS + REFINEMENT_CALLS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+Tests for hedged LLM requests of slow agents.
+"""
+
+import asyncio
+import time
+import unittest
+
+from imbizopm_agents import arun_project_planning_graph, create_project_planning_graph
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.hedging import Hedging
+
+from .agent_fixtures import FakeAgentChatModel, find_agent
+
+
+class SlowTaskifierModel(FakeAgentChatModel):
+    """Chat model answering the Taskifier prompt slowly once `slow` is set."""
+
+    slow: bool = False
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.slow and find_agent(messages) == "Taskifier":
+            await asyncio.sleep(2)
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+class TestHedging(unittest.TestCase):
+    """Test cases for duplicating calls that run past their usual latency."""
+
+    def observe(self, hedging, latency, count):
+        for _ in range(count):
+            hedging.run("TaskifierAgent", lambda: time.sleep(latency), lambda: None)
+
+    def test_no_hedge_before_min_samples(self):
+        """Test calls are not hedged until enough latencies were recorded."""
+        hedging = Hedging({"TaskifierAgent": 0.9}, min_samples=3)
+        self.assertIsNone(hedging.delay("TaskifierAgent"))
+        self.observe(hedging, 0.0, 3)
+        self.assertIsNotNone(hedging.delay("TaskifierAgent"))
+        self.assertFalse(hedging.applies("RiskAgent"))
+        self.assertEqual(hedging.stats()["TaskifierAgent"]["hedged"], 0)
+
+    def test_late_call_is_hedged(self):
+        """Test a call running past the percentile is won by its duplicate."""
+        hedging = Hedging({"TaskifierAgent": 0.9}, min_samples=3)
+        self.observe(hedging, 0.01, 3)
+
+        start = time.perf_counter()
+        result = hedging.run(
+            "TaskifierAgent", lambda: time.sleep(2) or "primary", lambda: "hedge"
+        )
+
+        self.assertEqual(result, "hedge")
+        self.assertLess(time.perf_counter() - start, 1)
+        stats = hedging.stats()["TaskifierAgent"]
+        self.assertEqual(
+            (stats["calls"], stats["hedged"], stats["hedge_wins"]), (4, 1, 1)
+        )
+        self.assertEqual(stats["hedge_win_rate"], 1.0)
+
+    def test_failed_hedge_falls_back_to_primary(self):
+        """Test the primary result is used when the duplicate fails."""
+        hedging = Hedging({"TaskifierAgent": 0.9}, min_samples=3)
+        self.observe(hedging, 0.0, 3)
+
+        def hedge():
+            raise ValueError("Failed to parse output again")
+
+        result = hedging.run(
+            "TaskifierAgent", lambda: time.sleep(0.05) or "primary", hedge
+        )
+        self.assertEqual(result, "primary")
+        self.assertEqual(hedging.stats()["TaskifierAgent"]["hedge_wins"], 0)
+
+    def test_async_hedge_cancels_primary(self):
+        """Test the losing request of an async hedged call is cancelled."""
+        hedging = Hedging({"TaskifierAgent": 0.9}, min_samples=1)
+        primary_cancelled = asyncio.Event()
+
+        async def primary():
+            try:
+                await asyncio.sleep(2)
+            except asyncio.CancelledError:
+                primary_cancelled.set()
+                raise
+
+        async def hedge():
+            return "hedge"
+
+        async def run():
+            await hedging.arun("TaskifierAgent", hedge, hedge)
+            result = await hedging.arun("TaskifierAgent", primary, hedge)
+            await asyncio.sleep(0)
+            return result
+
+        self.assertEqual(asyncio.run(run()), "hedge")
+        self.assertTrue(primary_cancelled.is_set())
+
+    def test_agent_hedges_to_secondary_model(self):
+        """Test a slow agent call is answered by the secondary model."""
+        llm = SlowTaskifierModel(calls=[])
+        secondary_llm = FakeAgentChatModel(calls=[])
+        hedging = Hedging(
+            {AgentRoute.TaskifierAgent: 0.5}, secondary_llm=secondary_llm, min_samples=1
+        )
+        graph = create_project_planning_graph(
+            llm, use_structured_output=False, use_async=True, hedging=hedging
+        )
+
+        async def run(thread_id):
+            return [
+                event
+                async for event in arun_project_planning_graph(
+                    graph,
+                    "Bakery website",
+                    thread_id=thread_id,
+                    recursion_limit=30,
+                    print_results=False,
+                )
+            ][-1]
+
+        asyncio.run(run("warm-up"))
+        llm.slow = True
+        final_state = asyncio.run(run("slow"))
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(secondary_llm.calls, ["Taskifier"])
+        self.assertEqual(hedging.stats()[AgentRoute.TaskifierAgent]["hedge_wins"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
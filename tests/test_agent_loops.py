@@ -0,0 +1,93 @@
+"""
+Tests for the loop limits of the planning graph.
+"""
+
+import copy
+import unittest
+
+from imbizopm_agents import (
+    DEFAULT_GRAPH_CONFIG,
+    create_project_planning_graph,
+    dtypes,
+    run_project_planning_graph,
+)
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.loops import LoopGuard, output_similarity
+
+from .agent_fixtures import FakeAgentChatModel
+
+NOT_VALIDATED = dtypes.PlanValidation.example()["not_validated"]
+
+
+class TestLoopLimits(unittest.TestCase):
+    """Test cases for revisit budgets and convergence detection."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.llm = FakeAgentChatModel(calls=[], examples={"Validator": NOT_VALIDATED})
+
+    def run_graph(self, graph_config=DEFAULT_GRAPH_CONFIG, use_parallel=False):
+        graph = create_project_planning_graph(
+            self.llm,
+            graph_config=graph_config,
+            use_structured_output=False,
+            use_parallel=use_parallel,
+        )
+        events = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=50, print_results=False
+            )
+        )
+        return events[-1]
+
+    def test_converged_output_forces_forward(self):
+        """Test an unchanged rejection moves on instead of looping again."""
+        final_state = self.run_graph()
+
+        self.assertEqual(self.llm.calls.count("Validator"), 2)
+        self.assertEqual(
+            final_state["loop_counts"], {"ValidatorAgent->PlannerAgent": 1}
+        )
+        self.assertIn(
+            "converged", final_state["warn_errors"][AgentRoute.ValidatorAgent]
+        )
+        self.assertIsNotNone(final_state[AgentRoute.PMAdapterAgent])
+
+    def test_revisit_budget_forces_forward(self):
+        """Test a loop-back edge is taken at most its budget of times."""
+        graph_config = copy.deepcopy(DEFAULT_GRAPH_CONFIG)
+        graph_config["loop_limits"]["similarity_threshold"] = 1.1
+        graph_config["loop_limits"]["edges"]["ValidatorAgent"]["PlannerAgent"] = 3
+        final_state = self.run_graph(graph_config)
+
+        self.assertEqual(self.llm.calls.count("Validator"), 4)
+        self.assertEqual(
+            final_state["loop_counts"], {"ValidatorAgent->PlannerAgent": 3}
+        )
+        self.assertIn("budget", final_state["warn_errors"][AgentRoute.ValidatorAgent])
+
+    def test_parallel_graph_keeps_loop_state(self):
+        """Test loop counts and warnings survive the join of concurrent stages."""
+        sequential = self.run_graph()
+        parallel = self.run_graph(use_parallel=True)
+
+        self.assertEqual(parallel["loop_counts"], sequential["loop_counts"])
+        self.assertEqual(parallel["warn_errors"], sequential["warn_errors"])
+
+    def test_missing_fallback_rejected(self):
+        """Test a limited node must declare where to go when forced."""
+        graph_config = copy.deepcopy(DEFAULT_GRAPH_CONFIG)
+        del graph_config["loop_limits"]["fallbacks"]["RiskAgent"]
+        with self.assertRaises(ValueError):
+            LoopGuard(graph_config)
+
+    def test_output_similarity(self):
+        """Test identical outputs are fully similar and different ones are not."""
+        output = dtypes.PlanValidation(**NOT_VALIDATED)
+        self.assertEqual(output_similarity(output, output.model_copy()), 1.0)
+        other = dtypes.PlanValidation(**dtypes.PlanValidation.example()["validated"])
+        self.assertLess(output_similarity(output, other), 0.95)
+
+
+if __name__ == "__main__":
+    unittest.main()
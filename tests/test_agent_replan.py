@@ -0,0 +1,113 @@
+"""
+Tests for incremental re-planning of an edited state.
+"""
+
+import json
+import unittest
+
+from imbizopm_agents import (
+    DEFAULT_GRAPH_CONFIG,
+    create_project_planning_graph,
+    replan_project_planning_graph,
+    run_project_planning_graph,
+)
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.replan import invalidated_nodes
+from imbizopm_agents.serialization import state_to_dict
+
+from .agent_fixtures import FakeAgentChatModel
+
+
+class TestReplan(unittest.TestCase):
+    """Test cases for re-running only the agents an edit invalidates."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.llm = FakeAgentChatModel(calls=[])
+        self.graph = create_project_planning_graph(
+            self.llm, use_structured_output=False
+        )
+        self.final_state = list(
+            run_project_planning_graph(
+                self.graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )[-1]
+        self.llm.calls.clear()
+
+    def replan(self, state, edits):
+        return list(
+            replan_project_planning_graph(
+                self.graph,
+                state,
+                edits,
+                thread_id="replan",
+                recursion_limit=30,
+                print_results=False,
+            )
+        )[-1]
+
+    def test_invalidated_nodes_follow_forward_reads(self):
+        """Test loop-back reads do not invalidate upstream agents."""
+        self.assertEqual(
+            invalidated_nodes(DEFAULT_GRAPH_CONFIG, [AgentRoute.TimelineAgent]),
+            {AgentRoute.RiskAgent, AgentRoute.PMAdapterAgent},
+        )
+        self.assertEqual(
+            invalidated_nodes(DEFAULT_GRAPH_CONFIG, [AgentRoute.PMAdapterAgent]),
+            set(),
+        )
+        self.assertEqual(
+            len(invalidated_nodes(DEFAULT_GRAPH_CONFIG, ["input"])),
+            len(DEFAULT_GRAPH_CONFIG["nodes"]),
+        )
+
+    def test_replan_reruns_only_invalidated_agents(self):
+        """Test editing the timeline only calls the Risk and PM Adapter agents."""
+        timeline = self.final_state[AgentRoute.TimelineAgent].model_copy(
+            update={"critical_path": ["Launch"]}
+        )
+        final_state = self.replan(
+            self.final_state, {AgentRoute.TimelineAgent: timeline}
+        )
+
+        self.assertEqual(self.llm.calls, ["Risk", "PM Adapter"])
+        self.assertEqual(final_state[AgentRoute.TimelineAgent], timeline)
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+
+    def test_parallel_replan_consumes_replays(self):
+        """Test replays cleared inside a parallel stage stay cleared."""
+        graph = create_project_planning_graph(
+            self.llm, use_structured_output=False, use_parallel=True
+        )
+        final_state = list(
+            replan_project_planning_graph(
+                graph,
+                self.final_state,
+                {AgentRoute.TimelineAgent: self.final_state[AgentRoute.TimelineAgent]},
+                recursion_limit=30,
+                print_results=False,
+            )
+        )[-1]
+
+        self.assertEqual(self.llm.calls, ["Risk", "PM Adapter"])
+        self.assertFalse(any(final_state["replay"].values()))
+
+    def test_replan_from_json_state(self):
+        """Test a state saved as JSON can be edited and re-planned."""
+        saved = json.loads(json.dumps(state_to_dict(self.final_state)))
+        saved[AgentRoute.ValidatorAgent]["alignment_score"] = "90%"
+        final_state = self.replan(
+            saved, {AgentRoute.ValidatorAgent: saved[AgentRoute.ValidatorAgent]}
+        )
+
+        self.assertEqual(self.llm.calls, ["PM Adapter"])
+        self.assertEqual(
+            final_state[AgentRoute.ValidatorAgent],
+            self.final_state[AgentRoute.ValidatorAgent].model_validate(
+                saved[AgentRoute.ValidatorAgent]
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
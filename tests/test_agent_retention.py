@@ -0,0 +1,85 @@
+"""
+Tests for the message retention policy of the planning graph.
+"""
+
+import os
+import tempfile
+import unittest
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+
+from imbizopm_agents import create_project_planning_graph, run_project_planning_graph
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.retention import MessageRetention, is_spilled, load_spilled
+
+from .agent_fixtures import FakeAgentChatModel
+
+
+class TestMessageRetention(unittest.TestCase):
+    """Test cases for bounding the messages kept in the state."""
+
+    def run_graph(self, message_retention, use_parallel=False):
+        graph = create_project_planning_graph(
+            FakeAgentChatModel(calls=[]),
+            use_structured_output=False,
+            use_parallel=use_parallel,
+            message_retention=message_retention,
+        )
+        return list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )[-1]
+
+    def test_apply_removes_oldest_messages(self):
+        """Test the oldest messages are removed past the limit."""
+        existing = [HumanMessage(content=str(i), id=f"m{i}") for i in range(3)]
+        update = {"messages": [HumanMessage(content="3"), AIMessage(content="4")]}
+
+        update = MessageRetention(max_messages=3).apply(existing, update)
+
+        removed = [m.id for m in update["messages"] if isinstance(m, RemoveMessage)]
+        kept = [
+            m.content for m in update["messages"] if not isinstance(m, RemoveMessage)
+        ]
+        self.assertEqual(removed, ["m0", "m1"])
+        self.assertEqual(kept, ["3", "4"])
+
+    def test_final_only_keeps_agent_answers(self):
+        """Test only the final answer of each agent stays in the state."""
+        final_state = self.run_graph(MessageRetention(final_only=True))
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(len(final_state["messages"]), 8)
+        self.assertTrue(all(isinstance(m, AIMessage) for m in final_state["messages"]))
+
+    def test_max_messages_bounds_state(self):
+        """Test the state never holds more than the latest messages."""
+        final_state = self.run_graph(MessageRetention(max_messages=4), True)
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(len(final_state["messages"]), 4)
+        self.assertIsNotNone(final_state[AgentRoute.ClarifierAgent])
+
+    def test_spilled_messages_are_restored_from_disk(self):
+        """Test older messages are spilled to disk and loaded back by reference."""
+        unbounded_state = self.run_graph(None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            final_state = self.run_graph(
+                MessageRetention(max_messages=3, spill_dir=tmp_dir)
+            )
+            messages = final_state["messages"]
+            spilled = [m for m in messages if is_spilled(m)]
+
+            self.assertEqual(len(messages), len(unbounded_state["messages"]))
+            self.assertEqual(len(messages) - len(spilled), 3)
+            self.assertEqual(len(os.listdir(tmp_dir)), len(spilled))
+            self.assertEqual(spilled[0].content, "")
+            self.assertEqual(
+                load_spilled(spilled[0]).content,
+                unbounded_state["messages"][0].content,
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
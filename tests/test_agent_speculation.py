@@ -0,0 +1,100 @@
+"""
+Tests for the speculative execution of likely next agents.
+"""
+
+import asyncio
+import time
+import unittest
+
+from imbizopm_agents import (
+    arun_project_planning_graph,
+    create_project_planning_graph,
+    dtypes,
+    run_project_planning_graph,
+)
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.speculation import Speculation
+
+from .agent_fixtures import FakeAgentChatModel
+
+NOT_FEASIBLE = dtypes.FeasibilityAssessment.example()["not_feasible_assessment_example"]
+
+
+class TestSpeculation(unittest.TestCase):
+    """Test cases for committing or discarding speculative agent runs."""
+
+    def run_graph(self, llm, speculation):
+        graph = create_project_planning_graph(
+            llm, use_structured_output=False, speculation=speculation
+        )
+        return list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=50, print_results=False
+            )
+        )[-1]
+
+    def test_hits_reuse_speculative_results(self):
+        """Test committed speculative runs give the plan of a sequential run."""
+        llm = FakeAgentChatModel(calls=[])
+        expected = self.run_graph(llm, None)
+        expected_calls = sorted(llm.calls)
+        llm.calls.clear()
+
+        speculation = Speculation()
+        final_state = self.run_graph(llm, speculation)
+
+        self.assertEqual(sorted(llm.calls), expected_calls)
+        for agent_name in (AgentRoute.TaskifierAgent, AgentRoute.ValidatorAgent):
+            self.assertEqual(final_state[agent_name], expected[agent_name])
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(len(final_state["messages"]), len(expected["messages"]))
+
+        stats = speculation.stats()
+        for edge in ("RiskAgent->ValidatorAgent", "ScoperAgent->TaskifierAgent"):
+            self.assertEqual(stats[edge]["hits"], 1)
+            self.assertEqual(stats[edge]["hit_rate"], 1.0)
+
+    def test_misses_are_discarded_and_counted(self):
+        """Test a run routed elsewhere discards its speculation and its tokens."""
+        llm = FakeAgentChatModel(calls=[], examples={"Risk": NOT_FEASIBLE})
+        speculation = Speculation()
+        final_state = self.run_graph(llm, speculation)
+
+        # The first assessment loops back to the planner, the converged one not
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        stats = speculation.stats()["RiskAgent->ValidatorAgent"]
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+        for _ in range(100):
+            if speculation.stats()["RiskAgent->ValidatorAgent"]["wasted_tokens"]:
+                break
+            time.sleep(0.01)
+        self.assertGreater(
+            speculation.stats()["RiskAgent->ValidatorAgent"]["wasted_tokens"], 0
+        )
+
+    def test_async_speculation(self):
+        """Test speculation on a graph driven asynchronously."""
+        speculation = Speculation()
+        graph = create_project_planning_graph(
+            FakeAgentChatModel(calls=[], delay=0.01),
+            use_structured_output=False,
+            use_async=True,
+            speculation=speculation,
+        )
+
+        async def run():
+            return [
+                event
+                async for event in arun_project_planning_graph(
+                    graph, "Bakery website", recursion_limit=50, print_results=False
+                )
+            ][-1]
+
+        final_state = asyncio.run(run())
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(speculation.stats()["RiskAgent->ValidatorAgent"]["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Tests for the incremental parsing of streamed agent outputs.
+"""
+
+import json
+import unittest
+
+from imbizopm_agents import (
+    create_project_planning_graph,
+    dtypes,
+    run_project_planning_graph,
+)
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.dtypes.risk_types import Risk
+from imbizopm_agents.dtypes.taskifier_types import Task
+from imbizopm_agents.events import ITEMS_EVENT, RESET_EVENT, TOKENS_EVENT
+from imbizopm_agents.streaming import (
+    IncrementalJsonParser,
+    ItemParser,
+    StructureError,
+    list_item_types,
+)
+
+from .agent_fixtures import AGENT_EXAMPLES, FakeAgentChatModel, find_agent
+
+TASK_PLAN = AGENT_EXAMPLES["Taskifier"]
+
+
+def feed_in_chunks(parser, text, size=7):
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i : i + size]))
+    return items
+
+
+class BrokenTaskifierModel(FakeAgentChatModel):
+    """Chat model streaming a structurally broken task plan the first time."""
+
+    broken: bool = True
+
+    def _respond(self, messages) -> str:
+        if self.broken and find_agent(messages) == "Taskifier":
+            self.broken = False
+            self.calls.append("Taskifier")
+            return '{"tasks": [{"id": "T1"}}' + " " * 500 + "]}"
+        return super()._respond(messages)
+
+
+class TestIncrementalParsing(unittest.TestCase):
+    """Test cases for parsing agent outputs as they stream."""
+
+    def test_items_complete_while_streaming(self):
+        """Test each task is emitted once its closing brace arrives."""
+        text = f"Here is the plan:\n```json\n{json.dumps(TASK_PLAN, indent=2)}\n```"
+        parser = ItemParser(dtypes.TaskPlan)
+
+        items = feed_in_chunks(parser, text)
+
+        self.assertEqual([field for field, _ in items], ["tasks"] * len(items))
+        self.assertEqual(
+            [item.model_dump() for _, item in items],
+            [
+                dtypes.TaskPlan.model_validate(TASK_PLAN).tasks[i].model_dump()
+                for i in range(len(TASK_PLAN["tasks"]))
+            ],
+        )
+        self.assertTrue(parser.json_parser.done)
+
+    def test_strings_do_not_affect_structure(self):
+        """Test brackets and quotes inside strings are not taken as structure."""
+        parser = IncrementalJsonParser()
+        items = feed_in_chunks(
+            parser, '{"risks": [{"description": "a } \\" ] {"}, {"x": [1]}]}', 3
+        )
+        self.assertEqual(
+            items, [("risks", {"description": 'a } " ] {'}), ("risks", {"x": [1]})]
+        )
+
+    def test_mismatched_bracket_raises(self):
+        """Test a broken structure is detected before the end of the output."""
+        parser = IncrementalJsonParser()
+        parser.feed('{"tasks": [{"id": "T1"}')
+        with self.assertRaises(StructureError):
+            parser.feed("}")
+
+    def test_list_item_types(self):
+        """Test the list fields of output models are found with their item type."""
+        self.assertEqual(list_item_types(dtypes.FeasibilityAssessment), {"risks": Risk})
+
+    def test_graph_streams_items(self):
+        """Test token streams also yield the completed items of each agent."""
+        graph = create_project_planning_graph(
+            FakeAgentChatModel(calls=[]), use_structured_output=False
+        )
+        events = list(
+            run_project_planning_graph(
+                graph,
+                "Bakery website",
+                recursion_limit=30,
+                print_results=False,
+                stream_tokens=True,
+            )
+        )
+
+        tasks = [
+            data[2]
+            for kind, data in events
+            if kind == ITEMS_EVENT and data[0] == AgentRoute.TaskifierAgent
+        ]
+        self.assertEqual(len(tasks), len(TASK_PLAN["tasks"]))
+        self.assertIsInstance(tasks[0], Task)
+        # Items arrive before the agent finished generating
+        kinds = [
+            kind
+            for kind, data in events
+            if kind in (ITEMS_EVENT, TOKENS_EVENT)
+            and data[0] == AgentRoute.TaskifierAgent
+        ]
+        self.assertEqual(kinds[-1], TOKENS_EVENT)
+
+    def test_broken_output_retried_early(self):
+        """Test a broken structure aborts the call and retries it."""
+        llm = BrokenTaskifierModel(calls=[])
+        graph = create_project_planning_graph(llm, use_structured_output=False)
+        events = list(
+            run_project_planning_graph(
+                graph,
+                "Bakery website",
+                recursion_limit=30,
+                print_results=False,
+                stream_tokens=True,
+            )
+        )
+
+        final_state = [data for kind, data in events if kind == "values"][-1]
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(llm.calls.count("Taskifier"), 2)
+        # The reformatting prompt names no agent
+        self.assertNotIn("", llm.calls)
+        broken_text = "".join(
+            data[1]
+            for kind, data in events
+            if kind == TOKENS_EVENT and data[0] == AgentRoute.TaskifierAgent
+        )
+        self.assertNotIn(" " * 100, broken_text)
+
+        # The aborted tokens are reset, those of the retry give the plan
+        taskifier_events = [
+            (kind, data)
+            for kind, data in events
+            if kind in (RESET_EVENT, TOKENS_EVENT)
+            and data[0] == AgentRoute.TaskifierAgent
+        ]
+        resets = [
+            i for i, (kind, _) in enumerate(taskifier_events) if kind == RESET_EVENT
+        ]
+        self.assertEqual(len(resets), 1)
+        self.assertTrue(taskifier_events[0][1][1].startswith('{"tasks"'))
+        retried_text = "".join(data[1] for _, data in taskifier_events[resets[0] + 1 :])
+        self.assertNotIn('{"id": "T1"}}', retried_text)
+        self.assertIn(json.dumps(TASK_PLAN), retried_text)
+
+
+if __name__ == "__main__":
+    unittest.main()
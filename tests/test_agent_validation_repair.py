@@ -0,0 +1,101 @@
+"""
+Tests for the targeted repair of agent outputs failing validation.
+"""
+
+import asyncio
+import copy
+import json
+import unittest
+
+from pydantic import ValidationError
+
+from imbizopm_agents import create_project_planning_graph, run_project_planning_graph
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.agents.taskifier_agent import TaskifierAgent
+from imbizopm_agents.dtypes import TaskPlan
+from imbizopm_agents.repair import apply_patch, validation_error_fragments
+
+from .agent_fixtures import AGENT_EXAMPLES, FakeAgentChatModel
+
+INVALID_TASKS = copy.deepcopy(AGENT_EXAMPLES["Taskifier"])
+INVALID_TASKS["tasks"][1]["id"] = {"bad": 1}
+
+
+class InvalidOutputModel(FakeAgentChatModel):
+    """Chat model answering the Taskifier with an invalid task, then patching it."""
+
+    examples: dict = {"Taskifier": INVALID_TASKS}
+    patch_prompts: list = []
+
+    def _respond(self, messages) -> str:
+        text = "\n".join(str(m.content) for m in messages)
+        if "do not have the expected format" in text:
+            self.patch_prompts.append(text)
+            return json.dumps([{"path": ["tasks", 1, "id"], "value": "T2"}])
+        return super()._respond(messages)
+
+
+class TestValidationRepair(unittest.TestCase):
+    """Test cases for patching the fields failing validation."""
+
+    def test_error_fragments(self):
+        """Test each error comes with the closest value present in the data."""
+        with self.assertRaises(ValidationError) as context:
+            TaskPlan.model_validate(INVALID_TASKS)
+
+        fragments = validation_error_fragments(INVALID_TASKS, context.exception)
+
+        self.assertEqual(
+            [path for path, _, _ in fragments], [["tasks", 1, "id"]] * len(fragments)
+        )
+        self.assertIs(fragments[0][2], INVALID_TASKS["tasks"][1])
+
+    def test_apply_patch(self):
+        """Test values are replaced, appended and removed by path."""
+        data = {"tasks": [{"id": 1, "name": "a"}], "notes": "x"}
+        patch = [
+            {"path": ["tasks", 0, "id"], "value": "T1"},
+            {"path": ["tasks", 1], "value": {"id": "T2"}},
+            {"path": ["notes"], "remove": True},
+            {"path": ["missing", 0], "value": 1},
+            "not an operation",
+        ]
+
+        data, applied = apply_patch(data, patch)
+
+        self.assertEqual(applied, 3)
+        self.assertEqual(data, {"tasks": [{"id": "T1", "name": "a"}, {"id": "T2"}]})
+
+    def test_agent_applies_patch(self):
+        """Test only the invalid fields are requested from the model again."""
+        llm = InvalidOutputModel(calls=[], patch_prompts=[])
+        graph = create_project_planning_graph(llm, use_structured_output=False)
+        final_state = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )[-1]
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(final_state[AgentRoute.TaskifierAgent].tasks[1].id, "T2")
+        self.assertEqual(llm.calls.count("Taskifier"), 1)
+        self.assertEqual(len(llm.patch_prompts), 1)
+        # The prompt quotes the invalid task, not the whole plan
+        self.assertIn('["tasks", 1, "id"]', llm.patch_prompts[0])
+        self.assertNotIn(INVALID_TASKS["tasks"][0]["name"], llm.patch_prompts[0])
+
+    def test_async_agent_applies_patch(self):
+        """Test the async parsing applies the patch as well."""
+        llm = InvalidOutputModel(calls=[], patch_prompts=[])
+        agent = TaskifierAgent(llm)
+
+        output = asyncio.run(
+            agent._aparse_content(f"```json\n{json.dumps(INVALID_TASKS)}\n```")
+        )
+
+        self.assertEqual(output.tasks[1].id, "T2")
+        self.assertEqual(len(llm.patch_prompts), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
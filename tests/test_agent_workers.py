@@ -0,0 +1,279 @@
+"""
+Tests for dispatching graph nodes to worker processes.
+"""
+
+import asyncio
+import copy
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from imbizopm_agents import (
+    DEFAULT_GRAPH_CONFIG,
+    arun_project_planning_graph,
+    create_project_planning_graph,
+    run_project_planning_graph,
+)
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.cache import ResultCache, credential_fingerprint
+from imbizopm_agents.hedging import Hedging
+from imbizopm_agents.workers import WorkerError, WorkerPool, WorkerQueue, run_worker
+
+from .agent_fixtures import create_fake_llm
+
+# Models created by the workers of the tests, by name
+created_models = []
+
+
+def create_recorded_llm(model_name: str, **kwargs):
+    """Chat model factory recording the model names it was asked for."""
+    created_models.append(model_name)
+    return create_fake_llm(model_name, **kwargs)
+
+
+class TestWorkerQueue(unittest.TestCase):
+    """Test cases for the SQLite-backed worker queue."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue_path = os.path.join(self.tmp_dir.name, "tasks.sqlite")
+        self.queue = WorkerQueue(self.queue_path, poll_interval=0.01)
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp_dir.cleanup()
+
+    def test_task_round_trip(self):
+        """Test a claimed task returns the state stored by the worker."""
+        task_id = self.queue.submit("RiskAgent", {"input": "Bakery"}, "small-model")
+        self.assertIsNone(self.queue.poll(task_id))
+
+        claimed_id, node, model, options, state = self.queue.claim("worker-1")
+        self.assertEqual(
+            (claimed_id, node, model), (task_id, "RiskAgent", "small-model")
+        )
+        self.assertIsNone(self.queue.claim("worker-2"))
+
+        self.queue.complete(task_id, {**state, "forward": "ValidatorAgent"})
+        result = self.queue.poll(task_id)
+        self.assertEqual(result, {"input": "Bakery", "forward": "ValidatorAgent"})
+        self.assertEqual(self.queue.stats(), {})
+
+    def test_failed_task_raises(self):
+        """Test an error in the worker is raised in the orchestrator."""
+        task_id = self.queue.submit("RiskAgent", {"input": "Bakery"})
+        self.queue.claim("worker-1")
+        self.queue.fail(task_id, "ValueError: Failed to parse output again")
+        with self.assertRaises(WorkerError):
+            self.queue.poll(task_id)
+
+    def test_expired_lease_is_claimed_again(self):
+        """Test a task of a worker that stopped responding is handed out again."""
+        self.queue.lease_timeout = 0.05
+        task_id = self.queue.submit("RiskAgent", {"input": "Bakery"})
+        self.queue.claim("worker-1")
+        self.assertIsNone(self.queue.claim("worker-2"))
+        time.sleep(0.1)
+        self.assertEqual(self.queue.claim("worker-2")[0], task_id)
+
+    def test_cancelled_and_expired_tasks_are_deleted(self):
+        """Test tasks whose result is no longer awaited do not stay in the queue."""
+        task_id = self.queue.submit("RiskAgent", {"input": "Bakery"})
+        self.queue.cancel(task_id)
+        self.assertEqual(self.queue.stats(), {})
+        with self.assertRaises(WorkerError):
+            self.queue.poll(task_id)
+
+        self.queue.task_ttl = 0.05
+        self.queue.submit("RiskAgent", {"input": "Bakery"})
+        time.sleep(0.1)
+        self.assertEqual(self.queue.purge(), 1)
+        self.assertEqual(self.queue.stats(), {})
+
+    def test_cancelled_async_node_deletes_task(self):
+        """Test cancelling an async node waiting on the workers deletes its task."""
+        run = self.queue.node_functions({"nodes": {"RiskAgent": {}}}, use_async=True)[
+            "RiskAgent"
+        ]
+
+        async def cancel():
+            task = asyncio.create_task(run({"input": "Bakery"}))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel())
+        self.assertEqual(self.queue.stats(), {})
+
+    def test_options_are_forwarded(self):
+        """Test the agent options reach the workers, the API key only by reference."""
+        cache = ResultCache(os.path.join(self.tmp_dir.name, "cache.sqlite"))
+        run = self.queue.node_functions(
+            {"nodes": {"RiskAgent": {}}},
+            "small-model",
+            model_kwargs={"api_key": "secret-key", "temperature": 0},
+            cache=cache,
+        )["RiskAgent"]
+        thread = threading.Thread(
+            target=lambda: self.assertRaises(WorkerError, run, {"input": "Bakery"}),
+            daemon=True,
+        )
+        thread.start()
+        while (task := self.queue.claim("worker-1")) is None:
+            time.sleep(0.01)
+
+        options = task[3]
+        self.assertEqual(options["credential"], credential_fingerprint("secret-key"))
+        self.assertEqual(options["model_kwargs"], {"temperature": 0})
+        self.assertEqual(options["cache"]["path"], cache.path)
+        with open(self.queue_path, "rb") as f:
+            self.assertNotIn(b"secret-key", f.read())
+        self.queue.fail(task[0], "stopped")
+        thread.join()
+
+    def test_unsupported_option_raises(self):
+        """Test options the workers cannot recreate are refused."""
+        with self.assertRaises(ValueError):
+            create_project_planning_graph(
+                None,
+                use_structured_output=False,
+                worker_queue=self.queue,
+                hedging=Hedging({"RiskAgent": 0.9}),
+            )
+
+    def test_worker_without_the_api_key_fails_the_task(self):
+        """Test workers do not silently fall back to another credential."""
+        self.run_workers(1, api_keys=["worker-key"])
+        graph = create_project_planning_graph(
+            None,
+            use_structured_output=False,
+            worker_queue=self.queue,
+            model_kwargs={"api_key": "ui-key"},
+        )
+        with self.assertRaises(WorkerError):
+            list(
+                run_project_planning_graph(
+                    graph, "Bakery website", recursion_limit=30, print_results=False
+                )
+            )
+
+        graph = create_project_planning_graph(
+            None,
+            use_structured_output=False,
+            worker_queue=self.queue,
+            model_kwargs={"api_key": "worker-key"},
+        )
+        final_state = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )[-1]
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+
+    def test_node_models_reach_the_workers(self):
+        """Test the workers use the graph configuration of the orchestrator."""
+        created_models.clear()
+        self.run_workers(1, create_llm=create_recorded_llm)
+        graph_config = copy.deepcopy(DEFAULT_GRAPH_CONFIG)
+        graph_config["nodes"][AgentRoute.RiskAgent]["model"] = "risk-model"
+        graph = create_project_planning_graph(
+            None,
+            graph_config=graph_config,
+            use_structured_output=False,
+            worker_queue=self.queue,
+        )
+        final_state = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )[-1]
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertIn("risk-model", created_models)
+
+    def run_workers(self, count, **worker_kwargs):
+        stop_event = threading.Event()
+        workers = [
+            threading.Thread(
+                target=run_worker,
+                kwargs={
+                    "queue_path": self.queue_path,
+                    "default_model": "fake-agent-model",
+                    "stop_event": stop_event,
+                    "create_llm": create_fake_llm,
+                    **worker_kwargs,
+                },
+                daemon=True,
+            )
+            for _ in range(count)
+        ]
+        for worker in workers:
+            worker.start()
+        self.addCleanup(lambda: [stop_event.set()] + [w.join() for w in workers])
+
+    def test_graph_nodes_run_in_workers(self):
+        """Test a graph dispatching its nodes to workers runs to the end."""
+        self.run_workers(2)
+        graph = create_project_planning_graph(
+            None, use_structured_output=False, worker_queue=self.queue
+        )
+        final_state = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )[-1]
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertIsNotNone(final_state[AgentRoute.TaskifierAgent])
+
+    def test_async_graph_nodes_run_in_workers(self):
+        """Test concurrent async runs share the workers."""
+        self.run_workers(2)
+        graph = create_project_planning_graph(
+            None, use_structured_output=False, use_async=True, worker_queue=self.queue
+        )
+
+        async def run(thread_id):
+            return [
+                event
+                async for event in arun_project_planning_graph(
+                    graph,
+                    "Bakery website",
+                    thread_id=thread_id,
+                    recursion_limit=30,
+                    print_results=False,
+                )
+            ][-1]
+
+        async def run_all():
+            return await asyncio.gather(run("run-1"), run("run-2"))
+
+        for final_state in asyncio.run(run_all()):
+            self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+
+    def test_worker_pool_processes(self):
+        """Test worker processes serve the queue."""
+        with WorkerPool(
+            1,
+            queue_path=self.queue_path,
+            default_model="fake-agent-model",
+            create_llm=create_fake_llm,
+        ):
+            graph = create_project_planning_graph(
+                None, use_structured_output=False, worker_queue=self.queue
+            )
+            final_state = list(
+                run_project_planning_graph(
+                    graph, "Bakery website", recursion_limit=30, print_results=False
+                )
+            )[-1]
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+
+
+if __name__ == "__main__":
+    unittest.main()
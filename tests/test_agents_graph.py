@@ -0,0 +1,425 @@
+"""
+Tests for the agent planning graph.
+"""
+
+import asyncio
+import copy
+import json
+import os
+import tempfile
+import unittest
+
+from imbizopm_agents import (
+    DEFAULT_GRAPH_CONFIG,
+    dtypes,
+    aresume_project_planning_graph,
+    arun_project_planning_graph,
+    create_project_planning_graph,
+    resume_project_planning_graph,
+    run_project_planning_graph,
+)
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.events import apply_delta, state_delta
+from imbizopm_agents.parallel import (
+    ParallelStage,
+    ParallelStats,
+    find_parallel_chains,
+)
+
+from .agent_fixtures import FakeAgentChatModel, find_agent
+
+OVERLOADED_SCOPE = dtypes.ScopeDefinition.example()["overloaded_scope"]
+
+
+class OverloadedOnceModel(FakeAgentChatModel):
+    """Chat model whose first scope is overloaded, routing to the Negotiator."""
+
+    def _respond(self, messages) -> str:
+        overloaded = find_agent(messages) == "Scoper" and "Scoper" not in self.calls
+        text = super()._respond(messages)
+        if overloaded:
+            text = f"```json\n{json.dumps(OVERLOADED_SCOPE)}\n```"
+        return text
+
+
+HAPPY_PATH = [
+    AgentRoute.ClarifierAgent,
+    AgentRoute.PlannerAgent,
+    AgentRoute.ScoperAgent,
+    AgentRoute.TaskifierAgent,
+    AgentRoute.TimelineAgent,
+    AgentRoute.RiskAgent,
+    AgentRoute.ValidatorAgent,
+    AgentRoute.PMAdapterAgent,
+]
+
+
+class TestPlanningGraph(unittest.TestCase):
+    """Test cases for building and running the planning graph."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.llm = FakeAgentChatModel(calls=[])
+
+    def test_run_project_planning_graph(self):
+        """Test a synchronous run follows the happy path to the end."""
+        graph = create_project_planning_graph(self.llm, use_structured_output=False)
+        events = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )
+
+        executed = [e["backward"] for e in events if e.get("backward")]
+        self.assertEqual(executed, HAPPY_PATH)
+        self.assertIsNotNone(events[-1][AgentRoute.PMAdapterAgent])
+
+    def test_nodes_use_their_configured_model(self):
+        """Test nodes naming a model share one client of it, others the default."""
+        graph_config = copy.deepcopy(DEFAULT_GRAPH_CONFIG)
+        for name in (AgentRoute.TimelineAgent, AgentRoute.PMAdapterAgent):
+            graph_config["nodes"][name]["model"] = "small-model"
+        small_llm = FakeAgentChatModel(model_name="small-model", calls=[])
+        created = []
+
+        def create_llm(model_name, **kwargs):
+            created.append((model_name, kwargs))
+            return small_llm
+
+        graph = create_project_planning_graph(
+            self.llm,
+            graph_config=graph_config,
+            use_structured_output=False,
+            create_llm=create_llm,
+            model_kwargs={"api_key": "secret"},
+        )
+        final_state = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )[-1]
+
+        self.assertEqual(created, [("small-model", {"api_key": "secret"})])
+        self.assertEqual(small_llm.calls, ["Timeline", "PM Adapter"])
+        self.assertNotIn("Timeline", self.llm.calls)
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+
+    def test_arun_project_planning_graph(self):
+        """Test concurrent async runs share one event loop."""
+        graph = create_project_planning_graph(
+            self.llm, use_structured_output=False, use_async=True
+        )
+
+        async def run(thread_id):
+            events = []
+            async for event in arun_project_planning_graph(
+                graph,
+                "Bakery website",
+                thread_id=thread_id,
+                recursion_limit=30,
+                print_results=False,
+            ):
+                events.append(event)
+            return events[-1]
+
+        async def run_all():
+            return await asyncio.gather(*(run(f"run-{i}") for i in range(3)))
+
+        final_states = asyncio.run(run_all())
+
+        for state in final_states:
+            self.assertEqual(state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(len(self.llm.calls), 3 * len(HAPPY_PATH))
+
+    def test_parallel_graph_matches_sequential_outputs(self):
+        """Test the parallel graph commits the same agents as a sequential run."""
+        graph = create_project_planning_graph(
+            self.llm, use_structured_output=False, use_parallel=True
+        )
+        events = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )
+
+        final_state = events[-1]
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(final_state["pending_results"], {})
+        for agent_name in HAPPY_PATH:
+            self.assertIsNotNone(final_state[agent_name])
+        # Scoper+Taskifier and Timeline+Validator each share one step
+        self.assertEqual(len(events), len(HAPPY_PATH) - 1)
+
+    def test_stream_tokens_per_agent(self):
+        """Test token events are attributed to the agent generating them."""
+        graph = create_project_planning_graph(
+            self.llm, use_structured_output=False, use_parallel=True
+        )
+        events = list(
+            run_project_planning_graph(
+                graph,
+                "Bakery website",
+                recursion_limit=30,
+                print_results=False,
+                stream_tokens=True,
+            )
+        )
+
+        tokens = {}
+        for kind, data in events:
+            if kind == "tokens":
+                agent_name, text = data
+                tokens[agent_name] = tokens.get(agent_name, "") + text
+        final_state = [data for kind, data in events if kind == "values"][-1]
+        self.assertEqual(set(tokens), set(HAPPY_PATH))
+        self.assertIn('"refined_idea"', tokens[AgentRoute.ClarifierAgent])
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+
+    def test_stream_updates_rebuild_final_state(self):
+        """Test applying the streamed deltas reproduces the final state."""
+        graph = create_project_planning_graph(
+            self.llm, use_structured_output=False, use_parallel=True
+        )
+        final_state = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )[-1]
+
+        events = list(
+            run_project_planning_graph(
+                graph,
+                "Bakery website",
+                thread_id="updates",
+                recursion_limit=30,
+                print_results=False,
+                stream_updates=True,
+            )
+        )
+        state = {"input": "Bakery website"}
+        for kind, (node_name, delta) in events:
+            self.assertEqual(kind, "updates")
+            self.assertFalse(node_name.endswith("Node"))
+            apply_delta(state, delta)
+
+        for agent_name in HAPPY_PATH:
+            self.assertEqual(state[agent_name], final_state[agent_name])
+        self.assertEqual(len(state["messages"]), len(final_state["messages"]))
+        self.assertEqual(state["backward"], AgentRoute.PMAdapterAgent)
+
+    def test_state_delta_skips_unchanged_fields(self):
+        """Test a delta only holds changed fields, plus routing and new messages."""
+        output = {"refined_idea": "Bakery"}
+        known = {"input": "Bakery website", "ClarifierAgent": output}
+        delta = state_delta(
+            known,
+            {
+                "input": "Bakery website",
+                "ClarifierAgent": output,
+                "PlannerAgent": {"goals": []},
+                "forward": "ScoperAgent",
+                "backward": "PlannerAgent",
+                "messages": [],
+            },
+        )
+        self.assertEqual(set(delta), {"PlannerAgent", "forward", "backward"})
+        self.assertEqual(known["PlannerAgent"], {"goals": []})
+
+    def test_resume_from_failed_node(self):
+        """Test a resumed run only re-executes the node that failed."""
+
+        class FailingChatModel(FakeAgentChatModel):
+            def _respond(self, messages):
+                if find_agent(messages) == "PM Adapter":
+                    raise RuntimeError("Provider unavailable")
+                return super()._respond(messages)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_db = os.path.join(tmp_dir, "runs.sqlite")
+            failing_graph = create_project_planning_graph(
+                FailingChatModel(calls=[]),
+                use_structured_output=False,
+                checkpoint_db=checkpoint_db,
+            )
+            with self.assertRaises(RuntimeError):
+                for _ in run_project_planning_graph(
+                    failing_graph,
+                    "Bakery website",
+                    thread_id="run-1",
+                    recursion_limit=30,
+                    print_results=False,
+                ):
+                    pass
+
+            # A fresh graph on the same database stands in for a restarted worker
+            graph = create_project_planning_graph(
+                self.llm, use_structured_output=False, checkpoint_db=checkpoint_db
+            )
+            events = list(
+                resume_project_planning_graph(
+                    graph, "run-1", recursion_limit=30, print_results=False
+                )
+            )
+
+        self.assertEqual(self.llm.calls, ["PM Adapter"])
+        self.assertEqual(events[-1]["backward"], AgentRoute.PMAdapterAgent)
+
+    def test_async_resume_from_sqlite(self):
+        """Test an interrupted async run is resumed from its SQLite checkpoint."""
+
+        class FailingChatModel(FakeAgentChatModel):
+            def _respond(self, messages):
+                if find_agent(messages) == "PM Adapter":
+                    raise RuntimeError("Provider unavailable")
+                return super()._respond(messages)
+
+        async def run_and_resume(checkpoint_db):
+            failing_graph = create_project_planning_graph(
+                FailingChatModel(calls=[]),
+                use_structured_output=False,
+                use_async=True,
+                checkpoint_db=checkpoint_db,
+            )
+            with self.assertRaises(RuntimeError):
+                async for _ in arun_project_planning_graph(
+                    failing_graph,
+                    "Bakery website",
+                    thread_id="run-1",
+                    recursion_limit=30,
+                    print_results=False,
+                ):
+                    pass
+
+            graph = create_project_planning_graph(
+                self.llm,
+                use_structured_output=False,
+                use_async=True,
+                checkpoint_db=checkpoint_db,
+            )
+            return [
+                event
+                async for event in aresume_project_planning_graph(
+                    graph, "run-1", recursion_limit=30, print_results=False
+                )
+            ]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            events = asyncio.run(run_and_resume(os.path.join(tmp_dir, "runs.sqlite")))
+
+        self.assertEqual(self.llm.calls, ["PM Adapter"])
+        self.assertEqual(events[-1]["backward"], AgentRoute.PMAdapterAgent)
+
+
+class TestParallelScheduling(unittest.TestCase):
+    """Test cases for the dataflow-parallel stages."""
+
+    def test_find_parallel_chains(self):
+        """Test independent nodes of the default graph share a stage."""
+        chains = find_parallel_chains(DEFAULT_GRAPH_CONFIG)
+
+        self.assertEqual(len(chains), 1)
+        chain, stages = chains[0]
+        self.assertEqual(chain[0], AgentRoute.ScoperAgent)
+        self.assertEqual(
+            stages,
+            [
+                [AgentRoute.ScoperAgent, AgentRoute.TaskifierAgent],
+                [AgentRoute.TimelineAgent, AgentRoute.ValidatorAgent],
+                [AgentRoute.RiskAgent],
+                [AgentRoute.PMAdapterAgent],
+            ],
+        )
+
+    def test_discarded_calls_are_counted(self):
+        """Test a Scoper routing to the Negotiator wastes the grouped Taskifier."""
+        sequential_llm = OverloadedOnceModel(calls=[])
+        sequential = create_project_planning_graph(
+            sequential_llm, use_structured_output=False
+        )
+        expected = list(
+            run_project_planning_graph(
+                sequential, "Bakery website", recursion_limit=50, print_results=False
+            )
+        )[-1]
+        routes = [m.content for m in expected["routes"]]
+        self.assertIn(AgentRoute.NegotiatorAgent, routes)
+
+        llm = OverloadedOnceModel(calls=[])
+        stats = ParallelStats()
+        graph = create_project_planning_graph(
+            llm, use_structured_output=False, use_parallel=True, parallel_stats=stats
+        )
+        final_state = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=50, print_results=False
+            )
+        )[-1]
+
+        self.assertEqual([m.content for m in final_state["routes"]], routes)
+        # The only extra call is the Taskifier run alongside the overloaded Scoper
+        self.assertEqual(len(llm.calls), len(sequential_llm.calls) + 1)
+        self.assertEqual(
+            llm.calls.count("Taskifier"), sequential_llm.calls.count("Taskifier") + 1
+        )
+        taskifier = stats.stats()[AgentRoute.TaskifierAgent]
+        self.assertEqual((taskifier["calls"], taskifier["discarded"]), (2, 1))
+        self.assertEqual(taskifier["discard_rate"], 0.5)
+        self.assertGreater(taskifier["wasted_tokens"], 0)
+        self.assertEqual(stats.stats()[AgentRoute.ScoperAgent]["discarded"], 0)
+
+    def test_stage_discards_results_after_loop_back(self):
+        """Test results after an agent leaving the chain are not committed."""
+
+        def agent(name, forward):
+            def run(state):
+                state[name] = f"{name} output"
+                state["forward"] = forward
+                state["backward"] = name
+                state["messages"] = []
+                state["routes"] = [name]
+                return state
+
+            return run
+
+        chain = ["A", "B", "C"]
+        stage = ParallelStage(
+            chain,
+            {"A": agent("A", "Loop"), "B": agent("B", "C")},
+            {name: [name] for name in chain},
+            is_head=True,
+        )
+
+        update = stage.run({"forward": "A", "pending_results": {}})
+
+        self.assertEqual(update["A"], "A output")
+        self.assertNotIn("B", update)
+        self.assertEqual(update["forward"], "Loop")
+        self.assertEqual(update["pending_results"], {})
+
+    def test_stage_keeps_results_until_their_turn(self):
+        """Test a result whose predecessor has not run yet stays pending."""
+
+        def agent(name, forward):
+            def run(state):
+                return {name: name, "forward": forward, "backward": name}
+
+            return run
+
+        chain = ["A", "B", "C"]
+        writes = {name: [name] for name in chain}
+        first = ParallelStage(
+            chain, {"A": agent("A", "B"), "C": agent("C", "End")}, writes, True
+        )
+        second = ParallelStage(chain, {"B": agent("B", "C")}, writes, False)
+
+        state = first.run({"forward": "A"})
+        self.assertEqual(list(state["pending_results"]), ["C"])
+        self.assertEqual(state["forward"], "B")
+
+        update = second.run(state)
+        self.assertEqual((update["B"], update["C"]), ("B", "C"))
+        self.assertEqual(update["forward"], "End")
+
+
+if __name__ == "__main__":
+    unittest.main()
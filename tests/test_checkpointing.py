@@ -0,0 +1,144 @@
+"""
+Tests for the memory-bounded checkpoint storage.
+"""
+
+import time
+import unittest
+
+from imbizopm_agents import create_project_planning_graph, run_project_planning_graph
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.checkpointing import BoundedMemorySaver
+
+from .agent_fixtures import FakeAgentChatModel
+
+
+class TestBoundedMemorySaver(unittest.TestCase):
+    """Test cases for evicting the checkpoints of old runs."""
+
+    def run_graph(self, graph, thread_id):
+        return list(
+            run_project_planning_graph(
+                graph,
+                "Bakery website",
+                thread_id=thread_id,
+                recursion_limit=30,
+                print_results=False,
+            )
+        )[-1]
+
+    def create_graph(self, checkpointer):
+        return create_project_planning_graph(
+            FakeAgentChatModel(calls=[]),
+            use_structured_output=False,
+            checkpointer=checkpointer,
+        )
+
+    def thread_config(self, thread_id):
+        return {"configurable": {"thread_id": thread_id}}
+
+    def test_memory_usage_tracks_stored_checkpoints(self):
+        """Test the reported size matches the stored checkpoints and drops on delete."""
+        saver = BoundedMemorySaver(max_bytes=None, ttl=None)
+        graph = self.create_graph(saver)
+        final_state = self.run_graph(graph, "run-1")
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(
+            graph.get_state(self.thread_config("run-1")).values["input"],
+            "Bakery website",
+        )
+        stored = (
+            sum(len(t) + len(data) for t, data in saver.blobs.values())
+            + sum(
+                len(c[0]) + len(c[1]) + len(m[0]) + len(m[1])
+                for checkpoints in saver.storage["run-1"].values()
+                for c, m, _ in checkpoints.values()
+            )
+            + sum(
+                len(w[2][0]) + len(w[2][1])
+                for writes in saver.writes.values()
+                for w in writes.values()
+            )
+        )
+        self.assertEqual(saver.memory_usage(), stored)
+        self.assertEqual(saver.stats()["threads"], 1)
+
+        saver.delete_thread("run-1")
+        self.assertEqual(saver.stats()["bytes"], 0)
+
+    def test_least_recently_used_run_is_evicted(self):
+        """Test the oldest run is dropped once the size bound is exceeded."""
+        saver = BoundedMemorySaver(max_bytes=None, ttl=None)
+        graph = self.create_graph(saver)
+        self.run_graph(graph, "run-1")
+        saver.max_bytes = int(saver.memory_usage() * 1.5)
+
+        final_state = self.run_graph(graph, "run-2")
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertFalse(graph.get_state(self.thread_config("run-1")).values)
+        self.assertTrue(graph.get_state(self.thread_config("run-2")).values)
+        stats = saver.stats()
+        self.assertEqual((stats["threads"], stats["evicted_threads"]), (1, 1))
+        self.assertLessEqual(stats["bytes"], saver.max_bytes)
+
+    def test_run_larger_than_bound_completes(self):
+        """Test the thread being written is not evicted to make room for itself."""
+        saver = BoundedMemorySaver(max_bytes=1, ttl=None)
+        final_state = self.run_graph(self.create_graph(saver), "run-1")
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(saver.stats()["threads"], 1)
+
+    def test_expired_run_is_evicted(self):
+        """Test a run unused for longer than the TTL is dropped."""
+        saver = BoundedMemorySaver(max_bytes=None, ttl=0.05)
+        graph = self.create_graph(saver)
+        self.run_graph(graph, "run-1")
+        time.sleep(0.1)
+
+        self.assertFalse(graph.get_state(self.thread_config("run-1")).values)
+        self.assertEqual(saver.stats()["bytes"], 0)
+        self.assertEqual(saver.stats()["evicted_threads"], 1)
+
+    def test_thread_limit(self):
+        """Test the number of kept runs is bounded."""
+        saver = BoundedMemorySaver(max_bytes=None, ttl=None, max_threads=1)
+        graph = self.create_graph(saver)
+        self.run_graph(graph, "run-1")
+        self.run_graph(graph, "run-2")
+
+        self.assertEqual(list(saver.storage), ["run-2"])
+
+    def test_runs_in_flight_are_not_evicted(self):
+        """Test the bounds only evict the threads of finished runs."""
+        saver = BoundedMemorySaver(max_bytes=None, ttl=0.05, max_threads=1)
+        graph = self.create_graph(saver)
+        events = run_project_planning_graph(
+            graph,
+            "Bakery website",
+            thread_id="run-1",
+            recursion_limit=30,
+            print_results=False,
+        )
+        next(events)
+        next(events)
+        time.sleep(0.1)
+
+        # Another run over the thread limit, after the TTL of the first one
+        self.run_graph(graph, "run-2")
+        self.assertIn("run-1", saver.storage)
+        self.assertEqual(saver.stats()["active_threads"], 1)
+
+        final_state = list(events)[-1]
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertEqual(saver.stats()["active_threads"], 0)
+        self.assertEqual(list(saver.storage), ["run-1"])
+
+        # Finished runs expire
+        time.sleep(0.1)
+        self.assertFalse(graph.get_state(self.thread_config("run-1")).values)
+
+
+if __name__ == "__main__":
+    unittest.main()
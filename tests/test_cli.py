@@ -125,6 +125,62 @@ class TestCLI(unittest.TestCase):
         self.assertTrue(args.private)
         self.assertEqual(args.save_tasks, "tasks.json")
 
+    def test_parse_args_plan_resume(self):
+        """Test parsing plan command arguments to resume a run."""
+        test_args = [
+            "plan",
+            "--model",
+            "openai:gpt-4o",
+            "--checkpoint-db",
+            "runs.sqlite",
+            "--resume",
+            "run-123",
+        ]
+
+        with patch.object(sys, "argv", ["imbizopm"] + test_args):
+            args = parse_args()
+
+        self.assertEqual(args.command, "plan")
+        self.assertEqual(args.model, "openai:gpt-4o")
+        self.assertEqual(args.checkpoint_db, "runs.sqlite")
+        self.assertEqual(args.resume, "run-123")
+        self.assertEqual(args.recursion_limit, 30)
+
+    def test_parse_args_plan_spill_dir_requires_max_messages(self):
+        """Test --spill-dir is rejected without a message limit."""
+        test_args = ["plan", "--final-messages-only", "--spill-dir", "spilled"]
+
+        with patch.object(sys, "argv", ["imbizopm"] + test_args):
+            with patch("sys.stderr"), self.assertRaises(SystemExit):
+                parse_args()
+
+        with patch.object(
+            sys, "argv", ["imbizopm"] + test_args + ["--max-messages", "20"]
+        ):
+            args = parse_args()
+
+        self.assertEqual(args.spill_dir, "spilled")
+        self.assertEqual(args.max_messages, 20)
+
+    def test_parse_args_plan_batch(self):
+        """Test parsing plan-batch command arguments."""
+        test_args = [
+            "plan-batch",
+            "ideas.jsonl",
+            "--concurrency",
+            "8",
+            "--out",
+            "plans.jsonl",
+        ]
+
+        with patch.object(sys, "argv", ["imbizopm"] + test_args):
+            args = parse_args()
+
+        self.assertEqual(args.command, "plan-batch")
+        self.assertEqual(args.ideas, "ideas.jsonl")
+        self.assertEqual(args.concurrency, 8)
+        self.assertEqual(args.out, "plans.jsonl")
+
     @patch("json.load")
     @patch("builtins.open", new_callable=MagicMock)
     def test_load_issues_from_file(self, mock_open, mock_json_load):
@@ -0,0 +1,78 @@
+"""
+Tests for the pool of compiled planning graphs.
+"""
+
+import unittest
+
+from imbizopm_agents.pool import GraphPool, credential_fingerprint
+
+from .agent_fixtures import FakeAgentChatModel
+
+
+class TestGraphPool(unittest.TestCase):
+    """Test cases for pooling graphs by model and credential."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.created = []
+
+        def create_llm(model_name, **kwargs):
+            self.created.append((model_name, kwargs))
+            return FakeAgentChatModel(model_name=model_name, calls=[])
+
+        self.create_llm = create_llm
+
+    def make_pool(self, **kwargs) -> GraphPool:
+        return GraphPool(
+            graph_kwargs={"use_structured_output": False},
+            create_llm=self.create_llm,
+            **kwargs,
+        )
+
+    def test_reuses_entry_for_same_model_and_key(self):
+        """Test a second request for the same model and key reuses the graph."""
+        pool = self.make_pool()
+        llm, graph = pool.get("fake:model", "secret")
+        self.assertEqual(pool.get("fake:model", "secret"), (llm, graph))
+        self.assertEqual(self.created, [("fake:model", {"api_key": "secret"})])
+        self.assertEqual(pool.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_separates_models_and_credentials(self):
+        """Test different models or keys get their own entries."""
+        pool = self.make_pool()
+        _, graph = pool.get("fake:model", "secret")
+        self.assertIsNot(pool.get("fake:model", "other")[1], graph)
+        self.assertIsNot(pool.get("fake:other")[1], graph)
+        self.assertEqual(len(pool), 3)
+
+    def test_evicts_idle_entries(self):
+        """Test entries unused beyond the idle timeout are rebuilt."""
+        pool = self.make_pool(idle_timeout=0)
+        pool.get("fake:model")
+        pool.get("fake:model")
+        self.assertEqual(len(self.created), 2)
+
+    def test_evicts_least_recently_used(self):
+        """Test the pool keeps at most its maximum number of entries."""
+        pool = self.make_pool(max_entries=2)
+        pool.get("fake:a")
+        pool.get("fake:b")
+        pool.get("fake:a")
+        pool.get("fake:c")
+        self.assertEqual(len(pool), 2)
+        pool.get("fake:a")
+        self.assertEqual(
+            [name for name, _ in self.created], ["fake:a", "fake:b", "fake:c"]
+        )
+
+    def test_credential_fingerprint(self):
+        """Test the fingerprint identifies a key without revealing it."""
+        self.assertEqual(credential_fingerprint(None), "")
+        fingerprint = credential_fingerprint("secret")
+        self.assertNotIn("secret", fingerprint)
+        self.assertEqual(fingerprint, credential_fingerprint("secret"))
+        self.assertNotEqual(fingerprint, credential_fingerprint("other"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Tests for the local repair of malformed agent outputs.
+"""
+
+import json
+import unittest
+from unittest import mock
+
+from imbizopm_agents import create_project_planning_graph, run_project_planning_graph
+from imbizopm_agents.agents import base_agent
+from imbizopm_agents.agents.config import AgentRoute
+from imbizopm_agents.agents.timeline_agent import TimelineAgent
+from imbizopm_agents.repair import JsonRepairer, is_well_formed
+
+from .agent_fixtures import AGENT_EXAMPLES, FakeAgentChatModel, find_agent
+
+
+class MalformedOutputModel(FakeAgentChatModel):
+    """Chat model answering some agents with mechanically broken JSON."""
+
+    def _respond(self, messages) -> str:
+        agent = find_agent(messages)
+        if agent == "Taskifier":
+            self.calls.append(agent)
+            return repr(AGENT_EXAMPLES[agent])
+        if agent == "Timeline":
+            self.calls.append(agent)
+            return json.dumps(AGENT_EXAMPLES[agent], indent=2)[:-2] + ",\n}"
+        return super()._respond(messages)
+
+
+class TestJsonRepairer(unittest.TestCase):
+    """Test cases for the deterministic JSON fixes."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.repairer = JsonRepairer()
+
+    def test_mechanical_fixes(self):
+        """Test each kind of mechanical mistake is repaired."""
+        cases = {
+            '```json\n{"a": [1, 2,], "b": {"c": 1,},}\n```': {
+                "a": [1, 2],
+                "b": {"c": 1},
+            },
+            "{'a': 'it\\'s', 'b': True, 'c': None}": {
+                "a": "it's",
+                "b": True,
+                "c": None,
+            },
+            '{\n  // note\n  "a": 1, /* x */ "b": "line 1\nline 2"\n}': {
+                "a": 1,
+                "b": "line 1\nline 2",
+            },
+            '{"url": "http://example.com", "tags": ["a", "b': {
+                "url": "http://example.com",
+                "tags": ["a", "b"],
+            },
+        }
+        for text, expected in cases.items():
+            self.assertEqual(self.repairer.repair(text), expected, text)
+
+    def test_truncated_key_is_dropped(self):
+        """Test a key cut off by a truncation is dropped with its value."""
+        self.assertEqual(
+            self.repairer.repair('{"a": [1, 2], "b": {"c": "x", "d'),
+            {"a": [1, 2], "b": {"c": "x"}},
+        )
+        self.assertEqual(self.repairer.repair('{"a": 1, "b":'), {"a": 1, "b": None})
+
+    def test_stats(self):
+        """Test the counters record the fixes of successful repairs."""
+        self.repairer.repair('{"a": 1,}')
+        self.repairer.repair("{'a': 1}")
+        self.repairer.repair("not JSON at all")
+        self.assertEqual(
+            self.repairer.stats(),
+            {"repaired": 2, "trailing_commas": 1, "single_quotes": 1, "failed": 1},
+        )
+
+    def test_well_formed(self):
+        """Test answers holding only valid fragments are detected."""
+        self.assertTrue(is_well_formed('Here it is:\n```json\n{"a": [1]}\n```'))
+        self.assertFalse(is_well_formed('{"a": {"b": 1}, "c": [1, 2,]}'))
+
+    def test_agents_repair_without_llm_retry(self):
+        """Test broken agent outputs are repaired without asking the model again."""
+        llm = MalformedOutputModel(calls=[])
+        graph = create_project_planning_graph(llm, use_structured_output=False)
+        final_state = list(
+            run_project_planning_graph(
+                graph, "Bakery website", recursion_limit=30, print_results=False
+            )
+        )[-1]
+
+        self.assertEqual(final_state["backward"], AgentRoute.PMAdapterAgent)
+        self.assertIsNotNone(final_state[AgentRoute.TimelineAgent])
+        # The reformatting prompt names no agent
+        self.assertNotIn("", llm.calls)
+
+    def test_parsed_answers_are_not_repaired(self):
+        """Test answers the parser accepts are kept, even if not well formed."""
+        text = '{"a": {"b": 1}, "c": [1, 2,]}\nUse {"d": 2} as a template.'
+        expected = base_agent.extract_structured_data(text)
+        self.assertNotIn("error", expected)
+        self.assertFalse(is_well_formed(text))
+
+        agent = TimelineAgent(FakeAgentChatModel(calls=[]))
+        with mock.patch.object(base_agent.json_repairer, "repair") as repair:
+            self.assertEqual(agent._extract_or_repair(text), expected)
+        repair.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()